@@ -191,14 +191,16 @@ class FeedbackWorker(ProcessWorker):
     def consume(self, data):
         data = np.array(data, dtype=np.float64).T
         data = data[self.ch_ind]
-        p_labels = model_predict(data, srate=self.srate, model=self.estimator)
+        with self.latency.timer("predict"):
+            p_labels = model_predict(data, srate=self.srate, model=self.estimator)
         p_labels = int(p_labels)
         p_labels = p_labels + 1
         p_labels = [p_labels]
         # p_labels = p_labels.tolist()
         print(p_labels)
         if self.outlet.have_consumers():
-            self.outlet.push_sample(p_labels)
+            with self.latency.timer("feedback"):
+                self.outlet.push_sample(p_labels)
 
     def post(self):
         pass
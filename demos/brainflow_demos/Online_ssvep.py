@@ -4,6 +4,7 @@ SSAVEP Feedback on NeuroScan.
 
 """
 import time
+import inspect
 import numpy as np
 
 import mne
@@ -11,6 +12,7 @@ from mne.filter import resample
 from pylsl import StreamInfo, StreamOutlet
 from metabci.brainflow.amplifiers import NeuroScan, Marker
 from metabci.brainflow.workers import ProcessWorker
+from metabci.brainflow.model_cache import ModelCache
 from metabci.brainda.algorithms.decomposition.base import (
     generate_filterbank, generate_cca_references)
 from metabci.brainda.algorithms.utils.model_selection import (
@@ -130,7 +132,7 @@ class FeedbackWorker(ProcessWorker):
         self.lsl_source_id = lsl_source_id
         super().__init__(timeout=timeout, name=worker_name)
 
-    def pre(self):
+    def fit(self):
         X, y, ch_ind = read_data(run_files=self.run_files,
                                  chs=self.pick_chs,
                                  interval=self.stim_interval,
@@ -138,9 +140,19 @@ class FeedbackWorker(ProcessWorker):
         print("Loding train data successfully")
         # Compute offline acc
         acc = offline_validation(X, y, srate=self.srate)
-        print("Current Model accuracy:{:.2f}".format(acc))
-        self.estimator = train_model(X, y, srate=self.srate)
-        self.ch_ind = ch_ind
+        estimator = train_model(X, y, srate=self.srate)
+        return {'estimator': estimator, 'ch_ind': ch_ind, 'acc': acc}
+
+    def pre(self):
+        # The fitted model is reused until the training files, the paradigm
+        # or the model code in train_model() change
+        params = dict(chs=self.pick_chs, interval=self.stim_interval,
+                      labels=self.stim_labels, srate=self.srate,
+                      model=inspect.getsource(train_model))
+        artifact = ModelCache().get_or_fit(self.run_files, params, self.fit)
+        print("Current Model accuracy:{:.2f}".format(artifact['acc']))
+        self.estimator = artifact['estimator']
+        self.ch_ind = artifact['ch_ind']
 
         info = StreamInfo(
             name='meta_feedback',
@@ -159,13 +171,15 @@ class FeedbackWorker(ProcessWorker):
     def consume(self, data):
         data = np.array(data, dtype=np.float64).T
         data = data[self.ch_ind]
-        p_labels = model_predict(data, srate=self.srate, model=self.estimator)
+        with self.latency.timer("predict"):
+            p_labels = model_predict(data, srate=self.srate, model=self.estimator)
         p_labels = np.array([int(p_labels + 1)])
         # p_labels = p_labels.tolist()
         p_labels = list(p_labels)
         print('predict_id_paradigm', p_labels)
         if self.outlet.have_consumers():
-            self.outlet.push_sample(p_labels)
+            with self.latency.timer("feedback"):
+                self.outlet.push_sample(p_labels)
 
     def post(self):
         pass
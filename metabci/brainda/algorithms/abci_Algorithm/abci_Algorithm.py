@@ -3,20 +3,23 @@ from PyQt5.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QHBoxLayout
                              QPushButton, QLabel, QFileDialog, QWidget, QMessageBox,
                              QProgressBar)
 from PyQt5.QtCore import Qt, QThread, pyqtSignal
-import mne
-from scipy.signal import butter, filtfilt, hilbert
-import csv
+from scipy.signal import filtfilt, hilbert
 import numpy as np
 import pandas as pd
-from joblib import load, dump
 import os
 
+from metabci.brainda.algorithms.abci_Algorithm.pli import (
+    design_band_filters, phase_lag_index)
+from metabci.brainda.algorithms.abci_Algorithm.capture_io import load_capture
+from metabci.brainda.algorithms.abci_Algorithm.scoring import PLIScorer, si_features
+
 
 class AnalysisThread(QThread):
     """后台分析线程"""
     finished = pyqtSignal(float)
     error = pyqtSignal(str)
     progress = pyqtSignal(int)
+    _scorer = None  # 模型在所有分析线程间共享
 
     def __init__(self, input_file):
         super().__init__()
@@ -27,196 +30,38 @@ class AnalysisThread(QThread):
             # 执行PLI分析流程
             self.progress.emit(10)
 
-            # 临时文件路径
-            temp_dir = os.path.join(os.path.dirname(self.input_file), "temp")
-            os.makedirs(temp_dir, exist_ok=True)
-            test_file = os.path.join(temp_dir, "temp_feature.csv")
-
-            # 执行PLI分析
-            result = self.PLI_main_SI(self.input_file, test_file)
-            result.to_csv(test_file, index=False, header=False)
+            # 执行PLI分析 (特征直接在内存中传递, 不再写临时文件)
+            eeg, stimulus_indices = load_capture(self.input_file)
+            feature_vector = si_features(eeg, stimulus_indices)
             self.progress.emit(50)
 
-            # 加载模型和预测
-            ranking_file = r"D:\MetaBCI-master\metabci\brainda\algorithms\abci_Algorithm\SI_PCC_pli_zyx_title_tt_feature_ranking.csv" #需要绝对路径引用
-            model_path = 'linear_regression_model.joblib'
-            scaler_path = 'x_scaler.joblib'
-
-            # 1. 读取特征排序文件
-            with open(ranking_file, 'r') as f:
-                reader = csv.reader(f)
-                sorted_data = list(reader)
-
-            # 确保数据是2行
-            if len(sorted_data) != 2:
-                sorted_data = list(map(list, zip(*sorted_data)))
-
-            # 提取前495个特征索引
-            feature_indices = [int(idx) - 1 for idx in sorted_data[1][:495]]
-            self.progress.emit(70)
-
-            # 2. 加载模型和标准化器
-            loaded_model = load(model_path)
-            x_scaler = load(scaler_path)
+            # 加载模型、标准化器和前495个特征索引 (仅首次分析时加载)
+            if AnalysisThread._scorer is None:
+                AnalysisThread._scorer = PLIScorer()
             self.progress.emit(80)
 
-            # 3. 读取测试数据
-            with open(test_file, 'r') as f:
-                reader = csv.reader(f)
-                feature_data = list(reader)
-
-            if len(feature_data) != 1:
-                raise ValueError(f"测试数据应包含1行，但实际读取了{len(feature_data)}行")
-
-            # 4. 处理并预测
-            feature_vector = np.array([float(x) for x in feature_data[0]], dtype=np.float32)
-            selected_features = feature_vector[feature_indices]
-            selected_features_norm = x_scaler.transform(selected_features.reshape(1, -1))
-            Y_pred_norm = loaded_model.predict(selected_features_norm)
+            # 处理并预测
+            score = AnalysisThread._scorer.predict(feature_vector)[0]
             self.progress.emit(100)
 
             # 返回预测结果
-            self.finished.emit(Y_pred_norm[0, 0])
+            self.finished.emit(float(score))
 
         except Exception as e:
             self.error.emit(str(e))
 
     # 以下是原代码中的所有分析函数
-    def PLI_main_SI(self, input_file, output_file):
+    def PLI_main_SI(self, input_file, output_file=None):
         print(f'开始处理文件: {input_file}')
-
-        # 读取CSV文件
-        df = pd.read_table(input_file, encoding="GB2312", header=None, engine="python")
-        data1 = df[0].str.split(',', expand=True).iloc[3:, :].reset_index(drop=True)
-        data = pd.DataFrame(data1.iloc[:, 1:9].T)  # B-I列 (8通道)
-        markers = pd.Series(data1.iloc[:, 10])  # J列 (标记列)
-
-        # 检查标记点数量
-        topic_indices = markers.index[markers.iloc[:].str.contains('Stimulus')].tolist()
-        if len(topic_indices) != 40:
-            raise ValueError(f'标记点数量必须为40，当前数量: {len(topic_indices)}')
-
-        # 创建原始对象
-        ch_names = ['Fp1', 'Fpz', 'Fp2', 'AF8', 'AF7', 'AF3', 'AFZ', 'AF4']
-        sfreq = 250
-        info = mne.create_info(ch_names=ch_names, sfreq=sfreq, ch_types='eeg')
-        raw = mne.io.RawArray(data, info)
-        static_raw_cropped_resampled = raw.copy()
-
-        # 添加事件标记
-        events = np.zeros((40, 3), dtype=int)
-        for i, idx in enumerate(topic_indices):
-            events[i, :] = [idx, 0, i + 1]  # [样本索引, 持续时长, 事件ID]
-        events_rask = events.copy()
-        event_dict = {f'topic{i + 1}': i + 1 for i in range(40)}
-
-        # 信号预处理
-        static_raw_cropped_resampled.crop(tmin=10)  # 移除前10秒
-        static_raw_cropped_resampled = static_raw_cropped_resampled.resample(125)  # 重采样到125Hz
-        static_raw_cropped_resampled.filter(4, 30)  # 带通滤波4-30Hz
-
-        # 计算全局平均值并校正
-        global_baseline = static_raw_cropped_resampled.get_data().mean(axis=1, keepdims=True)
-        corrected_data = static_raw_cropped_resampled.get_data() - global_baseline
-        static_raw_cropped_resampled._data = corrected_data
-
-        # 提取静息态数据 (前20秒)
-        raw_static = static_raw_cropped_resampled.copy().crop(tmin=0, tmax=20)
-        static_data = raw_static.get_data()
-
-        # 静息态分段计算特征
-        segment_length = 5 * 125  # 5秒数据
-        static_features = []
-        for seg in range(4):
-            start_idx = seg * segment_length
-            end_idx = (seg + 1) * segment_length
-            seg_data = static_data[:, start_idx:end_idx]
-
-            # 计算各频段PLI
-            bands = [
-                self.wave_filter(seg_data, 4, 8, 125),  # Theta
-                self.wave_filter(seg_data, 8, 10, 125),  # Alpha1
-                self.wave_filter(seg_data, 10, 13, 125),  # Alpha2
-                self.wave_filter(seg_data, 13, 20, 125),  # Beta1
-                self.wave_filter(seg_data, 20, 30, 125)  # Beta2
-            ]
-
-            band_features = [self.PLI_cal(band) for band in bands]
-            net_feature = self.extract_pli_features(band_features)
-            static_features.append(net_feature)
-
-        mean_static = np.mean(static_features, axis=0)
-
-        # 处理任务态数据
-        raw_data = raw.get_data()
-        cropped_data = raw_data[:, events_rask[0, 0]:]
-        events_rask[:, 0] = events_rask[:, 0] - events_rask[0, 0]
-        events_rask[:, 0] = events_rask[:, 0] / 2
-
-        raw_cropped = mne.io.RawArray(cropped_data, info)
-        raw_cropped.resample(125)  # 重采样到125Hz
-        raw_cropped.filter(4, 30)  # 带通滤波4-30Hz
-
-        # 基线校正
-        corrected_data = raw_cropped.get_data() - global_baseline
-        raw_cropped._data = corrected_data
-
-        # 提取任务态数据
-        epochs = mne.Epochs(raw_cropped, events_rask, event_id=event_dict,
-                            tmin=0, tmax=5, baseline=None, preload=True)
-        if len(epochs) != 40:
-            raise ValueError(f'任务态分段数量异常: 预期40段，实际{len(epochs)}')
-
-        # 计算任务态特征
-        title_features = []
-        for i in range(40):
-            epoch_data = epochs[i].get_data()[0]  # 获取单次试验数据
-
-            # 计算各频段PLI
-            bands = [
-                self.wave_filter(epoch_data, 4, 8, 125),  # Theta
-                self.wave_filter(epoch_data, 8, 10, 125),  # Alpha1
-                self.wave_filter(epoch_data, 10, 13, 125),  # Alpha2
-                self.wave_filter(epoch_data, 13, 20, 125),  # Beta1
-                self.wave_filter(epoch_data, 20, 30, 125)  # Beta2
-            ]
-
-            band_features = [self.PLI_cal(band) for band in bands]
-            net_feature = self.extract_pli_features(band_features)
-            title_features.append(net_feature - mean_static)
-
-        # 计算时间差分特征
-        title_features = np.array(title_features)
-        time_diff_features = np.diff(title_features, axis=0)
-
-        # 合并特征向量
-        final_feature = np.hstack([
-            title_features.flatten(),
-            time_diff_features.flatten()
-        ])
-
-        return pd.DataFrame([final_feature])
+        eeg, stimulus_indices = load_capture(input_file)
+        return pd.DataFrame([si_features(eeg, stimulus_indices)])
 
     def wave_filter(self, data, low, high, sfreq, order=4):
-        nyq = 0.5 * sfreq
-        low_norm = low / nyq
-        high_norm = high / nyq
-        b, a = butter(order, [low_norm, high_norm], btype='band')[:2]
+        (b, a), = design_band_filters([(low, high)], sfreq, order)
         return filtfilt(b, a, data)
 
     def PLI_cal(self, data):
-        n_channels = data.shape[0]
-        phase_signal = np.angle(hilbert(data))
-        pli = np.zeros((n_channels, n_channels))
-
-        for i in range(n_channels):
-            for j in range(i + 1, n_channels):
-                phase_diff = np.sin(phase_signal[i] - phase_signal[j])
-                pli[i, j] = np.abs(np.mean(np.sign(phase_diff)))
-
-        # 使矩阵对称
-        pli += pli.T
-        return pli
+        return phase_lag_index(np.angle(hilbert(data)))
 
     def extract_pli_features(self, band_features):
         n_bands = len(band_features)
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+# License: MIT License
+"""
+Readers for recordings written by brainflow.abci_capture.
+
+A capture CSV holds one header line and one row per sample with the columns
+sample index, 8 EEG channels (uV), timestamp and event marker. The EEG block
+is parsed with the pandas C parser straight into float32, and the parsed
+recording can be cached in a binary .npz sidecar so that later analyses of
+the same file skip text parsing entirely.
+"""
+import os
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+from numpy import ndarray
+
+N_EEG_CHANNELS = 8
+EEG_COLUMNS = list(range(1, N_EEG_CHANNELS + 1))
+MARKER_COLUMN = N_EEG_CHANNELS + 2
+# header line plus the first two samples, as in the original analysis
+SKIP_ROWS = 3
+SIDECAR_SUFFIX = ".npz"
+
+
+def read_capture_csv(
+    filename: str, skiprows: int = SKIP_ROWS, dtype=np.float32
+) -> Tuple[ndarray, ndarray]:
+    """Parse a capture CSV file.
+
+    Parameters
+    ----------
+    filename : str
+        CSV file written by brainflow.abci_capture.
+    skiprows : int
+        Number of leading lines to drop, by default 3.
+    dtype : data-type
+        Data type of the EEG array, by default float32.
+
+    Returns
+    -------
+    eeg : ndarray, shape(n_channels, n_samples)
+        EEG data in microvolts.
+    stimulus_indices : ndarray, shape(n_markers,)
+        Sample indices of the Stimulus_* markers.
+    """
+    df = pd.read_csv(
+        filename,
+        header=None,
+        skiprows=skiprows,
+        usecols=EEG_COLUMNS + [MARKER_COLUMN],
+        dtype={**{i: dtype for i in EEG_COLUMNS}, MARKER_COLUMN: str},
+        encoding="GB2312",
+        engine="c",
+        na_filter=True,
+    )
+    eeg = np.ascontiguousarray(df[EEG_COLUMNS].to_numpy(dtype=dtype).T)
+    markers = df[MARKER_COLUMN]
+    stimulus_indices = np.flatnonzero(
+        markers.str.contains("Stimulus", regex=False, na=False).to_numpy())
+    return eeg, stimulus_indices
+
+
+def sidecar_path(filename: str) -> str:
+    """Path of the binary sidecar of a capture CSV file."""
+    return filename + SIDECAR_SUFFIX
+
+
+def save_capture(filename: str, eeg: ndarray, stimulus_indices: ndarray, source: str = ""):
+    """Save a parsed recording as an uncompressed .npz file.
+
+    Parameters
+    ----------
+    filename : str
+        Output file.
+    eeg : ndarray, shape(n_channels, n_samples)
+        EEG data.
+    stimulus_indices : ndarray, shape(n_markers,)
+        Sample indices of the stimulus markers.
+    source : str
+        CSV file the recording was parsed from; its size and modification
+        time are stored so that a stale sidecar can be detected.
+    """
+    stat = os.stat(source) if source else None
+    with open(filename, "wb") as f:
+        np.savez(
+            f,
+            eeg=eeg,
+            stimulus_indices=np.asarray(stimulus_indices, dtype=np.int64),
+            source_size=stat.st_size if stat else -1,
+            source_mtime=stat.st_mtime_ns if stat else -1,
+        )
+
+
+def _is_fresh(sidecar, source: str) -> bool:
+    stat = os.stat(source)
+    return (int(sidecar["source_size"]) == stat.st_size
+            and int(sidecar["source_mtime"]) == stat.st_mtime_ns)
+
+
+def load_capture(filename: str, cache: bool = True) -> Tuple[ndarray, ndarray]:
+    """Load a capture recording, using the binary sidecar when possible.
+
+    Parameters
+    ----------
+    filename : str
+        Capture CSV file, or a .npz file written by save_capture.
+    cache : bool
+        If True, reuse an up-to-date sidecar next to the CSV file and write
+        one after parsing, by default True.
+
+    Returns
+    -------
+    eeg : ndarray, shape(n_channels, n_samples)
+        EEG data in microvolts, float32.
+    stimulus_indices : ndarray, shape(n_markers,)
+        Sample indices of the Stimulus_* markers.
+    """
+    if filename.endswith(SIDECAR_SUFFIX):
+        with np.load(filename) as sidecar:
+            return sidecar["eeg"], sidecar["stimulus_indices"]
+
+    sidecar_file = sidecar_path(filename)
+    if cache and os.path.exists(sidecar_file):
+        try:
+            with np.load(sidecar_file) as sidecar:
+                if _is_fresh(sidecar, filename):
+                    return sidecar["eeg"], sidecar["stimulus_indices"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    eeg, stimulus_indices = read_capture_csv(filename)
+    if cache:
+        try:
+            save_capture(sidecar_file, eeg, stimulus_indices, source=filename)
+        except OSError:
+            # read-only data directories are fine, just skip the cache
+            pass
+    return eeg, stimulus_indices
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+# License: MIT License
+"""
+Phase lag index (PLI) features for the ABCI suicidal-ideation pipeline.
+
+All functions operate on whole batches of epochs: band-pass coefficients are
+designed once per (bands, srate, order), the Hilbert phase is computed once
+per band, and every channel pair is evaluated in a single broadcast.
+"""
+from functools import lru_cache
+from typing import Sequence, Tuple
+
+import numpy as np
+from numpy import ndarray
+from scipy.signal import butter, filtfilt, hilbert
+
+# Theta, Alpha1, Alpha2, Beta1, Beta2
+PLI_BANDS: Tuple[Tuple[float, float], ...] = (
+    (4, 8),
+    (8, 10),
+    (10, 13),
+    (13, 20),
+    (20, 30),
+)
+
+
+@lru_cache(maxsize=None)
+def _design_band_filters(
+    bands: Tuple[Tuple[float, float], ...], srate: float, order: int
+) -> Tuple[Tuple[ndarray, ndarray], ...]:
+    nyq = 0.5 * srate
+    return tuple(
+        tuple(butter(order, [low / nyq, high / nyq], btype="band")[:2])
+        for low, high in bands
+    )
+
+
+def design_band_filters(
+    bands: Sequence[Tuple[float, float]] = PLI_BANDS,
+    srate: float = 125,
+    order: int = 4,
+) -> Tuple[Tuple[ndarray, ndarray], ...]:
+    """Butterworth band-pass coefficients for each band.
+
+    The coefficients are cached, so repeated calls with the same arguments
+    return the same arrays without redesigning the filters.
+
+    Parameters
+    ----------
+    bands : sequence of (float, float)
+        Pass bands in Hz, by default PLI_BANDS.
+    srate : float
+        Sampling rate in Hz, by default 125.
+    order : int
+        Butterworth order, by default 4.
+
+    Returns
+    -------
+    filters : tuple of (b, a)
+        Filter coefficients, one pair per band.
+    """
+    bands = tuple((float(low), float(high)) for low, high in bands)
+    return _design_band_filters(bands, float(srate), int(order))
+
+
+def band_phases(X: ndarray, filters: Sequence[Tuple[ndarray, ndarray]]) -> ndarray:
+    """Instantaneous phase of each band-passed signal.
+
+    Parameters
+    ----------
+    X : ndarray, shape(n_epochs, n_channels, n_samples)
+        Input signal.
+    filters : sequence of (b, a)
+        Band-pass coefficients from design_band_filters.
+
+    Returns
+    -------
+    phases : ndarray, shape(n_epochs, n_bands, n_channels, n_samples)
+        Hilbert phase of every band.
+    """
+    X = np.asarray(X)
+    phases = np.empty(
+        (X.shape[0], len(filters), *X.shape[1:]), dtype=np.float64
+    )
+    for i, (b, a) in enumerate(filters):
+        phases[:, i] = np.angle(hilbert(filtfilt(b, a, X, axis=-1), axis=-1))
+    return phases
+
+
+def pli_pairs(phases: ndarray) -> ndarray:
+    """PLI of every channel pair in the upper triangle.
+
+    Parameters
+    ----------
+    phases : ndarray, shape(..., n_channels, n_samples)
+        Instantaneous phases.
+
+    Returns
+    -------
+    pli : ndarray, shape(..., n_pairs)
+        PLI of each pair (i, j), i < j, ordered as np.triu_indices(n_channels, k=1).
+    """
+    rows, cols = np.triu_indices(phases.shape[-2], k=1)
+    diff = np.sin(phases[..., rows, :] - phases[..., cols, :])
+    return np.abs(np.mean(np.sign(diff), axis=-1))
+
+
+def phase_lag_index(phases: ndarray) -> ndarray:
+    """Symmetric PLI matrices.
+
+    Parameters
+    ----------
+    phases : ndarray, shape(..., n_channels, n_samples)
+        Instantaneous phases.
+
+    Returns
+    -------
+    pli : ndarray, shape(..., n_channels, n_channels)
+        PLI matrices with zero diagonal.
+    """
+    n_channels = phases.shape[-2]
+    rows, cols = np.triu_indices(n_channels, k=1)
+    pli = np.zeros((*phases.shape[:-2], n_channels, n_channels))
+    values = pli_pairs(phases)
+    pli[..., rows, cols] = values
+    pli[..., cols, rows] = values
+    return pli
+
+
+def pli_features(
+    X: ndarray,
+    srate: float = 125,
+    bands: Sequence[Tuple[float, float]] = PLI_BANDS,
+    order: int = 4,
+) -> ndarray:
+    """Band-wise PLI network features of a batch of epochs.
+
+    Parameters
+    ----------
+    X : ndarray, shape(n_epochs, n_channels, n_samples)
+        Input signal.
+    srate : float
+        Sampling rate in Hz, by default 125.
+    bands : sequence of (float, float)
+        Pass bands in Hz, by default PLI_BANDS.
+    order : int
+        Butterworth order, by default 4.
+
+    Returns
+    -------
+    feat : ndarray, shape(n_epochs, n_bands * n_pairs)
+        Upper-triangle PLI values, band-major.
+    """
+    X = np.asarray(X)
+    if X.ndim == 2:
+        X = X[np.newaxis]
+    phases = band_phases(X, design_band_filters(bands, srate, order))
+    return pli_pairs(phases).reshape(X.shape[0], -1)
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+# License: MIT License
+"""
+Headless scoring of ABCI recordings with the PLI suicidal-ideation model.
+
+The model, scaler and ranked feature indices are loaded once per process and
+recordings are scored without any temporary files, either one by one with
+PLIScorer or as a cohort with score_recordings. The module is also a
+command-line entry point::
+
+    python -m metabci.brainda.algorithms.abci_Algorithm.scoring data/ -o scores.csv -j 8
+"""
+import argparse
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+
+import mne
+import numpy as np
+import pandas as pd
+from joblib import load
+from numpy import ndarray
+
+from .capture_io import load_capture
+from .pli import pli_features
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.path.join(_HERE, "linear_regression_model.joblib")
+SCALER_PATH = os.path.join(_HERE, "x_scaler.joblib")
+RANKING_FILE = os.path.join(_HERE, "SI_PCC_pli_zyx_title_tt_feature_ranking.csv")
+
+CH_NAMES = ['Fp1', 'Fpz', 'Fp2', 'AF8', 'AF7', 'AF3', 'AFZ', 'AF4']
+SRATE = 250
+N_TOPICS = 40
+N_FEATURES = 495
+
+
+def si_features(eeg: ndarray, stimulus_indices: ndarray, srate: float = SRATE) -> ndarray:
+    """PLI feature vector of one recording.
+
+    The first 10 s are dropped, the next 20 s of rest give the baseline PLI
+    network (4 x 5 s segments) and each of the 40 task epochs (0-5 s after a
+    stimulus marker) is expressed relative to it. The feature vector holds
+    the task features followed by their epoch-to-epoch differences.
+
+    Parameters
+    ----------
+    eeg : ndarray, shape(n_channels, n_samples)
+        EEG data.
+    stimulus_indices : ndarray, shape(n_topics,)
+        Sample indices of the 40 stimulus onsets.
+    srate : float
+        Sampling rate of eeg, by default 250.
+
+    Returns
+    -------
+    feat : ndarray, shape(n_topics * n_pli + (n_topics - 1) * n_pli,)
+        Feature vector.
+
+    Raises
+    ------
+    ValueError
+        If the number of stimulus markers or task epochs is not 40.
+    """
+    stimulus_indices = np.asarray(stimulus_indices, dtype=int)
+    if len(stimulus_indices) != N_TOPICS:
+        raise ValueError(
+            "expected {} stimulus markers, got {}".format(N_TOPICS, len(stimulus_indices)))
+
+    info = mne.create_info(ch_names=CH_NAMES, sfreq=srate, ch_types='eeg')
+    raw = mne.io.RawArray(eeg, info, verbose=False)
+
+    # rest: drop the first 10 s, resample to 125 Hz and band-pass 4-30 Hz
+    static_raw = raw.copy().crop(tmin=10)
+    static_raw.resample(125, verbose=False)
+    static_raw.filter(4, 30, verbose=False)
+    global_baseline = static_raw.get_data().mean(axis=1, keepdims=True)
+    static_raw._data = static_raw.get_data() - global_baseline
+    static_data = static_raw.crop(tmin=0, tmax=20).get_data()
+
+    segment_length = 5 * 125
+    segments = static_data[:, :4 * segment_length].reshape(
+        len(CH_NAMES), 4, segment_length).transpose(1, 0, 2)
+    mean_static = np.mean(pli_features(segments, 125), axis=0)
+
+    # task: epochs of 0-5 s after each stimulus onset
+    events = np.zeros((N_TOPICS, 3), dtype=int)
+    events[:, 0] = (stimulus_indices - stimulus_indices[0]) // 2
+    events[:, 2] = np.arange(1, N_TOPICS + 1)
+    event_dict = {'topic{}'.format(i + 1): i + 1 for i in range(N_TOPICS)}
+
+    raw_task = mne.io.RawArray(raw.get_data()[:, stimulus_indices[0]:], info, verbose=False)
+    raw_task.resample(125, verbose=False)
+    raw_task.filter(4, 30, verbose=False)
+    raw_task._data = raw_task.get_data() - global_baseline
+    epochs = mne.Epochs(raw_task, events, event_id=event_dict,
+                        tmin=0, tmax=5, baseline=None, preload=True, verbose=False)
+    if len(epochs) != N_TOPICS:
+        raise ValueError(
+            "expected {} task epochs, got {}".format(N_TOPICS, len(epochs)))
+
+    title_features = pli_features(epochs.get_data(), 125) - mean_static
+    time_diff_features = np.diff(title_features, axis=0)
+    return np.hstack([title_features.flatten(), time_diff_features.flatten()])
+
+
+def load_feature_indices(ranking_file: str = RANKING_FILE, n_features: int = N_FEATURES) -> ndarray:
+    """Zero-based indices of the top ranked features.
+
+    Parameters
+    ----------
+    ranking_file : str
+        Two-row CSV file, the second row holds one-based feature indices in
+        ranking order.
+    n_features : int
+        Number of features to keep, by default 495.
+
+    Returns
+    -------
+    indices : ndarray, shape(n_features,)
+    """
+    with open(ranking_file, 'r') as f:
+        sorted_data = list(csv.reader(f))
+    if len(sorted_data) != 2:
+        sorted_data = list(map(list, zip(*sorted_data)))
+    return np.array([int(idx) - 1 for idx in sorted_data[1][:n_features]])
+
+
+class PLIScorer:
+    """Suicidal-ideation score from PLI features.
+
+    Parameters
+    ----------
+    model_path : str
+        Fitted regression model saved with joblib.
+    scaler_path : str
+        Fitted feature scaler saved with joblib.
+    ranking_file : str
+        Feature ranking file, see load_feature_indices.
+    n_features : int
+        Number of ranked features fed to the model, by default 495.
+    """
+
+    def __init__(
+        self,
+        model_path: str = MODEL_PATH,
+        scaler_path: str = SCALER_PATH,
+        ranking_file: str = RANKING_FILE,
+        n_features: int = N_FEATURES,
+    ):
+        self.model = load(model_path)
+        self.scaler = load(scaler_path)
+        self.feature_indices = load_feature_indices(ranking_file, n_features)
+
+    def predict(self, features: ndarray) -> ndarray:
+        """Scores of one or several feature vectors.
+
+        Parameters
+        ----------
+        features : ndarray, shape(n_features_total,) or (n_recordings, n_features_total)
+            Output of si_features.
+
+        Returns
+        -------
+        scores : ndarray, shape(n_recordings,)
+        """
+        features = np.atleast_2d(np.asarray(features, dtype=np.float32))
+        selected = self.scaler.transform(features[:, self.feature_indices])
+        return np.ravel(self.model.predict(selected))
+
+    def score_file(self, filename: str, cache: bool = True) -> Dict[str, Union[str, float]]:
+        """Score one recording.
+
+        Parameters
+        ----------
+        filename : str
+            Capture CSV file or its binary sidecar.
+        cache : bool
+            Whether to use and write the binary sidecar, see load_capture.
+
+        Returns
+        -------
+        result : dict
+            file, score and the wall time in seconds of each stage
+            (t_read, t_features, t_predict, t_total).
+        """
+        t0 = time.perf_counter()
+        eeg, stimulus_indices = load_capture(filename, cache=cache)
+        t1 = time.perf_counter()
+        features = si_features(eeg, stimulus_indices)
+        t2 = time.perf_counter()
+        score = float(self.predict(features)[0])
+        t3 = time.perf_counter()
+        return {
+            'file': filename,
+            'score': score,
+            't_read': t1 - t0,
+            't_features': t2 - t1,
+            't_predict': t3 - t2,
+            't_total': t3 - t0,
+        }
+
+
+_worker_scorer: Optional[PLIScorer] = None
+_worker_cache = True
+
+
+def _init_worker(scorer_kwargs, cache=True):
+    global _worker_scorer, _worker_cache
+    _worker_scorer = PLIScorer(**scorer_kwargs)
+    _worker_cache = cache
+
+
+def _score_one(filename):
+    try:
+        result = _worker_scorer.score_file(filename, cache=_worker_cache)  # type: ignore[union-attr]
+        result['error'] = ''
+    except Exception as e:
+        result = {'file': filename, 'score': np.nan, 'error': str(e)}
+    return result
+
+
+def find_recordings(inputs: Iterable[str], pattern: str = '.csv') -> List[str]:
+    """Expand files and directories into a sorted list of recordings.
+
+    Parameters
+    ----------
+    inputs : iterable of str
+        Files or directories; directories are searched recursively.
+    pattern : str
+        File suffix of recordings inside directories, by default '.csv'.
+
+    Returns
+    -------
+    filenames : list of str
+    """
+    filenames: List[str] = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                filenames.extend(
+                    os.path.join(root, f) for f in files if f.lower().endswith(pattern))
+        else:
+            filenames.append(path)
+    return sorted(filenames)
+
+
+def score_recordings(
+    filenames: Sequence[str], n_jobs: Optional[int] = None, cache: bool = True, **scorer_kwargs
+) -> pd.DataFrame:
+    """Score a cohort of recordings across a process pool.
+
+    Each worker process loads the model once. A recording that fails is
+    reported in the error column instead of aborting the cohort.
+
+    Parameters
+    ----------
+    filenames : sequence of str
+        Capture CSV files.
+    n_jobs : int, optional
+        Number of worker processes, None uses all CPUs and 1 scores in the
+        calling process.
+    cache : bool
+        Whether to use and write binary sidecars of the recordings, by
+        default True.
+    **scorer_kwargs
+        Passed to PLIScorer.
+
+    Returns
+    -------
+    results : DataFrame
+        One row per recording with file, score, stage timings and error.
+    """
+    columns = ['file', 'score', 't_read', 't_features', 't_predict', 't_total', 'error']
+    if n_jobs == 1:
+        _init_worker(scorer_kwargs, cache)
+        results = [_score_one(f) for f in filenames]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker,
+                                 initargs=(scorer_kwargs, cache)) as executor:
+            results = list(executor.map(_score_one, filenames))
+    return pd.DataFrame(results, columns=columns)
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Score ABCI recordings with the PLI suicidal-ideation model.")
+    parser.add_argument('inputs', nargs='+', help="capture CSV files or directories")
+    parser.add_argument('-o', '--output', default=None,
+                        help="results CSV file, printed to stdout if omitted")
+    parser.add_argument('-j', '--n-jobs', type=int, default=None,
+                        help="number of worker processes, default all CPUs")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="do not read or write binary sidecars of the recordings")
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--scaler', default=SCALER_PATH)
+    parser.add_argument('--ranking', default=RANKING_FILE)
+    args = parser.parse_args(argv)
+
+    filenames = find_recordings(args.inputs)
+    results = score_recordings(
+        filenames, n_jobs=args.n_jobs, cache=not args.no_cache, model_path=args.model,
+        scaler_path=args.scaler, ranking_file=args.ranking)
+    if args.output:
+        results.to_csv(args.output, index=False)
+    else:
+        print(results.to_string(index=False))
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -5,13 +5,19 @@
 # License: MIT License
 
 
-from typing import Optional, List, Tuple, Union
+from typing import Dict, Optional, List, Tuple, Union
+from collections import OrderedDict
+import hashlib
+import os
+import tempfile
+import threading
 import warnings
 import numpy as np
 from numpy import ndarray
 from scipy.linalg import solve
 from scipy.signal import sosfiltfilt, cheby1, cheb1ord
 from sklearn.base import BaseEstimator, TransformerMixin, clone
+from joblib import Parallel, delayed
 from metabci.brainda.datasets.base import BaseTimeEncodingDataset
 import mne
 
@@ -52,6 +58,186 @@ def robust_pattern(W : ndarray, Cx: ndarray, Cs: ndarray) -> ndarray:
     return A
 
 
+class FilterBankCache:
+    """
+    Cache of filtered trials shared by the filter-bank estimators.
+
+    Filtered trials are keyed by (trial fingerprint, SOS coefficients, axis). Every trial is filtered
+    independently along the time axis, so a trial seen once, e.g. in the training set of a fold or by
+    another estimator, is fetched from the cache instead of filtered again whatever the array it comes in.
+    Blocks of filtered trials are evicted least recently used first once max_bytes is exceeded; with a
+    cache_dir, evicted blocks are written to .npy files and read back as memmaps instead of dropped.
+
+    The cache is used by FilterBank.filter_band (and transform_filterbank) while it is active, i.e. inside
+    a with block, so it also reaches the estimators cloned by cross-validation. Leaving the with block
+    clears the cache and removes its on-disk blocks; a cache used without a with block is cleaned up with
+    clear().
+
+    The active cache lives in the process that entered the with block: only the sub-band tasks run in
+    threads (the default backend of FilterBank) and the folds run in that process use it. Worker
+    processes, e.g. a FilterBank with backend='loky' or cross_val_score(..., n_jobs=2), see no cache and
+    filter the trials again; FilterBank warns about the former.
+
+    Parameters
+    ----------
+    max_bytes : int
+        Memory budget of the in-memory tier in bytes. The default is 1 GiB.
+    cache_dir : str
+        Folder of the on-disk memmap tier. The default None drops evicted blocks.
+
+    Examples
+    --------
+    >>> with FilterBankCache(max_bytes=4 * 2**30):
+    ...     for estimator in [FBSCCA(...), FBTRCA(...), FBTDCA(...)]:
+    ...         for train_ind, test_ind in folds:
+    ...             estimator.fit(X[train_ind], y[train_ind]).predict(X[test_ind])
+    """
+    _active: List["FilterBankCache"] = []
+
+    def __init__(self, max_bytes: int = 2**30, cache_dir: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self._blocks: "OrderedDict[int, ndarray]" = OrderedDict()
+        self._files: Dict[int, str] = {}
+        self._memmaps: Dict[int, ndarray] = {}
+        self._block_keys: Dict[int, list] = {}
+        self._index: Dict[tuple, Tuple[int, int]] = {}
+        self._n_blocks = 0
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        FilterBankCache._active.append(self)
+        return self
+
+    def __exit__(self, *exc):
+        FilterBankCache._active.remove(self)
+        self.clear()
+        return False
+
+    @classmethod
+    def active(cls) -> Optional["FilterBankCache"]:
+        """The innermost cache entered with a with statement, None if there is none."""
+        return cls._active[-1] if cls._active else None
+
+    @staticmethod
+    def _fingerprint(x: ndarray) -> bytes:
+        h = hashlib.blake2b(digest_size=16)
+        h.update(str((x.dtype.str, x.shape)).encode())
+        h.update(np.ascontiguousarray(x).data)
+        return h.digest()
+
+    def fingerprint_trials(self, X: ndarray) -> List[bytes]:
+        """
+        Fingerprints of the trials of X, to be computed once and passed to filter() for every sub-band.
+
+        Parameters
+        ----------
+        X : ndarray, shape(n_trials, ...)
+            Input signal, the first axis indexes the trials.
+
+        Returns
+        -------
+        trial_keys : list of bytes
+            One digest per trial.
+        """
+        return [self._fingerprint(x) for x in np.asarray(X)]
+
+    def _block(self, block_id: int) -> ndarray:
+        if block_id in self._blocks:
+            self._blocks.move_to_end(block_id)
+            return self._blocks[block_id]
+        return self._memmaps[block_id]
+
+    def _add_block(self, Y: ndarray, keys: list):
+        with self._lock:
+            block_id = self._n_blocks
+            self._n_blocks += 1
+            self._blocks[block_id] = Y
+            self._block_keys[block_id] = keys
+            for row, key in enumerate(keys):
+                self._index[key] = (block_id, row)
+            self.nbytes += Y.nbytes
+            while self.nbytes > self.max_bytes and len(self._blocks) > 1:
+                self._evict()
+
+    def _evict(self):
+        block_id, Y = self._blocks.popitem(last=False)
+        self.nbytes -= Y.nbytes
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, filename = tempfile.mkstemp(dir=self.cache_dir, suffix=".npy")
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, Y)
+            self._files[block_id] = filename
+            self._memmaps[block_id] = np.load(filename, mmap_mode="r")
+        else:
+            for key in self._block_keys.pop(block_id):
+                if self._index.get(key, (None,))[0] == block_id:
+                    del self._index[key]
+
+    def filter(self, sos: ndarray, X: ndarray, axis: int = -1, trial_keys: Optional[List[bytes]] = None) -> ndarray:
+        """
+        sosfiltfilt(sos, X, axis=axis), reusing the trials filtered before.
+
+        Parameters
+        ----------
+        sos : ndarray, shape(n_sections, 6)
+            Filter coefficients.
+        X : ndarray, shape(n_trials, ...)
+            Input signal, the first axis indexes the trials.
+        axis : int
+            Axis to filter along, any axis but the trial axis. The default is -1.
+        trial_keys : list of bytes
+            Output of fingerprint_trials(X), computed here if None.
+
+        Returns
+        -------
+        Y : ndarray, shape(n_trials, ...)
+            Filtered signal.
+        """
+        X = np.asarray(X)
+        sos = np.asarray(sos)
+        axis = axis % X.ndim if X.ndim else 0
+        if X.ndim < 2 or axis == 0:
+            return sosfiltfilt(sos, X, axis=axis)
+        sos_key = self._fingerprint(sos)
+        if trial_keys is None:
+            trial_keys = self.fingerprint_trials(X)
+        keys = [(trial_key, sos_key, axis) for trial_key in trial_keys]
+        Y = np.empty(X.shape, dtype=np.result_type(sos.dtype, X.dtype, np.float64))
+        missing = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                loc = self._index.get(key)
+                if loc is None:
+                    missing.append(i)
+                else:
+                    Y[i] = self._block(loc[0])[loc[1]]
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            Ym = sosfiltfilt(sos, X[missing], axis=axis)
+            Y[missing] = Ym
+            self._add_block(Ym, [keys[i] for i in missing])
+        return Y
+
+    def clear(self):
+        """Forget every cached trial and remove the on-disk blocks."""
+        with self._lock:
+            self._memmaps.clear()
+            for filename in self._files.values():
+                if os.path.exists(filename):
+                    os.remove(filename)
+            self._blocks.clear()
+            self._files.clear()
+            self._block_keys.clear()
+            self._index.clear()
+            self.nbytes = 0
+
+
 class FilterBank(BaseEstimator, TransformerMixin):
     """
     Filter bank decomposition is a bandpass filter array that divides the input signal into
@@ -68,6 +254,14 @@ class FilterBank(BaseEstimator, TransformerMixin):
         A bandpass filter bank used to divide the input signal into multiple subband components.
     n_jobs : int
         Sets the number of CPU working cores. The default is None.
+        Each sub-band is filtered and fitted (or transformed) in its own task, so only
+        n_jobs filtered copies of the data exist at the same time.
+    backend : str
+        joblib backend of the sub-band tasks. The default None picks the backend from the cost of the
+        estimator (the _default_backend class attribute): threads, which share the data without copies,
+        for the estimators built on NumPy/SciPy kernels that release the GIL, and 'loky' (processes)
+        for the estimators dominated by Python-level loops (FBMsetCCA, FBSSCOR). Threads are used
+        while a FilterBankCache is active, since worker processes do not see it.
 
     References
     ----------
@@ -79,10 +273,37 @@ class FilterBank(BaseEstimator, TransformerMixin):
         base_estimator: BaseEstimator,
         filterbank: List[ndarray],
         n_jobs: Optional[int] = None,
+        backend: Optional[str] = None,
     ):
         self.base_estimator = base_estimator
         self.filterbank = filterbank
         self.n_jobs = n_jobs
+        self.backend = backend
+
+    # backend of the sub-band tasks when backend is None
+    _default_backend = "threading"
+
+    def _parallel(self):
+        backend = getattr(self, "backend", None)
+        if backend is None:
+            backend = "threading" if FilterBankCache.active() is not None else self._default_backend
+        elif (backend not in ("threading", "sequential") and self.n_jobs not in (None, 1)
+                and FilterBankCache.active() is not None):
+            warnings.warn(
+                "the active FilterBankCache is not shared with the {} workers, "
+                "use backend='threading' to reuse the filtered trials".format(backend))
+        return Parallel(n_jobs=self.n_jobs, backend=backend)
+
+    def _trial_keys(self, X: ndarray):
+        # trials are fingerprinted once for all sub-bands
+        cache = FilterBankCache.active()
+        return None if cache is None else cache.fingerprint_trials(X)
+
+    def _fit_band(self, est, i: int, X: ndarray, y: Optional[ndarray], kwargs, trial_keys=None):
+        return est.fit(self.filter_band(X, i, trial_keys), y, **kwargs)
+
+    def _transform_band(self, est, i: int, X: ndarray, kwargs, trial_keys=None):
+        return est.transform(self.filter_band(X, i, trial_keys), **kwargs)
 
     def fit(self, X: ndarray, y: Optional[ndarray] = None, **kwargs):
         """
@@ -100,17 +321,13 @@ class FilterBank(BaseEstimator, TransformerMixin):
         Yf : None
             Reference signal (ibid., ignorable).
         """
-        self.estimators_ = [
+        estimators = [
             clone(self.base_estimator) for _ in range(len(self.filterbank))
         ]
-        X = self.transform_filterbank(X)
-        for i, est in enumerate(self.estimators_):
-            est.fit(X[i], y, **kwargs)
-        # def wrapper(est, X, y, kwargs):
-        #     est.fit(X, y, **kwargs)
-        #     return est
-        # self.estimators_ = Parallel(n_jobs=self.n_jobs)(
-        #     delayed(wrapper)(est, X[i], y, kwargs) for i, est in enumerate(self.estimators_))
+        # every task filters its own sub-band, the stacked sub-bands never exist
+        trial_keys = self._trial_keys(X)
+        self.estimators_ = self._parallel()(
+            delayed(self._fit_band)(est, i, X, y, kwargs, trial_keys) for i, est in enumerate(estimators))
         return self
 
     def transform(self, X: ndarray, **kwargs):
@@ -131,16 +348,35 @@ class FilterBank(BaseEstimator, TransformerMixin):
         feat : ndarray, shape(n_trials, n_fre)
             Feature array.
         """
-        X = self.transform_filterbank(X)
-        feat = [est.transform(X[i], **kwargs) for i, est in enumerate(self.estimators_)]
-        # def wrapper(est, X, kwargs):
-        #     retval = est.transform(X, **kwargs)
-        #     return retval
-        # feat = Parallel(n_jobs=self.n_jobs)(
-        #     delayed(wrapper)(est, X[i], kwargs) for i, est in enumerate(self.estimators_))
+        trial_keys = self._trial_keys(X)
+        feat = self._parallel()(
+            delayed(self._transform_band)(est, i, X, kwargs, trial_keys) for i, est in enumerate(self.estimators_))
         feat = np.concatenate(feat, axis=-1)
         return feat
 
+    def filter_band(self, X: ndarray, i: int, trial_keys: Optional[List[bytes]] = None):
+        """
+        The input signal is filtered by one filter of the filter bank.
+
+        Parameters
+        ----------
+        X : ndarray, shape(n_trials, n_channels, n_samples)
+            Input signal.
+        i : int
+            Index of the sub-band.
+        trial_keys : list of bytes
+            Fingerprints of the trials for the active FilterBankCache, see FilterBankCache.fingerprint_trials.
+
+        Returns
+        -------
+        Xi: ndarray, shape(n_trials, n_channels, n_samples)
+            Sub-band component of the input signal, fetched from the active FilterBankCache if any.
+        """
+        cache = FilterBankCache.active()
+        if cache is not None:
+            return cache.filter(self.filterbank[i], X, axis=-1, trial_keys=trial_keys)
+        return sosfiltfilt(self.filterbank[i], X, axis=-1)
+
     def transform_filterbank(self, X: ndarray):
         """
         The input signal is filtered through a filter bank.
@@ -158,7 +394,8 @@ class FilterBank(BaseEstimator, TransformerMixin):
         Xs: ndarray, shape(Nfb, n_trials, n_channels, n_samples)
             Individual subband components of the input signal.
         """
-        Xs = np.stack([sosfiltfilt(sos, X, axis=-1) for sos in self.filterbank])
+        trial_keys = self._trial_keys(X)
+        Xs = np.stack([self.filter_band(X, i, trial_keys) for i in range(len(self.filterbank))])
         return Xs
 
 
@@ -181,6 +418,8 @@ class FilterBankSSVEP(FilterBank):
         Filter weight, default is None.
     n_jobs : int
         Sets the number of CPU working cores. The default is None.
+    backend : str
+        joblib backend of the sub-band tasks, see FilterBank. The default is None (threads).
     """
 
     def __init__(
@@ -189,9 +428,10 @@ class FilterBankSSVEP(FilterBank):
         base_estimator: BaseEstimator,
         filterweights: Optional[ndarray] = None,
         n_jobs: Optional[int] = None,
+        backend: Optional[str] = None,
     ):
         self.filterweights = filterweights
-        super().__init__(base_estimator, filterbank, n_jobs=n_jobs)
+        super().__init__(base_estimator, filterbank, n_jobs=n_jobs, backend=backend)
 
     def transform(self, X: ndarray):  # type: ignore[override]
         """
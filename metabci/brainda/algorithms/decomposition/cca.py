@@ -87,6 +87,173 @@ def _scca_feature(X: ndarray, Yf: ndarray, n_components: int = 1):
     return np.array(rhos)
 
 
+def _reference_bases(Yf: ndarray):
+    """Orthonormal bases of centered reference sets.
+
+    Parameters
+    ----------
+    Yf: ndarray
+        Centered reference signals, shape(n_refs, n_harmonics, n_samples).
+
+    Returns
+    -------
+    Q: ndarray
+        Bases of the row spaces, shape(n_refs, n_samples, n_harmonics).
+    """
+    Q, _ = np.linalg.qr(np.swapaxes(Yf, -1, -2))
+    return Q
+
+
+def _whitener(X: ndarray):
+    """Per-trial transforms W with W^T X of orthonormal rows, rank-deficient directions dropped.
+
+    X: (n_trials, n_channels, n_samples), centered
+    W: (n_trials, n_channels, n_channels)
+    """
+    s, V = np.linalg.eigh(X @ np.swapaxes(X, -1, -2))
+    tol = s[..., -1:] * X.shape[-2] * np.finfo(X.dtype).eps
+    keep = s > tol
+    inv_sqrt = np.where(keep, 1 / np.sqrt(np.where(keep, s, 1)), 0)
+    return V * inv_sqrt[..., np.newaxis, :]
+
+
+def _scca_batch(
+    X: ndarray,
+    Q: ndarray,
+    n_components: int = 1,
+    return_filters: bool = False,
+    batch_size: int = 256,
+):
+    """Canonical correlations of every (trial, reference) pair.
+
+    The canonical correlations are the singular values of the whitened
+    trial projected on a reference basis, a small (n_channels, n_harmonics)
+    matrix per pair, so no n_samples x n_samples projector is formed. The
+    feature equals _scca_feature: with n_components canonical pairs, the
+    correlation of the concatenated variates is the root mean square of
+    the first n_components canonical correlations.
+
+    Parameters
+    ----------
+    X: ndarray
+        Centered EEG data, shape(n_trials, n_channels, n_samples).
+    Q: ndarray
+        Reference bases from _reference_bases, shape(n_refs, n_samples, n_harmonics).
+    n_components: int
+        Number of canonical pairs.
+    return_filters: bool
+        Also return the canonical weights of X, normalized as those of _scca_kernel.
+    batch_size: int
+        Trials processed at once, bounds the memory of the stacked products.
+
+    Returns
+    -------
+    rhos: ndarray
+        Features, shape(n_trials, n_refs).
+    U: ndarray
+        Canonical weights of X, shape(n_trials, n_refs, n_channels, n_components), if return_filters.
+    """
+    n_refs, n_samples, n_harmonics = Q.shape
+    n_channels = X.shape[-2]
+    n_components = min(n_components, n_channels, n_harmonics)
+    # all reference bases side by side, one matrix product per batch
+    Q_all = np.reshape(np.transpose(Q, (1, 0, 2)), (n_samples, -1))
+    rhos = np.empty((len(X), n_refs))
+    U = np.empty((len(X), n_refs, n_channels, n_components)) if return_filters else None
+    for start in range(0, len(X), batch_size):
+        W = _whitener(X[start:start + batch_size])
+        Xw = np.swapaxes(W, -1, -2) @ X[start:start + batch_size]
+        M = np.reshape(Xw @ Q_all, (len(Xw), n_channels, n_refs, n_harmonics))
+        M = np.transpose(M, (0, 2, 1, 3))
+        if U is None:
+            s = np.linalg.svd(M, compute_uv=False)
+        else:
+            P, s, _ = np.linalg.svd(M, full_matrices=False)
+            U[start:start + batch_size] = W[:, np.newaxis] @ P[..., :n_components]
+        rhos[start:start + batch_size] = np.sqrt(np.mean(s[..., :n_components] ** 2, axis=-1))
+    if U is None:
+        return rhos
+    return rhos, U
+
+
+def _corr_rows(A: ndarray, B: ndarray):
+    """Pearson correlation of every row of A with every row of B."""
+    A = A - np.mean(A, axis=-1, keepdims=True)
+    B = B - np.mean(B, axis=-1, keepdims=True)
+    A = A / np.linalg.norm(A, axis=-1, keepdims=True)
+    B = B / np.linalg.norm(B, axis=-1, keepdims=True)
+    return A @ B.T
+
+
+def _template_corr(
+    X: ndarray,
+    templates: ndarray,
+    filters: Optional[ndarray] = None,
+    batch_size: int = 64,
+):
+    """Template matching shared by the correlation-based estimators.
+
+    The feature of trial t and class k is the Pearson correlation of the
+    flattened spatially filtered trial and template, pearsonr(vec(W^T X_t),
+    vec(W^T T_k)), computed for all pairs with a few matrix products.
+
+    Parameters
+    ----------
+    X: ndarray
+        EEG data, shape(n_trials, n_channels, n_samples).
+    templates: ndarray
+        Templates, shape(n_classes, n_channels, n_samples).
+    filters: ndarray
+        Spatial filters W, either None (no filtering), one set for all pairs
+        shape(n_channels, n_filters), one set per class shape(n_classes,
+        n_channels, n_filters) or one set per pair shape(n_trials, n_classes,
+        n_channels, n_filters).
+    batch_size: int
+        Trials processed at once with per-pair filters.
+
+    Returns
+    -------
+    rhos: ndarray
+        Correlations, shape(n_trials, n_classes).
+    """
+    n_trials, n_classes = len(X), len(templates)
+    if filters is None:
+        return _corr_rows(np.reshape(X, (n_trials, -1)), np.reshape(templates, (n_classes, -1)))
+    if filters.ndim == 2:
+        A = np.swapaxes(filters, -1, -2) @ X
+        B = np.swapaxes(filters, -1, -2) @ templates
+        return _corr_rows(np.reshape(A, (n_trials, -1)), np.reshape(B, (n_classes, -1)))
+    if filters.ndim == 4:
+        rhos = np.empty((n_trials, n_classes))
+        for start in range(0, n_trials, batch_size):
+            W = filters[start:start + batch_size]
+            A = np.einsum("tkcf,tcn->tkfn", W, X[start:start + batch_size])
+            B = np.einsum("tkcf,kcn->tkfn", W, templates)
+            A = np.reshape(A, (*A.shape[:2], -1))
+            B = np.reshape(B, (*B.shape[:2], -1))
+            A = A - np.mean(A, axis=-1, keepdims=True)
+            B = B - np.mean(B, axis=-1, keepdims=True)
+            rhos[start:start + batch_size] = np.sum(A * B, axis=-1) / np.sqrt(
+                np.sum(A**2, axis=-1) * np.sum(B**2, axis=-1))
+        return rhos
+    # one set of filters per class: the trial side only enters through
+    # sums, inner products with W_k W_k^T T_k and the channel covariance
+    n_samples = X.shape[-1]
+    length = filters.shape[-1] * n_samples
+    B = np.swapaxes(filters, -1, -2) @ templates
+    G = filters @ B
+    cross = np.reshape(X, (n_trials, -1)) @ np.reshape(G, (n_classes, -1)).T
+    sum_a = np.sum(X, axis=-1) @ np.sum(filters, axis=-1).T
+    sum_b = np.sum(B, axis=(-1, -2))
+    ss_a = np.reshape(X @ np.swapaxes(X, -1, -2), (n_trials, -1)) @ np.reshape(
+        filters @ np.swapaxes(filters, -1, -2), (n_classes, -1)).T
+    ss_b = np.sum(B**2, axis=(-1, -2))
+    cov = cross - sum_a * sum_b / length
+    var_a = ss_a - sum_a**2 / length
+    var_b = ss_b - sum_b**2 / length
+    return cov / np.sqrt(var_a * var_b)
+
+
 class SCCA(BaseEstimator, TransformerMixin, ClassifierMixin):
     """
     Standard CCA (sCCA).The Canonical Correlation Analysis (CCA) method finds the coefficients of the linear combination
@@ -102,7 +269,8 @@ class SCCA(BaseEstimator, TransformerMixin, ClassifierMixin):
         The number of feature dimensions after dimensionality reduction,
         the dimension of the spatial filter, defaults to 1.
     n_jobs : int
-        The number of CPU working cores, default is None.
+        Ignored, the features of all trials are computed at once; kept for the
+        filter-bank estimators, which use it for the sub-bands. Default is None.
 
     Attributes
     ----------
@@ -159,6 +327,7 @@ class SCCA(BaseEstimator, TransformerMixin, ClassifierMixin):
         Yf = np.reshape(Yf, (-1, *Yf.shape[-2:]))
         Yf = Yf - np.mean(Yf, axis=-1, keepdims=True)
         self.Yf_ = Yf
+        self.bases_ = _reference_bases(Yf)
         return self
 
     def transform(self, X: ndarray):
@@ -178,13 +347,7 @@ class SCCA(BaseEstimator, TransformerMixin, ClassifierMixin):
         """
         X = np.reshape(X, (-1, *X.shape[-2:]))
         X = X - np.mean(X, axis=-1, keepdims=True)
-        Yf = self.Yf_
-        n_components = self.n_components
-        rhos = Parallel(n_jobs=self.n_jobs)(
-            delayed(partial(_scca_feature, n_components=n_components))(a, Yf) for a in X
-        )
-        rhos = np.stack(rhos)
-        return rhos
+        return _scca_batch(X, self.bases_, n_components=self.n_components)
 
     def predict(self, X: ndarray):
         """Predict the labels
@@ -220,6 +383,8 @@ class FBSCCA(FilterBankSSVEP, ClassifierMixin):
         Filter weights, defaults to None.
     n_jobs: int
         The number of CPU working cores, default is None.
+    backend: str
+        joblib backend of the sub-band tasks, see FilterBank, default is None (threads).
 
     References
     ----------
@@ -256,15 +421,18 @@ class FBSCCA(FilterBankSSVEP, ClassifierMixin):
         n_components: int = 1,
         filterweights: Optional[ndarray] = None,
         n_jobs: Optional[int] = None,
+        backend: Optional[str] = None,
     ):
         self.n_components = n_components
         self.filterweights = filterweights
         self.n_jobs = n_jobs
+        self.backend = backend
         super().__init__(
             filterbank,
             SCCA(n_components=n_components, n_jobs=1),
             filterweights=filterweights,
             n_jobs=n_jobs,
+            backend=backend,
         )
 
     def predict(self, X: ndarray):
@@ -299,23 +467,13 @@ def _itcca_feature(
 ):
     """
     ItCCA feature extraction
+
+    X: (n_trials, n_channels, n_samples), returns rhos (n_trials, n_classes)
     """
-    rhos = []
     if method == "itcca1":
-        for Xk in templates:
-            U, V = _scca_kernel(X, Xk)
-            a = U[:, :n_components].T @ X
-            b = V[:, :n_components].T @ Xk
-            a, b = np.reshape(a, (-1)), np.reshape(b, (-1))
-            rhos.append(pearsonr(a, b)[0])
-    elif method == "itcca2":
-        Us = cast(ndarray, Us)
-        for Xk, U in zip(templates, Us):
-            a = U[:, :n_components].T @ X
-            b = U[:, :n_components].T @ Xk
-            a, b = np.reshape(a, (-1)), np.reshape(b, (-1))
-            rhos.append(pearsonr(a, b)[0])
-    return np.array(rhos)
+        return _scca_batch(X, _reference_bases(templates), n_components=n_components)
+    Us = cast(ndarray, Us)
+    return _template_corr(X, templates, Us[:, :, :n_components])
 
 
 class ItCCA(BaseEstimator, TransformerMixin, ClassifierMixin):
@@ -333,7 +491,8 @@ class ItCCA(BaseEstimator, TransformerMixin, ClassifierMixin):
     method: str
         Two pattern feature extraction and fitting classifier model methods judgment, defaulting to 'itcca2'.
     n_jobs: int
-        The number of CPU working cores, default is None.
+        Ignored, the features of all trials are computed at once; kept for the
+        filter-bank estimators, which use it for the sub-bands. Default is None.
 
     Attributes
     ----------
@@ -419,14 +578,7 @@ class ItCCA(BaseEstimator, TransformerMixin, ClassifierMixin):
         Us = None
         if method == "itcca2":
             Us = self.Us_
-        rhos = Parallel(n_jobs=self.n_jobs)(
-            delayed(
-                partial(_itcca_feature, Us=Us, n_components=n_components, method=method)
-            )(a, templates)
-            for a in X
-        )
-        rhos = np.stack(rhos)
-        return rhos
+        return _itcca_feature(X, templates, Us=Us, n_components=n_components, method=method)
 
     def predict(self, X: ndarray):
         """Predict the labels
@@ -462,6 +614,8 @@ class FBItCCA(FilterBankSSVEP, ClassifierMixin):
         Filter weights, defaults to None.
     n_jobs: int
         The number of CPU working cores, default is None.
+    backend: str
+        joblib backend of the sub-band tasks, see FilterBank, default is None (threads).
     method: str
         Two pattern feature extraction and fitting classifier model methods judgment, defaulting to 'itcca2'.
 
@@ -484,16 +638,19 @@ class FBItCCA(FilterBankSSVEP, ClassifierMixin):
         method: str = "itcca2",
         filterweights: Optional[ndarray] = None,
         n_jobs: Optional[int] = None,
+        backend: Optional[str] = None,
     ):
         self.n_components = n_components
         self.method = method
         self.filterweights = filterweights
         self.n_jobs = n_jobs
+        self.backend = backend
         super().__init__(
             filterbank,
             ItCCA(n_components=n_components, method=method, n_jobs=1),
             filterweights=filterweights,
             n_jobs=n_jobs,
+            backend=backend,
         )
 
     def fit(self, X: ndarray, y: ndarray, Yf: Optional[ndarray] = None):  # type: ignore[override]
@@ -536,13 +693,8 @@ class FBItCCA(FilterBankSSVEP, ClassifierMixin):
 
 
 def _mscca_feature(X: ndarray, templates: ndarray, U: ndarray, n_components: int = 1):
-    rhos = []
-    for Xk in zip(templates):
-        a = U[:, :n_components].T @ X
-        b = U[:, :n_components].T @ Xk
-        a, b = np.reshape(a, (-1)), np.reshape(b, (-1))
-        rhos.append(pearsonr(a, b)[0])
-    return np.array(rhos)
+    """X: (n_trials, n_channels, n_samples), returns rhos (n_trials, n_classes)"""
+    return _template_corr(X, templates, U[:, :n_components])
 
 
 class MsCCA(BaseEstimator, TransformerMixin, ClassifierMixin):
@@ -560,7 +712,8 @@ class MsCCA(BaseEstimator, TransformerMixin, ClassifierMixin):
     method: str
         Two pattern feature extraction and fitting classifier model methods judgment, defaulting to 'itcca2'.
     n_jobs: int
-        The number of CPU working cores, default is None.
+        Ignored, the features of all trials are computed at once; kept for the
+        filter-bank estimators, which use it for the sub-bands. Default is None.
 
     Attributes
     ----------
@@ -630,15 +783,7 @@ class MsCCA(BaseEstimator, TransformerMixin, ClassifierMixin):
         X = X - np.mean(X, axis=-1, keepdims=True)
         templates = self.templates_
         n_components = self.n_components
-        U = self.U_
-        rhos = Parallel(n_jobs=self.n_jobs)(
-            delayed(partial(_mscca_feature, U=U, n_components=n_components))(
-                a, templates
-            )
-            for a in X
-        )
-        rhos = np.stack(rhos)
-        return rhos
+        return _mscca_feature(X, templates, self.U_, n_components=n_components)
 
     def predict(self, X: ndarray):
         """Predict the labels
@@ -676,6 +821,8 @@ class FBMsCCA(FilterBankSSVEP, ClassifierMixin):
         Two pattern feature extraction and fitting classifier model methods judgment, defaulting to 'itcca2'.
     n_jobs: int
         The number of CPU working cores, default is None.
+    backend: str
+        joblib backend of the sub-band tasks, see FilterBank, default is None (threads).
 
     Attributes
     ----------
@@ -693,15 +840,18 @@ class FBMsCCA(FilterBankSSVEP, ClassifierMixin):
         n_components: int = 1,
         filterweights: Optional[ndarray] = None,
         n_jobs: Optional[int] = None,
+        backend: Optional[str] = None,
     ):
         self.n_components = n_components
         self.filterweights = filterweights
         self.n_jobs = n_jobs
+        self.backend = backend
         super().__init__(
             filterbank,
             MsCCA(n_components=n_components, n_jobs=1),
             filterweights=filterweights,
             n_jobs=n_jobs,
+            backend=backend,
         )
 
     def fit(self, X: ndarray, y: ndarray, Yf: Optional[ndarray] = None):  # type: ignore[override]
@@ -751,39 +901,24 @@ def _ecca_feature(
     Us: Optional[ndarray] = None,
     n_components: int = 1,
 ):
+    """X: (n_trials, n_channels, n_samples), returns rhos (n_trials, n_classes)"""
     if Us is None:
         Us_array, _ = zip(
             *[_scca_kernel(templates[i], Yf[i]) for i in range(len(templates))]
         )
         Us = np.stack(Us_array)
-    rhos = []
-    for Xk, Y, U3 in zip(templates, Yf, Us):
-        rho_list = []
-        # 14a, 14d
-        U1, V1 = _scca_kernel(X, Y)
-        a = U1[:, :n_components].T @ X
-        b = V1[:, :n_components].T @ Y
-        a, b = np.reshape(a, (-1)), np.reshape(b, (-1))
-        rho_list.append(pearsonr(a, b)[0])
-        a = U1[:, :n_components].T @ X
-        b = U1[:, :n_components].T @ Xk
-        a, b = np.reshape(a, (-1)), np.reshape(b, (-1))
-        rho_list.append(pearsonr(a, b)[0])
-        # 14b
-        U2, _ = _scca_kernel(X, Xk)
-        a = U2[:, :n_components].T @ X
-        b = U2[:, :n_components].T @ Xk
-        a, b = np.reshape(a, (-1)), np.reshape(b, (-1))
-        rho_list.append(pearsonr(a, b)[0])
-        # 14c
-        a = U3[:, :n_components].T @ X
-        b = U3[:, :n_components].T @ Xk
-        a, b = np.reshape(a, (-1)), np.reshape(b, (-1))
-        rho_list.append(pearsonr(a, b)[0])
-        rho = np.array(rho_list)
-        rho = np.sum(np.sign(rho) * (rho**2))
-        rhos.append(rho)
-    return rhos
+    Us = np.asarray(Us)
+    Yf = Yf[:len(templates)]
+    # 14a, 14d
+    rho1, U1 = _scca_batch(X, _reference_bases(Yf), n_components=n_components, return_filters=True)
+    rho2 = _template_corr(X, templates, U1)
+    # 14b
+    _, U2 = _scca_batch(X, _reference_bases(templates), n_components=n_components, return_filters=True)
+    rho3 = _template_corr(X, templates, U2)
+    # 14c
+    rho4 = _template_corr(X, templates, Us[:, :, :n_components])
+    rho = np.stack([rho1, rho2, rho3, rho4])
+    return np.sum(np.sign(rho) * (rho**2), axis=0)
 
 
 class ECCA(BaseEstimator, TransformerMixin, ClassifierMixin):
@@ -797,7 +932,8 @@ class ECCA(BaseEstimator, TransformerMixin, ClassifierMixin):
         The number of feature dimensions after dimensionality reduction, the dimension of the spatial filter,
         defaults to 1.
     n_jobs: int
-        The number of CPU working cores, default is None.
+        Ignored, the features of all trials are computed at once; kept for the
+        filter-bank estimators, which use it for the sub-bands. Default is None.
 
     Attributes
     ----------
@@ -869,16 +1005,7 @@ class ECCA(BaseEstimator, TransformerMixin, ClassifierMixin):
         X = X - np.mean(X, axis=-1, keepdims=True)
         templates = self.templates_
         Yf = self.Yf_
-        Us = self.Us_
-        n_components = self.n_components
-        rhos = Parallel(n_jobs=self.n_jobs)(
-            delayed(partial(_ecca_feature, Us=Us, n_components=n_components))(
-                a, templates, Yf
-            )
-            for a in X
-        )
-        rhos = np.stack(rhos)
-        return rhos
+        return _ecca_feature(X, templates, Yf, Us=self.Us_, n_components=self.n_components)
 
     def predict(self, X: ndarray):
         """Predict the labels
@@ -913,6 +1040,8 @@ class FBECCA(FilterBankSSVEP, ClassifierMixin):
         defaults to 1.
     n_jobs: int
         The number of CPU working cores, default is None.
+    backend: str
+        joblib backend of the sub-band tasks, see FilterBank, default is None (threads).
 
     Attributes
     ----------
@@ -953,15 +1082,18 @@ class FBECCA(FilterBankSSVEP, ClassifierMixin):
         n_components: int = 1,
         filterweights: Optional[ndarray] = None,
         n_jobs: Optional[int] = None,
+        backend: Optional[str] = None,
     ):
         self.n_components = n_components
         self.filterweights = filterweights
         self.n_jobs = n_jobs
+        self.backend = backend
         super().__init__(
             filterbank,
             ECCA(n_components=n_components, n_jobs=1),
             filterweights=filterweights,
             n_jobs=n_jobs,
+            backend=backend,
         )
 
     def fit(self, X: ndarray, y: ndarray, Yf: Optional[ndarray] = None):  # type: ignore[override]
@@ -1031,34 +1163,22 @@ def _ttcca_feature(
     Us: Optional[ndarray] = None,
     n_components: int = 1,
 ):
+    """X: (n_trials, n_channels, n_samples), returns rhos (n_trials, n_classes)"""
     if Us is None:
         Us_array, _ = zip(
             *[_scca_kernel(templates[i], Yf[i]) for i in range(len(templates))]
         )
         Us = np.stack(Us_array)
-    rhos = []
-    for Xk, Y, U2 in zip(templates, Yf, Us):
-        rho_list = []
-        # rho1
-        U1, V1 = _scca_kernel(X, Y)
-        a = U1[:, :n_components].T @ X
-        b = V1[:, :n_components].T @ Y
-        a, b = np.reshape(a, (-1)), np.reshape(b, (-1))
-        rho_list.append(pearsonr(a, b)[0])
-        # rho3
-        a = U1[:, :n_components].T @ X
-        b = U1[:, :n_components].T @ Xk
-        a, b = np.reshape(a, (-1)), np.reshape(b, (-1))
-        rho_list.append(pearsonr(a, b)[0])
-        # rho2
-        a = U2[:, :n_components].T @ X
-        b = U2[:, :n_components].T @ Xk
-        a, b = np.reshape(a, (-1)), np.reshape(b, (-1))
-        rho_list.append(pearsonr(a, b)[0])
-        rho = np.array(rho_list)
-        rho = np.sum(np.sign(rho) * (rho**2))
-        rhos.append(rho)
-    return rhos
+    Us = np.asarray(Us)
+    Yf = Yf[:len(templates)]
+    # rho1
+    rho1, U1 = _scca_batch(X, _reference_bases(Yf), n_components=n_components, return_filters=True)
+    # rho3
+    rho3 = _template_corr(X, templates, U1)
+    # rho2
+    rho2 = _template_corr(X, templates, Us[:, :, :n_components])
+    rho = np.stack([rho1, rho3, rho2])
+    return np.sum(np.sign(rho) * (rho**2), axis=0)
 
 
 class TtCCA(BaseEstimator, TransformerMixin, ClassifierMixin):
@@ -1074,7 +1194,8 @@ class TtCCA(BaseEstimator, TransformerMixin, ClassifierMixin):
         The number of feature dimensions after dimensionality reduction, the dimension of the spatial filter,
         defaults to 1.
     n_jobs: int
-        The number of CPU working cores, default is None.
+        Ignored, the features of all trials are computed at once; kept for the
+        filter-bank estimators, which use it for the sub-bands. Default is None.
 
     Attributes
     ----------
@@ -1145,16 +1266,7 @@ class TtCCA(BaseEstimator, TransformerMixin, ClassifierMixin):
         X = X - np.mean(X, axis=-1, keepdims=True)
         templates = self.templates_
         Yf = self.Yf_
-        Us = self.Us_
-        n_components = self.n_components
-        rhos = Parallel(n_jobs=self.n_jobs)(
-            delayed(partial(_ttcca_feature, Us=Us, n_components=n_components))(
-                a, templates, Yf
-            )
-            for a in X
-        )
-        rhos = np.stack(rhos)
-        return rhos
+        return _ttcca_feature(X, templates, Yf, Us=self.Us_, n_components=self.n_components)
 
     def predict(self, X: ndarray):
         """Predict the labels
@@ -1189,6 +1301,8 @@ class FBTtCCA(FilterBankSSVEP, ClassifierMixin):
         defaults to 1.
     n_jobs: int
         The number of CPU working cores, default is None.
+    backend: str
+        joblib backend of the sub-band tasks, see FilterBank, default is None (threads).
 
     Attributes
     ----------
@@ -1209,15 +1323,18 @@ class FBTtCCA(FilterBankSSVEP, ClassifierMixin):
         n_components: int = 1,
         filterweights: Optional[ndarray] = None,
         n_jobs: Optional[int] = None,
+        backend: Optional[str] = None,
     ):
         self.n_components = n_components
         self.filterweights = filterweights
         self.n_jobs = n_jobs
+        self.backend = backend
         super().__init__(
             filterbank,
             TtCCA(n_components=n_components, n_jobs=1),
             filterweights=filterweights,
             n_jobs=n_jobs,
+            backend=backend,
         )
 
     def fit(self, X: ndarray,  # type: ignore[override]
@@ -1319,7 +1436,7 @@ class MsetCCA(BaseEstimator, TransformerMixin, ClassifierMixin):
         The number of feature dimensions after dimensionality reduction, the dimension of the spatial filter,
         defaults to 1.
     n_jobs: int
-        The number of CPU working cores, default is None.
+        The number of CPU working cores of msetcca2, ignored by msetcca1, default is None.
     methods: str
         Two Pattern Feature Extraction and Fitting Classifier Model Methods Judgment, defaulting to 'msetcca2'.
 
@@ -1387,6 +1504,7 @@ class MsetCCA(BaseEstimator, TransformerMixin, ClassifierMixin):
                 *[_msetcca_kernel1(X[y == label]) for label in self.classes_]
             )
             self.Us_, self.Ts_ = np.stack(self.Us_), np.stack(self.Ts_)
+            self.bases_ = _reference_bases(cast(ndarray, self.Ts_))
         return self
 
     def transform(self, X: ndarray):
@@ -1407,12 +1525,7 @@ class MsetCCA(BaseEstimator, TransformerMixin, ClassifierMixin):
         X = X - np.mean(X, axis=-1, keepdims=True)
         n_components = self.n_components
         if self.method == "msetcca1":
-            Ts = self.Ts_
-            rhos = Parallel(n_jobs=self.n_jobs)(
-                delayed(partial(_scca_feature, n_components=n_components))(a, Ts)
-                for a in X
-            )
-            rhos = np.stack(rhos)
+            rhos = _scca_batch(X, self.bases_, n_components=n_components)
         elif self.method == "msetcca2":
             templates = self.templates_
             Yf = self.Yf_
@@ -1462,6 +1575,8 @@ class FBMsetCCA(FilterBankSSVEP, ClassifierMixin):
         defaults to 1.
     n_jobs: int
         The number of CPU working cores, default is None.
+    backend: str
+        joblib backend of the sub-band tasks, see FilterBank, default is None (processes, 'loky').
     methods: str
         Two Pattern Feature Extraction and Fitting Classifier Model Methods Judgment, defaulting to 'msetcca2'.
 
@@ -1476,6 +1591,9 @@ class FBMsetCCA(FilterBankSSVEP, ClassifierMixin):
         correlation analysis[J]. International journal of neural systems, 2014, 24(04): 1450013.
 
     """
+    # the MsetCCA features loop over the classes and components in Python
+    _default_backend = "loky"
+
     def __init__(
         self,
         filterbank: List[ndarray],
@@ -1483,16 +1601,19 @@ class FBMsetCCA(FilterBankSSVEP, ClassifierMixin):
         method: str = "msetcca2",
         filterweights: Optional[ndarray] = None,
         n_jobs: Optional[int] = None,
+        backend: Optional[str] = None,
     ):
         self.n_components = n_components
         self.method = method
         self.filterweights = filterweights
         self.n_jobs = n_jobs
+        self.backend = backend
         super().__init__(
             filterbank,
             MsetCCA(n_components=n_components, method=method),
             filterweights=filterweights,
             n_jobs=n_jobs,
+            backend=backend,
         )
 
     def fit(self, X: ndarray, y: ndarray, Yf: Optional[ndarray] = None):  # type: ignore[override]
@@ -1594,6 +1715,7 @@ class MsetCCAR(BaseEstimator, TransformerMixin, ClassifierMixin):
             ]
         )
         self.Us_, self.Ts_ = np.stack(self.Us_), np.stack(self.Ts_)
+        self.bases_ = _reference_bases(cast(ndarray, self.Ts_))
         return self
 
     def transform(self, X: ndarray):
@@ -1612,14 +1734,7 @@ class MsetCCAR(BaseEstimator, TransformerMixin, ClassifierMixin):
         """
         X = np.reshape(X, (-1, *X.shape[-2:]))
         X = X - np.mean(X, axis=-1, keepdims=True)
-        n_components = self.n_components
-
-        Ts = self.Ts_
-        rhos = Parallel(n_jobs=self.n_jobs)(
-            delayed(partial(_scca_feature, n_components=n_components))(a, Ts) for a in X
-        )
-        rhos = np.stack(rhos)
-        return rhos
+        return _scca_batch(X, self.bases_, n_components=self.n_components)
 
     def predict(self, X: ndarray):
         """Predict the labels
@@ -1647,15 +1762,18 @@ class FBMsetCCAR(FilterBankSSVEP, ClassifierMixin):
         n_components: int = 1,
         filterweights: Optional[ndarray] = None,
         n_jobs: Optional[int] = None,
+        backend: Optional[str] = None,
     ):
         self.n_components = n_components
         self.filterweights = filterweights
         self.n_jobs = n_jobs
+        self.backend = backend
         super().__init__(
             filterbank,
             MsetCCAR(n_components=n_components, n_jobs=1),
             filterweights=filterweights,
             n_jobs=n_jobs,
+            backend=backend,
         )
 
     def fit(self, X: ndarray, y: ndarray, Yf: Optional[ndarray] = None):  # type: ignore[override]
@@ -1697,6 +1815,62 @@ class FBMsetCCAR(FilterBankSSVEP, ClassifierMixin):
         return labels
 
 
+def _trca_class_stats(X: ndarray, y: ndarray, classes: ndarray):
+    """Per-class sums of the TRCA covariances.
+
+    Parameters
+    ----------
+    X: ndarray
+        Centered EEG data, shape(n_trials, n_channels, n_samples).
+    y: ndarray
+        Labels, shape(n_trials,).
+    classes: ndarray
+        Class labels, shape(n_classes,).
+
+    Returns
+    -------
+    S: ndarray
+        Sum of the trials of each class, shape(n_classes, n_channels, n_samples).
+    Q: ndarray
+        Sum of the channel covariances of the trials of each class, shape(n_classes, n_channels, n_channels).
+    counts: ndarray
+        Number of trials of each class, shape(n_classes,).
+    """
+    S, Q, counts = [], [], []
+    for label in classes:
+        Xk = X[y == label]
+        S.append(np.sum(Xk, axis=0))
+        Q.append(np.tensordot(Xk, Xk, axes=([0, 2], [0, 2])))
+        counts.append(len(Xk))
+    return np.stack(S), np.stack(Q), np.array(counts)
+
+
+def _trca_ged(S: ndarray, Q: ndarray):
+    """Batched TRCA eigenproblem (S S^T) u = lambda Q u.
+
+    With the block-identity projector of the stacked formulation, the
+    inter-trial covariance of M trials is M S S^T with S the sum of the
+    trials, so the GED only needs channel-sized matrices.
+
+    Parameters
+    ----------
+    S: ndarray
+        Sum of the trials, optionally projected on references, shape(..., n_channels, n_features).
+    Q: ndarray
+        Sum of the channel covariances of the trials, shape(..., n_channels, n_channels).
+
+    Returns
+    -------
+    U: ndarray
+        Q-orthonormal spatial filters by descending eigenvalue, shape(..., n_channels, n_channels).
+    """
+    L = np.linalg.cholesky(Q)
+    A = np.linalg.solve(L, S)
+    _, V = np.linalg.eigh(A @ np.swapaxes(A, -1, -2))
+    U = np.linalg.solve(np.swapaxes(L, -1, -2), V)
+    return U[..., ::-1]
+
+
 def _trca_kernel(X: ndarray):
     """TRCA spatial filter calculate.
 
@@ -1705,13 +1879,9 @@ def _trca_kernel(X: ndarray):
     X: (n_trials, n_channels, n_samples)
     """
     X = np.reshape(X, (-1, *X.shape[-2:]))
-    M, C, N = X.shape
-    n_components = C
-    P = vstack([identity(N) for _ in range(M)])
-    P = P @ P.T
-    Z = np.hstack(X).T  # type: ignore
-    _, U = _ged_wong(Z, None, P, n_components=n_components)  # U for X
-    return U
+    S = np.sum(X, axis=0)
+    Q = np.tensordot(X, X, axes=([0, 2], [0, 2]))
+    return _trca_ged(S, Q)
 
 
 def _trca_feature(
@@ -1721,24 +1891,11 @@ def _trca_feature(
     n_components: int = 1,
     ensemble: bool = True,
 ):
-    rhos = []
+    """X: (n_trials, n_channels, n_samples), returns rhos (n_trials, n_classes)"""
     if not ensemble:
-        for Xk, U in zip(templates, Us):
-            a = U[:, :n_components].T @ X
-            b = U[:, :n_components].T @ Xk
-            a = np.reshape(a, (-1))
-            b = np.reshape(b, (-1))
-            rhos.append(pearsonr(a, b)[0])
-    else:
-        U = Us[:, :, :n_components]
-        U = np.concatenate(U, axis=-1)
-        for Xk in templates:
-            a = U.T @ X
-            b = U.T @ Xk
-            a = np.reshape(a, (-1))
-            b = np.reshape(b, (-1))
-            rhos.append(pearsonr(a, b)[0])
-    return rhos
+        return _template_corr(X, templates, Us[:len(templates), :, :n_components])
+    U = np.concatenate(Us[:, :, :n_components], axis=-1)
+    return _template_corr(X, templates, U)
 
 
 class TRCA(BaseEstimator, TransformerMixin, ClassifierMixin):
@@ -1756,7 +1913,8 @@ class TRCA(BaseEstimator, TransformerMixin, ClassifierMixin):
         Whether to perform spatial filter ensemble for each category of signals,
         the default is True to perform ensemble.
     n_jobs: int
-        The number of CPU working cores, default is None.
+        Ignored, the features of all trials are computed at once; kept for the
+        filter-bank estimators, which use it for the sub-bands. Default is None.
 
     Attributes
     ----------
@@ -1795,11 +1953,10 @@ class TRCA(BaseEstimator, TransformerMixin, ClassifierMixin):
         self.classes_ = np.unique(y)
         X = np.reshape(X, (-1, *X.shape[-2:]))
         X = X - np.mean(X, axis=-1, keepdims=True)
-        self.templates_ = np.stack(
-            [np.mean(X[y == label], axis=0) for label in self.classes_]
-        )
+        S, Q, counts = _trca_class_stats(X, y, self.classes_)
+        self.templates_ = S / counts[:, np.newaxis, np.newaxis]
 
-        self.Us_ = np.stack([_trca_kernel(X[y == label]) for label in self.classes_])
+        self.Us_ = _trca_ged(S, Q)
         return self
 
     def transform(self, X: ndarray):
@@ -1820,18 +1977,7 @@ class TRCA(BaseEstimator, TransformerMixin, ClassifierMixin):
         X = X - np.mean(X, axis=-1, keepdims=True)
         n_components = self.n_components
         templates = self.templates_
-        Us = self.Us_
-        ensemble = self.ensemble
-        rhos = Parallel(n_jobs=self.n_jobs)(
-            delayed(
-                partial(
-                    _trca_feature, Us=Us, n_components=n_components, ensemble=ensemble
-                )
-            )(a, templates)
-            for a in X
-        )
-        rhos = np.stack(rhos)
-        return rhos
+        return _trca_feature(X, templates, self.Us_, n_components=n_components, ensemble=self.ensemble)
 
     def predict(self, X: ndarray):
         """Predict the labels
@@ -1870,6 +2016,8 @@ class FBTRCA(FilterBankSSVEP, ClassifierMixin):
         defaults to 1.
     n_jobs: int
         The number of CPU working cores, default is None.
+    backend: str
+        joblib backend of the sub-band tasks, see FilterBank, default is None (threads).
     ensemble: bool
         Whether to perform spatial filter ensemble for each category of signals,
         the default is True to perform ensemble.
@@ -1915,16 +2063,19 @@ class FBTRCA(FilterBankSSVEP, ClassifierMixin):
         ensemble: bool = True,
         filterweights: Optional[ndarray] = None,
         n_jobs: Optional[int] = None,
+        backend: Optional[str] = None,
     ):
         self.n_components = n_components
         self.ensemble = ensemble
         self.filterweights = filterweights
         self.n_jobs = n_jobs
+        self.backend = backend
         super().__init__(
             filterbank,
             TRCA(n_components=n_components, ensemble=ensemble, n_jobs=1),
             filterweights=filterweights,
             n_jobs=n_jobs,
+            backend=backend,
         )
 
     def fit(self, X: ndarray, y: ndarray, Yf: Optional[ndarray] = None):  # type: ignore[override]
@@ -1972,14 +2123,9 @@ def _trcar_kernel(X: ndarray, Yf: ndarray):
     Yf: (n_harmonics, n_samples)
     """
     X = np.reshape(X, (-1, *X.shape[-2:]))
-    M, C, N = X.shape
-    n_components = C
-    P = vstack([identity(N) for _ in range(M)])
-    Q, R = qr(Yf.T, mode="economic")
-    P = P @ Q @ Q.T @ P.T
-    Z = np.hstack(X).T  # type: ignore
-    _, U = _ged_wong(Z, None, P, n_components=n_components)  # U for X
-    return U
+    Q, _ = np.linalg.qr(Yf.T)
+    S = np.sum(X, axis=0) @ Q
+    return _trca_ged(S, np.tensordot(X, X, axes=([0, 2], [0, 2])))
 
 
 class TRCAR(BaseEstimator, TransformerMixin, ClassifierMixin):
@@ -1995,7 +2141,8 @@ class TRCAR(BaseEstimator, TransformerMixin, ClassifierMixin):
         The number of feature dimensions after dimensionality reduction, the dimension of the spatial filter,
         defaults to 1.
     n_jobs: int
-        The number of CPU working cores, default is None.
+        Ignored, the features of all trials are computed at once; kept for the
+        filter-bank estimators, which use it for the sub-bands. Default is None.
     ensemble: bool
         Whether to perform spatial filter ensemble for each category of signals,
         the default is True to perform ensemble.
@@ -2054,20 +2201,16 @@ class TRCAR(BaseEstimator, TransformerMixin, ClassifierMixin):
         self.classes_ = np.unique(y)
         X = np.reshape(X, (-1, *X.shape[-2:]))
         X = X - np.mean(X, axis=-1, keepdims=True)
-        self.templates_ = np.stack(
-            [np.mean(X[y == label], axis=0) for label in self.classes_]
-        )
+        S, Q, counts = _trca_class_stats(X, y, self.classes_)
+        self.templates_ = S / counts[:, np.newaxis, np.newaxis]
 
         Yf = np.reshape(Yf, (-1, *Yf.shape[-2:]))
         Yf = Yf - np.mean(Yf, axis=-1, keepdims=True)
         self.Yf_ = Yf
 
-        self.Us_ = np.stack(
-            [
-                _trcar_kernel(X[y == label], self.Yf_[i])
-                for i, label in enumerate(self.classes_)
-            ]
-        )
+        # class sums projected on the reference subspace of each class
+        bases = _reference_bases(self.Yf_[:len(self.classes_)])
+        self.Us_ = _trca_ged(S @ bases, Q)
         return self
 
     def transform(self, X: ndarray):
@@ -2088,18 +2231,7 @@ class TRCAR(BaseEstimator, TransformerMixin, ClassifierMixin):
         X = X - np.mean(X, axis=-1, keepdims=True)
         n_components = self.n_components
         templates = self.templates_
-        Us = self.Us_
-        ensemble = self.ensemble
-        rhos = Parallel(n_jobs=self.n_jobs)(
-            delayed(
-                partial(
-                    _trca_feature, Us=Us, n_components=n_components, ensemble=ensemble
-                )
-            )(a, templates)
-            for a in X
-        )
-        rhos = np.stack(rhos)
-        return rhos
+        return _trca_feature(X, templates, self.Us_, n_components=n_components, ensemble=self.ensemble)
 
     def predict(self, X: ndarray):
         """Predict the labels
@@ -2138,6 +2270,8 @@ class FBTRCAR(FilterBankSSVEP, ClassifierMixin):
         defaults to 1.
     n_jobs: int
         The number of CPU working cores, default is None.
+    backend: str
+        joblib backend of the sub-band tasks, see FilterBank, default is None (threads).
 
 
     Attributes
@@ -2189,16 +2323,19 @@ class FBTRCAR(FilterBankSSVEP, ClassifierMixin):
         ensemble: bool = True,
         filterweights: Optional[ndarray] = None,
         n_jobs: Optional[int] = None,
+        backend: Optional[str] = None,
     ):
         self.n_components = n_components
         self.ensemble = ensemble
         self.filterweights = filterweights
         self.n_jobs = n_jobs
+        self.backend = backend
         super().__init__(
             filterbank,
             TRCAR(n_components=n_components, ensemble=ensemble, n_jobs=1),
             filterweights=filterweights,
             n_jobs=n_jobs,
+            backend=backend,
         )
 
     def fit(self, X: ndarray, y: ndarray, Yf: Optional[ndarray] = None):  # type: ignore[override]
@@ -14,7 +14,7 @@ from ..utils.covariance import nearestPD
 from sklearn.base import BaseEstimator, TransformerMixin, ClassifierMixin
 
 from .base import robust_pattern
-from .cca import FilterBankSSVEP
+from .cca import FilterBankSSVEP, _template_corr
 
 
 def xiang_dsp_kernel(
@@ -253,6 +253,13 @@ class DSP(BaseEstimator, TransformerMixin, ClassifierMixin):
         -------
         feature : ndarray, shape(n_trials,n_classes)
             correlation coefficients of templates of train data and features of test data, shape(n_trials, n_classes)
+
+        Notes
+        -----
+        With transform_method="corr" the features are exact Pearson
+        coefficients, see pearson_features. Earlier versions returned them
+        scaled by L/(L-1), L = n_components*n_samples, which does not change
+        the predicted labels.
         """
         n_components = self.n_components
         X -= np.mean(X, axis=-1, keepdims=True)
@@ -284,17 +291,7 @@ class DSP(BaseEstimator, TransformerMixin, ClassifierMixin):
         corr : ndarray
             pearson correlation coefficient, shape(n_trials, n_classes)
         """
-        X = np.reshape(X, (-1, *X.shape[-2:]))
-        templates = np.reshape(templates, (-1, *templates.shape[-2:]))
-        X = X - np.mean(X, axis=-1, keepdims=True)
-        templates = templates - np.mean(templates, axis=-1, keepdims=True)
-        X = np.reshape(X, (X.shape[0], -1))
-        templates = np.reshape(templates, (templates.shape[0], -1))
-        istd_X = 1 / np.std(X, axis=-1, keepdims=True)
-        istd_templates = 1 / np.std(templates, axis=-1, keepdims=True)
-        corr = (X @ templates.T) / (templates.shape[1] - 1)
-        corr = istd_X * corr * istd_templates.T
-        return corr
+        return pearson_features(X, templates)
 
     def predict(self, X: ndarray):
         """
@@ -340,6 +337,8 @@ class FBDSP(FilterBankSSVEP, ClassifierMixin):
         filter weights, optional parameter, by default None
     n_jobs : int
         optional parameter, by default None
+    backend : str
+        joblib backend of the sub-band tasks, see FilterBank, by default None (threads)
 
     Attributes
     ----------
@@ -374,16 +373,19 @@ class FBDSP(FilterBankSSVEP, ClassifierMixin):
         transform_method: str = "corr",
         filterweights: Optional[ndarray] = None,
         n_jobs: Optional[int] = None,
+        backend: Optional[str] = None,
     ):
         self.n_components = n_components
         self.transform_method = transform_method
         self.filterweights = filterweights
         self.n_jobs = n_jobs
+        self.backend = backend
         super().__init__(
             filterbank,
             DSP(n_components=n_components, transform_method=transform_method),
             filterweights=filterweights,
             n_jobs=n_jobs,
+            backend=backend,
         )
 
     def fit(self, X: ndarray, y: ndarray, Yf: Optional[ndarray] = None):  # type: ignore[override]
@@ -642,16 +644,18 @@ def pearson_features(X, templates):
     -------
     corr : ndarray
         pearson correlation coefficient, shape(n_trials, n_classes)
+
+    Notes
+    -----
+    The result is the exact Pearson coefficient of the flattened arrays.
+    Earlier versions divided by L-1 instead of L, L = n_components*n_samples,
+    and returned it scaled by L/(L-1); DSP and DCPM features change by that
+    factor, their predicted labels do not.
     '''
 
     X = np.reshape(X, (-1, *X.shape[-2:]))
     templates = np.reshape(templates, (-1, *templates.shape[-2:]))
+    # every component is centered on its own before the whole is correlated
     X = X - np.mean(X, axis=-1, keepdims=True)
     templates = templates - np.mean(templates, axis=-1, keepdims=True)
-    X = np.reshape(X, (X.shape[0], -1))
-    templates = np.reshape(templates, (templates.shape[0], -1))
-    istd_X = 1 / np.std(X, axis=-1, keepdims=True)
-    istd_templates = 1 / np.std(templates, axis=-1, keepdims=True)
-    corr = (X @ templates.T) / (templates.shape[1] - 1)
-    corr = istd_X * corr * istd_templates.T
-    return corr
+    return _template_corr(X, templates)
@@ -210,6 +210,8 @@ class FBSSCOR(FilterBank):
     .. [2] Kumar G R K, Reddy M R. Correction to “Designing a Sum of Squared Correlations Framework for Enhancing SSVEP
            Based BCIs”[J]. IEEE Transactions on Neural Systems and Rehabilitation Engineering, 2020, 28(4): 1044-1045.
     """
+    # the SSCOR fit loops over the trials in Python
+    _default_backend = "loky"
 
     def __init__(
         self,
@@ -218,10 +220,12 @@ class FBSSCOR(FilterBank):
         n_jobs: Optional[int] = None,
         filterbank: List[ndarray] = [],
         filterweights: Optional[ndarray] = None,
+        backend: Optional[str] = None,
     ):
         self.n_components = n_components
         self.ensemble = ensemble
         self.n_jobs = n_jobs
+        self.backend = backend
         self.filterbank = filterbank
         self.filterweights = filterweights
         if filterweights is not None:
@@ -241,6 +245,7 @@ class FBSSCOR(FilterBank):
                 n_jobs=n_jobs,
             ),
             filterbank=filterbank,
+            backend=backend,
         )
 
     def transform(self, X: ndarray):  # type: ignore[override]
@@ -9,12 +9,12 @@ Task Decomposition Component Analysis.
 from typing import Optional, List
 
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 from scipy.linalg import qr
-from scipy.stats import pearsonr
 from numpy import ndarray
 from sklearn.base import BaseEstimator, TransformerMixin, ClassifierMixin
 
-from .cca import FilterBankSSVEP
+from .cca import FilterBankSSVEP, _reference_bases
 from .dsp import xiang_dsp_kernel, xiang_dsp_feature
 
 
@@ -24,23 +24,46 @@ def proj_ref(Yf: ndarray):
     return P
 
 
-def aug_2(X: ndarray, n_samples: int, padding_len: int, P: ndarray, training: bool = True):
+def lagged(X: ndarray, n_samples: int, padding_len: int, training: bool = True):
+    """Delay-embedded trials, lag after lag, as a strided view copied once.
+
+    Parameters
+    ----------
+    X: ndarray
+        EEG data, shape(n_trials, n_channels, n_points).
+    n_samples: int
+        Length of the embedded trials.
+    padding_len: int
+        Largest lag.
+    training: bool
+        Whether the lagged samples are taken past n_samples (training) or
+        replaced by zeros (test), by default True.
+
+    Returns
+    -------
+    lagged_X: ndarray
+        Embedded trials, shape(n_trials, (padding_len+1)*n_channels, n_samples).
+    """
     X = X.reshape((-1, *X.shape[-2:]))
     n_trials, n_channels, n_points = X.shape
     if n_points < padding_len + n_samples:
         raise ValueError("the length of X should be larger than l+n_samples.")
-    aug_X = np.zeros((n_trials, (padding_len + 1) * n_channels, n_samples))
     if training:
-        for i in range(padding_len + 1):
-            aug_X[:, i * n_channels : (i + 1) * n_channels, :] = X[
-                ..., i : i + n_samples
-            ]
+        X = X[..., : n_samples + padding_len]
     else:
-        for i in range(padding_len + 1):
-            aug_X[:, i * n_channels : (i + 1) * n_channels, : n_samples - i] = X[
-                ..., i:n_samples
-            ]
-    aug_Xp = aug_X @ P
+        X = np.concatenate(
+            [X[..., :n_samples], np.zeros((n_trials, n_channels, padding_len))], axis=-1
+        )
+    # windows[t, c, i] is X[t, c, i:i+n_samples]
+    windows = sliding_window_view(X, n_samples, axis=-1)
+    return np.swapaxes(windows, 1, 2).reshape((n_trials, -1, n_samples))
+
+
+def aug_2(X: ndarray, n_samples: int, padding_len: int, P: ndarray, training: bool = True):
+    aug_X = lagged(X, n_samples, padding_len, training=training)
+    # P is either the basis Q of the references, applied in low-rank form
+    # (X Q) Q^T, or the projector Q Q^T of proj_ref, since P P^T = P
+    aug_Xp = (aug_X @ P) @ P.T
     aug_X = np.concatenate([aug_X, aug_Xp], axis=-1)
     return aug_X
 
@@ -54,20 +77,65 @@ def tdca_feature(
     padding_len: int,
     n_components: int = 1,
     training=False,
+    batch_size: int = 16,
 ):
-    rhos = []
-    for Xk, P in zip(templates, Ps):
-        a = xiang_dsp_feature(
-            W,
-            M,
-            aug_2(X, P.shape[0], padding_len, P, training=training),
-            n_components=n_components,
-        )
-        b = Xk[:n_components, :]
-        a = np.reshape(a, (-1))
-        b = np.reshape(b, (-1))
-        rhos.append(pearsonr(a, b)[0])
-    return rhos
+    """Correlations of the TDCA features of every trial with every class template.
+
+    Each trial is embedded and spatially filtered once; the projections on
+    the references of all classes are then applied to the filtered trial,
+    which is equivalent since they act on the time axis only.
+
+    Parameters
+    ----------
+    X: ndarray
+        EEG data, shape(n_trials, n_channels, n_points) or shape(n_channels, n_points).
+    templates: ndarray
+        Class templates, shape(n_classes, n_filters, 2*n_samples).
+    W: ndarray
+        Spatial filters, shape((padding_len+1)*n_channels, n_filters).
+    M: ndarray
+        Common template, shape((padding_len+1)*n_channels, 2*n_samples).
+    Ps: list of ndarray
+        Reference bases of the classes, shape(n_samples, n_refs), or their
+        projectors from proj_ref.
+    padding_len: int
+        Largest lag.
+    n_components: int
+        Number of spatial filters, by default 1.
+    training: bool
+        See lagged(), by default False.
+    batch_size: int
+        Trials processed at once.
+
+    Returns
+    -------
+    rhos: ndarray
+        Correlations, shape(n_trials, n_classes). All trials are processed
+        in one call; a single trial of shape(n_channels, n_points) gives
+        shape(n_classes,) as in earlier versions.
+    """
+    single_trial = X.ndim == 2
+    X = X.reshape((-1, *X.shape[-2:]))
+    Qs = np.stack(Ps)
+    n_samples = Qs.shape[1]
+    Wk = W[:, :n_components]
+    WM = Wk.T @ M
+    B = np.reshape(templates[:, :n_components, :], (len(templates), -1))
+    B = B - np.mean(B, axis=-1, keepdims=True)
+    B = B / np.linalg.norm(B, axis=-1, keepdims=True)
+    rhos = np.empty((len(X), len(Qs)))
+    for start in range(0, len(X), batch_size):
+        Z = Wk.T @ lagged(X[start:start + batch_size], n_samples, padding_len, training=training)
+        # (Z Q) Q^T of every class, shape(n_batch, n_classes, n_components, n_samples)
+        ZP = (Z[:, np.newaxis] @ Qs) @ np.swapaxes(Qs, -1, -2)
+        F = np.concatenate([np.broadcast_to(Z[:, np.newaxis], ZP.shape), ZP], axis=-1)
+        # xiang_dsp_feature: centered in time, minus the common template
+        F = F - np.mean(F, axis=-1, keepdims=True) - WM
+        F = np.reshape(F, (*F.shape[:2], -1))
+        F = F - np.mean(F, axis=-1, keepdims=True)
+        F = F / np.linalg.norm(F, axis=-1, keepdims=True)
+        rhos[start:start + batch_size] = np.einsum("tkd,kd->tk", F, B)
+    return rhos[0] if single_trial else rhos
 
 
 class TDCA(BaseEstimator, TransformerMixin, ClassifierMixin):
@@ -78,16 +146,17 @@ class TDCA(BaseEstimator, TransformerMixin, ClassifierMixin):
     def fit(self, X: ndarray, y: ndarray, Yf: ndarray):
         X -= np.mean(X, axis=-1, keepdims=True)
         self.classes_ = np.unique(y)
-        self.Ps_ = [proj_ref(Yf[i]) for i in range(len(self.classes_))]
+        # bases of the references, the projectors Q Q^T are never formed
+        self.Qs_ = _reference_bases(Yf[: len(self.classes_)])
 
         aug_X_list, aug_Y_list = [], []
         for i, label in enumerate(self.classes_):
             aug_X_list.append(
                 aug_2(
                     X[y == label],
-                    self.Ps_[i].shape[0],
+                    self.Qs_[i].shape[0],
                     self.padding_len,
-                    self.Ps_[i],
+                    self.Qs_[i],
                     training=True,
                 )
             )
@@ -116,22 +185,31 @@ class TDCA(BaseEstimator, TransformerMixin, ClassifierMixin):
     def transform(self, X: ndarray):
         n_components = self.n_components
         X -= np.mean(X, axis=-1, keepdims=True)
-        X = X.reshape((-1, *X.shape[-2:]))
-        rhos = [
-            tdca_feature(
-                tmp,
-                self.templates_,
-                self.W_,
-                self.M_,
-                self.Ps_,
-                self.padding_len,
-                n_components=n_components,
-            )
-            for tmp in X
-        ]
-        rhos = np.stack(rhos)
+        rhos = tdca_feature(
+            X,
+            self.templates_,
+            self.W_,
+            self.M_,
+            self.Qs_,
+            self.padding_len,
+            n_components=n_components,
+        )
         return rhos
 
+    @property
+    def Ps_(self):
+        """Projectors Q Q^T on the references of each class, the attribute
+        stored by earlier versions; the model itself only keeps the bases Qs_."""
+        return [Q @ Q.T for Q in self.Qs_]
+
+    def __setstate__(self, state):
+        # models pickled by earlier versions hold the projectors, which
+        # tdca_feature accepts in place of the bases
+        if "Ps_" in state and "Qs_" not in state:
+            state = dict(state)
+            state["Qs_"] = np.stack(state.pop("Ps_"))
+        super().__setstate__(state)
+
     def predict(self, X: ndarray):
         feat = self.transform(X)
         labels = self.classes_[np.argmax(feat, axis=-1)]
@@ -146,16 +224,19 @@ class FBTDCA(FilterBankSSVEP, ClassifierMixin):
         n_components: int = 1,
         filterweights: Optional[ndarray] = None,
         n_jobs: Optional[int] = None,
+        backend: Optional[str] = None,
     ):
         self.padding_len = padding_len
         self.n_components = n_components
         self.filterweights = filterweights
         self.n_jobs = n_jobs
+        self.backend = backend
         super().__init__(
             filterbank,
             TDCA(padding_len, n_components=n_components),
             filterweights=filterweights,
             n_jobs=n_jobs,
+            backend=backend,
         )
 
     def fit(self, X: ndarray, y: ndarray, Yf: Optional[ndarray] = None):  # type: ignore[override]
@@ -3,11 +3,26 @@ from datetime import datetime
 import time
 import struct
 import os
+import queue
+import threading
+import numpy as np
 # 常量定义
 SCALE_FACTOR = 0.022351744455307063  # 转换为微伏的系数
 HEADER_BYTE = 0xA0
 FOOTER_BYTE = 0xC0
 SAMPLE_RATE = 250  # Hz
+N_CHANNELS = 8
+PACKET_SIZE = 33
+
+CSV_HEADER = "样本索引,EEG通道0,EEG通道1,EEG通道2,EEG通道3,EEG通道4,EEG通道5,EEG通道6,EEG通道7,时间戳,事件标记\n"
+
+# 二进制采集文件: 文件头 + 定长样本记录, 事件标签另存于 <filename>.events
+BIN_MAGIC = b"ABCIBIN1"
+BIN_RECORD = np.dtype([
+    ("sample_num", "u1"),
+    ("eeg", "<f4", (N_CHANNELS,)),
+    ("timestamp", "<f8"),  # POSIX秒
+])
 
 # 全局变量控制采集状态
 is_collecting = False
@@ -47,87 +62,526 @@ def parse_eeg_packet(packet_data):
     }
 
 
-def start_data_collection(ser, filename, duration=None, event_label=None):
+def find_packets(buf):
+    """
+    在字节缓冲区中查找所有有效数据包的起始位置
+    与逐字节扫描相同: 从前往后取第一个帧头/帧尾匹配的位置, 数据包之间不重叠
+    :param buf: uint8数组
+    :return: 数据包起始位置数组
+    """
+    n_candidates = len(buf) - PACKET_SIZE + 1
+    if n_candidates <= 0:
+        return np.empty(0, dtype=np.intp)
+    starts = np.flatnonzero(
+        (buf[:n_candidates] == HEADER_BYTE) & (buf[PACKET_SIZE - 1:] == FOOTER_BYTE))
+    # 去掉与前一个保留包重叠的候选位置(数据中偶然出现的帧头/帧尾)
+    while len(starts) > 1:
+        overlap = np.diff(starts) < PACKET_SIZE
+        if not overlap.any():
+            break
+        # 前一个位置本身也要被丢弃时, 当前位置留到下一轮再判断
+        drop = overlap & ~np.concatenate(([False], overlap[:-1]))
+        starts = starts[np.concatenate(([True], ~drop))]
+    return starts
+
+
+def decode_packets(buf, starts):
+    """
+    向量化解析数据包
+    :param buf: uint8数组
+    :param starts: 数据包起始位置数组
+    :return: (样本编号数组 (n,), EEG数据 (n, 8) 微伏)
+    """
+    packets = buf[starts[:, None] + np.arange(PACKET_SIZE)]
+    sample_nums = packets[:, 1]
+    b = packets[:, 2:2 + 3 * N_CHANNELS].reshape(-1, N_CHANNELS, 3).astype(np.int32)
+    # 与parse_eeg_packet一致: 3字节按'<i'补0解包后右移8位
+    value = (b[..., 0] | (b[..., 1] << 8) | (b[..., 2] << 16)) >> 8
+    return sample_nums, value * SCALE_FACTOR
+
+
+class PacketDecoder:
+    """
+    串口数据流解码器
+    每次输入一段接收到的字节, 一次性找出其中所有完整数据包并解析,
+    不完整的尾部留到下一次; 根据样本编号(0-255循环)统计丢包数.
+    编号与上一个包相同的包记为重复包, 不计入丢包(数据仍原样输出).
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self.last_sample_num = None
+        self.lost_packets = 0
+        self.duplicate_packets = 0
+
+    def feed(self, data):
+        """
+        :param data: 串口读到的字节
+        :return: (样本编号数组 (n,), EEG数据 (n, 8) 微伏)
+        """
+        self._buffer.extend(data)
+        buf = np.frombuffer(self._buffer, dtype=np.uint8)
+        starts = find_packets(buf)
+        if len(starts):
+            sample_nums, eeg = decode_packets(buf, starts)
+        # 释放对缓冲区的引用后才能修改bytearray
+        del buf
+        if len(starts) == 0:
+            if len(self._buffer) > PACKET_SIZE - 1:
+                del self._buffer[:-(PACKET_SIZE - 1)]
+            return np.empty(0, dtype=np.uint8), np.empty((0, N_CHANNELS))
+        del self._buffer[:starts[-1] + PACKET_SIZE]
+
+        nums = sample_nums.astype(np.int64)
+        if self.last_sample_num is not None:
+            nums = np.concatenate(([self.last_sample_num], nums))
+        step = np.diff(nums) % 256
+        duplicate = step == 0
+        self.duplicate_packets += int(np.sum(duplicate))
+        self.lost_packets += int(np.sum((step[~duplicate] - 1) % 256))
+        self.last_sample_num = int(sample_nums[-1])
+        return sample_nums, eeg
+
+
+def format_timestamp(ts):
+    """POSIX秒 -> 采集文件使用的本地时间字符串"""
+    return datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+
+
+class BinaryCaptureWriter:
+    """
+    二进制采集文件写入器
+
+    样本先写入预分配的记录块, 块满后交给后台写线程落盘, 每块只写一次、flush一次.
+    待写块数量有上限(write-behind缓冲), 队列满时采集线程等待而不是无限占用内存.
+    后台写入出错时异常被记录下来, 在下一次flush()/close()中重新抛出.
+    :param filename: 二进制数据文件名(.bin), 已存在时追加
+    :param chunk_size: 每块样本数, 默认1秒数据
+    :param max_pending: 后台最多缓存的待写块数
+    """
+
+    def __init__(self, filename, chunk_size=SAMPLE_RATE, max_pending=64):
+        self.filename = filename
+        self.events_filename = filename + '.events'
+        self.chunk_size = chunk_size
+        self._chunk = np.zeros(chunk_size, dtype=BIN_RECORD)
+        self._n = 0
+        self._events = []
+
+        new_file = not os.path.exists(filename) or os.path.getsize(filename) == 0
+        self._f = open(filename, 'ab')
+        if new_file:
+            self._f.write(BIN_MAGIC)
+            self._f.flush()
+        # 已有样本数, 用于计算事件在整个文件中的样本位置
+        self.n_samples = (os.path.getsize(filename) - len(BIN_MAGIC)) // BIN_RECORD.itemsize
+
+        self._pending = queue.Queue(maxsize=max_pending)
+        self._error = None
+        self._writer = threading.Thread(target=self._write_behind, name="capture_writer", daemon=True)
+        self._writer.start()
+
+    def _write_behind(self):
+        while True:
+            item = self._pending.get()
+            if item is None:
+                break
+            if self._error is not None:
+                # 出错后只取走待写块, 采集线程不会阻塞在put上
+                continue
+            chunk, events = item
+            try:
+                self._f.write(chunk.tobytes())
+                self._f.flush()
+                if events:
+                    with open(self.events_filename, 'a', encoding='utf-8') as ef:
+                        ef.writelines(f"{idx},{label}\n" for idx, label in events)
+            except Exception as e:
+                self._error = e
+
+    def _check_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def _put(self, item, check=True):
+        # 带超时地等待队列空位, 写线程出错或已退出时不会一直阻塞
+        while self._writer.is_alive():
+            if check:
+                self._check_error()
+            try:
+                self._pending.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+        if check:
+            self._check_error()
+            raise RuntimeError(f"写线程已退出: {self.filename}")
+
+    def write(self, sample_num, eeg_data, timestamp, event_label=None):
+        """写入单个样本"""
+        record = self._chunk[self._n]
+        record['sample_num'] = sample_num
+        record['eeg'] = eeg_data
+        record['timestamp'] = timestamp
+        if event_label:
+            self._events.append((self.n_samples, event_label))
+        self._n += 1
+        self.n_samples += 1
+        if self._n == self.chunk_size:
+            self.flush()
+
+    def write_block(self, sample_nums, eeg, timestamp, event_label=None, events=None):
+        """
+        写入一批样本
+        :param sample_nums: 样本编号 (n,)
+        :param eeg: EEG数据 (n, 8)
+        :param timestamp: 这批样本的接收时间(POSIX秒)
+        :param event_label: 事件标签, 记在这批的第一个样本上
+        :param events: [(批内样本位置, 事件标签), ...]
+        """
+        n = len(sample_nums)
+        if n == 0:
+            return
+        if event_label:
+            self._events.append((self.n_samples, event_label))
+        if events:
+            self._events.extend((self.n_samples + offset, label) for offset, label in events)
+        pos = 0
+        while pos < n:
+            m = min(n - pos, self.chunk_size - self._n)
+            block = self._chunk[self._n:self._n + m]
+            block['sample_num'] = sample_nums[pos:pos + m]
+            block['eeg'] = eeg[pos:pos + m]
+            block['timestamp'] = timestamp
+            self._n += m
+            self.n_samples += m
+            pos += m
+            if self._n == self.chunk_size:
+                self.flush()
+
+    def flush(self):
+        """把当前块交给后台写线程, 之前的写入出错时抛出该异常"""
+        self._check_error()
+        if self._n == 0 and not self._events:
+            return
+        self._put((self._chunk[:self._n].copy(), self._events))
+        self._n = 0
+        self._events = []
+
+    def close(self):
+        """写完剩余数据并关闭文件, 后台写入出错时抛出该异常"""
+        try:
+            self.flush()
+        finally:
+            self._put(None, check=False)
+            self._writer.join()
+            self._f.close()
+        self._check_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read_binary_capture(filename):
+    """
+    读取二进制采集文件
+    :param filename: BinaryCaptureWriter写入的.bin文件
+    :return: (样本记录数组, [(样本位置, 事件标签), ...])
+    """
+    with open(filename, 'rb') as f:
+        if f.read(len(BIN_MAGIC)) != BIN_MAGIC:
+            raise ValueError(f"不是ABCI二进制采集文件: {filename}")
+    records = np.memmap(filename, dtype=BIN_RECORD, mode='r', offset=len(BIN_MAGIC))
+    events = []
+    if os.path.exists(filename + '.events'):
+        with open(filename + '.events', encoding='utf-8') as ef:
+            for line in ef:
+                idx, label = line.rstrip('\n').split(',', 1)
+                events.append((int(idx), label))
+    return records, events
+
+
+def export_csv(bin_filename, csv_filename=None):
+    """
+    将二进制采集文件导出为原有CSV格式
+    :param bin_filename: .bin文件
+    :param csv_filename: 输出CSV文件名, 默认与.bin同名
+    :return: CSV文件名
+    """
+    if csv_filename is None:
+        csv_filename = os.path.splitext(bin_filename)[0] + '.csv'
+    records, events = read_binary_capture(bin_filename)
+    labels = dict(events)
+
+    # 时间戳按读取批次共享, 只需格式化不重复的值
+    ts_unique, ts_inverse = np.unique(records['timestamp'], return_inverse=True)
+    ts_str = [format_timestamp(ts) for ts in ts_unique]
+
+    with open(csv_filename, 'w', newline='') as f:
+        f.write(CSV_HEADER)
+        for start in range(0, len(records), 10000):
+            block = records[start:start + 10000]
+            eeg_str = np.char.mod('%.6f', block['eeg'])
+            lines = []
+            for i in range(len(block)):
+                lines.append(
+                    f"{block['sample_num'][i]},{','.join(eeg_str[i])},"
+                    f"{ts_str[ts_inverse[start + i]]},{labels.get(start + i, '')}\n")
+            f.writelines(lines)
+    return csv_filename
+
+
+def format_csv_lines(sample_nums, eeg, timestamp, events=()):
+    """
+    把一批样本格式化为CSV行
+    :param sample_nums: 样本编号 (n,)
+    :param eeg: EEG数据 (n, 8)
+    :param timestamp: 这批样本的接收时间(POSIX秒)
+    :param events: [(批内样本位置, 事件标签), ...]
+    :return: CSV行列表
+    """
+    ts = format_timestamp(timestamp)
+    eeg_str = np.char.mod('%.6f', eeg)
+    lines = [f"{num},{','.join(row)},{ts},\n" for num, row in zip(sample_nums, eeg_str)]
+    for offset, label in events:
+        lines[offset] = lines[offset][:-1] + label + "\n"
+    return lines
+
+
+class AcquisitionSession:
+    """
+    持续采集会话
+
+    整个实验只向设备发送一次开始/停止命令, 采集线程连续解码串口数据,
+    写入内存环形缓冲区和数据文件. 刺激开始时通过mark()放入带时间戳的事件,
+    采集线程按样本接收时间把事件对齐到具体样本.
+    :param ser: 串口对象
+    :param filename: 数据文件名
+    :param storage: 'csv' 或 'binary', 见start_data_collection
+    :param srate: 采样率
+    :param buffer_seconds: 环形缓冲区长度(秒)
+    """
+
+    def __init__(self, ser, filename, storage='csv', srate=SAMPLE_RATE, buffer_seconds=30):
+        self.ser = ser
+        self.storage = storage
+        self.srate = srate
+        if storage == 'binary':
+            filename = os.path.splitext(filename)[0] + '.bin'
+        elif filename.endswith('.txt'):
+            filename = filename[:-4] + '.csv'
+        self.filename = filename
+        self.decoder = PacketDecoder()
+        self.n_samples = 0
+
+        self._ring = np.zeros((int(buffer_seconds * srate), N_CHANNELS))
+        self._ring_lock = threading.Lock()
+        self._markers = queue.Queue()
+        self._pending_markers = []
+        self._exit = threading.Event()
+        self._thread = None
+        self._writer = None
+        self._f = None
+
+    def start(self):
+        """打开数据文件, 向设备发送一次'b'并启动采集线程"""
+        if self.storage == 'binary':
+            self._writer = BinaryCaptureWriter(self.filename)
+        else:
+            write_header = not os.path.exists(self.filename) or os.path.getsize(self.filename) == 0
+            self._f = open(self.filename, 'a', newline='')
+            if write_header:
+                self._f.write(CSV_HEADER)
+                self._f.flush()
+        self._exit.clear()
+        self.ser.write(b'b')
+        self._thread = threading.Thread(target=self._loop, name="abci_acquisition", daemon=True)
+        self._thread.start()
+        print("数据采集开始")
+
+    def mark(self, label, timestamp=None):
+        """
+        放入事件标记, 可从任意线程调用(例如win.callOnFlip)
+        :param label: 事件标签
+        :param timestamp: 事件时间(POSIX秒), 默认当前时间
+        """
+        self._markers.put((time.time() if timestamp is None else timestamp, label))
+
+    def _align_markers(self, n, recv_time):
+        # 最后一个样本在recv_time到达, 之前的样本按采样间隔往前推
+        while True:
+            try:
+                self._pending_markers.append(self._markers.get_nowait())
+            except queue.Empty:
+                break
+        if not self._pending_markers:
+            return []
+        first_time = recv_time - (n - 1) / self.srate
+        events, later = [], []
+        for ts, label in self._pending_markers:
+            if ts > recv_time:
+                later.append((ts, label))
+            else:
+                offset = int(np.ceil((ts - first_time) * self.srate))
+                events.append((min(max(offset, 0), n - 1), label))
+        self._pending_markers = later
+        return events
+
+    def _append_ring(self, eeg):
+        n = len(eeg)
+        size = len(self._ring)
+        with self._ring_lock:
+            if n >= size:
+                self._ring[:] = eeg[-size:]
+                start = 0
+            else:
+                start = self.n_samples % size
+                first = min(n, size - start)
+                self._ring[start:start + first] = eeg[:first]
+                self._ring[:n - first] = eeg[first:]
+            self.n_samples += n
+
+    def get_latest(self, n_samples):
+        """
+        最近的n个样本
+        :return: EEG数据 (n, 8), 按时间顺序
+        """
+        size = len(self._ring)
+        with self._ring_lock:
+            n_samples = min(n_samples, size, self.n_samples)
+            end = self.n_samples % size
+            idx = np.arange(end - n_samples, end) % size
+            return self._ring[idx]
+
+    def _loop(self):
+        try:
+            while not self._exit.is_set():
+                if self.ser.in_waiting > 0:
+                    raw_data = self.ser.read(self.ser.in_waiting)
+                    recv_time = time.time()
+                    sample_nums, eeg = self.decoder.feed(raw_data)
+                    n = len(sample_nums)
+                    if n:
+                        events = self._align_markers(n, recv_time)
+                        self._append_ring(eeg)
+                        if self._writer is not None:
+                            self._writer.write_block(sample_nums, eeg, recv_time, events=events)
+                        else:
+                            self._f.writelines(format_csv_lines(sample_nums, eeg, recv_time, events))
+                            self._f.flush()
+                time.sleep(0.001)
+        except Exception as e:
+            print(f"数据采集错误: {e}")
+
+    def stop(self):
+        """停止采集线程, 向设备发送一次's'并关闭数据文件"""
+        self._exit.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.ser.write(b's')
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+        if self.decoder.lost_packets:
+            print(f"检测到丢包: {self.decoder.lost_packets}")
+        if self.decoder.duplicate_packets:
+            print(f"检测到重复包: {self.decoder.duplicate_packets}")
+        print("数据采集结束")
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def start_data_collection(ser, filename, duration=None, event_label=None, storage='csv'):
     """
     采集串口数据并保存到文件
     :param ser: 串口对象
     :param filename: 数据文件名（自动将.txt改为.csv）
     :param duration: 采集持续时间（秒）
     :param event_label: 事件标签
+    :param storage: 'csv' 写入文本CSV(每次串口读取批量flush一次);
+                    'binary' 写入.bin二进制文件, 可用export_csv导出CSV
     """
     global is_collecting
     is_collecting = True
     start_time = time.time()
-    buffer = bytearray()
+    decoder = PacketDecoder()
     event_recorded = False
 
-    # 确保文件扩展名是.csv
-    if filename.endswith('.txt'):
+    # 确保文件扩展名是.csv / .bin
+    if storage == 'binary':
+        filename = os.path.splitext(filename)[0] + '.bin'
+    elif filename.endswith('.txt'):
         filename = filename[:-4] + '.csv'
 
     # 发送'b'开始数据传输
     ser.write(b'b')
 
+    writer = None
+    f = None
     try:
-        # 检查文件是否已存在且非空
-        write_header = not os.path.exists(filename) or os.path.getsize(filename) == 0
-
-        with open(filename, 'a', newline='') as f:
-            print(f"数据采集开始（{event_label}）...")
+        if storage == 'binary':
+            writer = BinaryCaptureWriter(filename)
+        else:
+            # 检查文件是否已存在且非空
+            write_header = not os.path.exists(filename) or os.path.getsize(filename) == 0
+            f = open(filename, 'a', newline='')
             if write_header:
                 # 写入CSV头部（如果文件是新建的）
-                header = "样本索引,EEG通道0,EEG通道1,EEG通道2,EEG通道3,EEG通道4,EEG通道5,EEG通道6,EEG通道7,时间戳,事件标记\n"
-                f.write(header)
+                f.write(CSV_HEADER)
                 f.flush()
 
-            while is_collecting:
-                if duration is not None and time.time() - start_time >= duration:
-                    break
-
-                if ser.in_waiting > 0:
-                    raw_data = ser.read(ser.in_waiting)
-                    buffer.extend(raw_data)
-
-                    while len(buffer) >= 33:
-                        header_pos = -1
-                        for i in range(len(buffer) - 32):
-                            if buffer[i] == HEADER_BYTE and buffer[i + 32] == FOOTER_BYTE:
-                                header_pos = i
-                                break
+        print(f"数据采集开始（{event_label}）...")
+        while is_collecting:
+            if duration is not None and time.time() - start_time >= duration:
+                break
 
-                        if header_pos == -1:
-                            if len(buffer) > 32:
-                                buffer = buffer[-32:]
-                            break
+            if ser.in_waiting > 0:
+                raw_data = ser.read(ser.in_waiting)
+                recv_time = time.time()
+                sample_nums, eeg = decoder.feed(raw_data)
 
-                        packet = buffer[header_pos:header_pos + 33]
-                        parsed = parse_eeg_packet(packet)
+                if len(sample_nums):
+                    # 只在第一次记录时写入事件标签
+                    label = ""
+                    if event_label and not event_recorded:
+                        label = event_label
+                        event_recorded = True
 
-                        if parsed:
-                            # 构建CSV格式的行
-                            data_line = f"{parsed['sample_num']},"
-                            data_line += ",".join([f"{val:.6f}" for val in parsed['eeg_data']])
-                            data_line += f",{parsed['timestamp']},"
+                    if writer is not None:
+                        writer.write_block(sample_nums, eeg, recv_time, label)
+                    else:
+                        # 构建CSV格式的行, 每次串口读取只写入、flush一次
+                        events = [(0, label)] if label else []
+                        f.writelines(format_csv_lines(sample_nums, eeg, recv_time, events))
+                        f.flush()
 
-                            # 只在第一次记录时写入事件标签
-                            if event_label and not event_recorded:
-                                data_line += f"{event_label}\n"
-                                event_recorded = True
-                            else:
-                                data_line += "\n"
-
-                            f.write(data_line)
-                            f.flush()
-
-                        buffer = buffer[header_pos + 33:]
-
-                time.sleep(0.001)
+            time.sleep(0.001)
 
-            print(f"数据采集结束（{event_label}）")
+        if decoder.lost_packets:
+            print(f"检测到丢包: {decoder.lost_packets}")
+        if decoder.duplicate_packets:
+            print(f"检测到重复包: {decoder.duplicate_packets}")
+        print(f"数据采集结束（{event_label}）")
 
     except Exception as e:
         print(f"数据采集错误: {e}")
     finally:
+        if writer is not None:
+            writer.close()
+        if f is not None:
+            f.close()
         if not is_collecting:
             ser.write(b's')
 
@@ -3,18 +3,18 @@
 Amplifiers.
 
 """
+import asyncio
 import socket
 import struct
 import threading
 import time
 from abc import abstractmethod
-from collections import deque
 from typing import List, Optional, Tuple, Dict, Any
 
 import numpy as np
 import pylsl
-import queue
 
+from .latency import LatencyMonitor, AMPLIFIER_STAGES
 from .logger import get_logger
 from .workers import ProcessWorker
 
@@ -22,30 +22,94 @@ logger_amp = get_logger("amplifier")
 logger_marker = get_logger("marker")
 
 
-class RingBuffer(deque):
+class RingBuffer:
     """Online data RingBuffer.
     -author: Lichao Xu
     -Created on: 2021-04-01
     -update log:
-        None
+        Preallocated NumPy storage instead of a deque of per-sample lists.
     Parameters
     ----------
         size: int,
             Size of the RingBuffer.
+        segment: optional,
+            Kept for backward compatibility.
+        n_channels: int,
+            Number of data channels, the trigger column is added on top. If
+            None, the buffer is allocated on the first append.
+        dtype: data-type,
+            Data type of the buffer, by default float32.
     """
 
-    def __init__(self, size=1024, segment=None):
-        """Ring buffer object based on python deque data
-        structure to store data.
+    def __init__(self, size=1024, segment=None, n_channels=None,
+                 dtype=np.float32):
+        """Ring buffer object based on a preallocated, contiguous NumPy
+        array to store data.
+
+        Every sample is written twice, at its slot and one buffer length
+        further, so the latest `size` samples are always contiguous and can
+        be returned as a view without any copy.
 
         Parameters
         ----------
         size : int, optional
             maximum buffer size, by default 1024
         """
-        super(RingBuffer, self).__init__(maxlen=size)
         self.max_size = size
         self.segment = segment
+        self.dtype = dtype
+        self._buffer: Optional[np.ndarray] = None
+        self._pos = 0
+        self._len = 0
+        if n_channels is not None:
+            self._allocate(n_channels + 1)
+
+    def _allocate(self, n_cols):
+        self._buffer = np.zeros((2 * self.max_size, n_cols), dtype=self.dtype)
+
+    def __len__(self):
+        return self._len
+
+    def append(self, sample):
+        """Append a single sample.
+
+        Parameters
+        ----------
+        sample : array_like, shape(n_channels+1,)
+        """
+        self.extend(np.asarray(sample, dtype=self.dtype)[np.newaxis])
+
+    def extend(self, samples):
+        """Append a block of samples with at most two copies.
+
+        Parameters
+        ----------
+        samples : array_like, shape(n_samples, n_channels+1)
+        """
+        samples = np.asarray(samples, dtype=self.dtype)
+        if samples.ndim == 1:
+            samples = samples[np.newaxis]
+        if self._buffer is None:
+            self._allocate(samples.shape[1])
+        size = self.max_size
+        n = len(samples)
+        if n == 0 or size == 0:
+            return
+        if n > size:
+            samples = samples[-size:]
+            n = size
+        pos = self._pos
+        first = min(n, size - pos)
+        for offset in (0, size):
+            self._buffer[offset + pos:offset + pos + first] = samples[:first]
+            self._buffer[offset:offset + n - first] = samples[first:]
+        self._pos = (pos + n) % size
+        self._len = min(self._len + n, size)
+
+    def clear(self):
+        """Drop all samples, keeping the allocated storage."""
+        self._pos = 0
+        self._len = 0
 
     def isfull(self):
         """Whether current buffer is full or not.
@@ -54,17 +118,21 @@ class RingBuffer(deque):
         ----------
         boolean
         """
-        return len(self) == self.max_size
+        return self._len == self.max_size
 
     def get_all(self):
         """Access all current buffer value.
 
         Returns
         ----------
-        list
-            the list of current buffer
+        ndarray, shape(n_samples, n_channels+1)
+            the oldest to the latest sample, a view into the buffer that
+            is only valid until the next append
         """
-        return list(self)
+        if self._buffer is None:
+            return np.empty((0, 0), dtype=self.dtype)
+        start = (self._pos - self._len) % self.max_size if self.max_size else 0
+        return self._buffer[start:start + self._len]
 
 
 class Marker(RingBuffer):
@@ -85,11 +153,13 @@ class Marker(RingBuffer):
             Event label.
         patch_size: int,
             Online data patch delivered everytime
+        n_channels: int,
+            Number of data channels, see RingBuffer.
     """
 
     def __init__(
         self, interval: list, srate: float, events: Optional[List[int]] = None,
-        patch_size: Optional[int] = None
+        patch_size: Optional[int] = None, n_channels: Optional[int] = None
     ):
         self.events = events
         if events is not None:
@@ -126,7 +196,7 @@ class Marker(RingBuffer):
 
         self.countdowns: Dict[str, int] = {}
         self.is_rising = True
-        super().__init__(size=size)
+        super().__init__(size=size, n_channels=n_channels)
 
     def __call__(self, event: int):
         """Record label position.
@@ -178,10 +248,78 @@ class Marker(RingBuffer):
             return True
         return False
 
+    def _next_trigger(self, edges):
+        """Offset of the next sample on which __call__ can do more than
+        decrement the countdowns, or None if there is none."""
+        candidates = [edges[0]] if len(edges) else []
+        if self.events is None and "fixed" not in self.countdowns:
+            candidates.append(0)
+        for value in self.countdowns.values():
+            candidates.append(value - 1)
+            if isinstance(self.patch_size, int) and self.patch_size > 0:
+                w = min(value - 1, self.threshold - 1)
+                w -= w % self.patch_size
+                if w > 0:
+                    candidates.append(value - 1 - w)
+        return min(candidates) if candidates else None
+
+    def process(self, samples):
+        """Append a block of samples and collect the epochs it completes.
+
+        Equivalent to appending the samples one by one and calling the
+        marker on each trigger value, but rising edges are found with NumPy
+        and the samples in between are appended in bulk, so the Python work
+        scales with the number of events instead of the number of samples.
+
+        Parameters
+        ----------
+            samples: array_like, shape(n_samples, n_channels+1),
+                Online data block, the last column is the trigger.
+
+        Returns
+        ----------
+            epochs: list of ndarray,
+                Copies of the epochs completed inside the block.
+        """
+        samples = np.asarray(samples, dtype=self.dtype)
+        if samples.size == 0:
+            return []
+        if samples.ndim == 1:
+            samples = samples[np.newaxis]
+        triggers = samples[:, -1].astype(int)
+        nonzero = triggers != 0
+        prev_zero = np.empty_like(nonzero)
+        prev_zero[0] = self.is_rising
+        prev_zero[1:] = ~nonzero[:-1]
+        rising = nonzero & prev_zero
+        if self.events is not None:
+            rising &= np.isin(triggers, self.events)
+        edges = np.flatnonzero(rising)
+
+        epochs = []
+        pos, n = 0, len(samples)
+        while pos < n:
+            offset = self._next_trigger(edges[np.searchsorted(edges, pos):] - pos)
+            stop = n if offset is None else min(pos + offset, n)
+            if stop > pos:
+                # nothing happens on these samples but the countdowns
+                self.extend(samples[pos:stop])
+                for key in self.countdowns:
+                    self.countdowns[key] -= stop - pos
+                self.is_rising = not nonzero[stop - 1]
+                pos = stop
+            if pos < n:
+                self.extend(samples[pos:pos + 1])
+                if self(triggers[pos]):
+                    epochs.append(self.get_epoch().copy())
+                pos += 1
+        return epochs
+
     def get_epoch(self):
         """
         Fetch data from buffer.
         If the self.patch_size is not None, the data will be instantly sent even though buffer is not full.
+        The epoch is a view into the buffer, copy it before the next append if it has to be kept.
         """
         data = super().get_all()
         if isinstance(self.patch_size, int) and self.threshold_ind > 0:
@@ -189,6 +327,88 @@ class Marker(RingBuffer):
         return data[self.epoch_ind[0]: self.epoch_ind[1]]
 
 
+def recv_exact(sock, view):
+    """Fill a writable buffer from a stream socket.
+
+    Parameters
+    ----------
+        sock: socket.socket,
+            Connected stream socket.
+        view: memoryview,
+            Buffer to fill, partial reads are continued until it is full.
+
+    Raises
+    ----------
+        ConnectionError:
+            If the peer closed the connection.
+    """
+    total = len(view)
+    n = 0
+    while n < total:
+        k = sock.recv_into(view[n:], total - n)
+        if k == 0:
+            raise ConnectionError("connection closed by the amplifier")
+        n += k
+
+
+class SocketReader:
+    """Exact-size reads from a stream socket into reusable buffers.
+
+    Each slot owns one bytearray that is allocated once and only replaced
+    if a larger read is requested, so steady-state streaming does not
+    allocate per packet. A view returned by read() is overwritten by the
+    next read of the same slot; use different slots for data that must
+    stay valid together, e.g. a payload and the frame tail read after it.
+    """
+
+    def __init__(self):
+        self._buffers: Dict[str, memoryview] = {}
+
+    def read(self, sock, num_bytes, slot="data"):
+        """Read exactly num_bytes from sock.
+
+        Parameters
+        ----------
+            sock: socket.socket,
+                Connected stream socket.
+            num_bytes: int,
+                Number of bytes to read.
+            slot: str,
+                Name of the reusable buffer to read into.
+
+        Returns
+        ----------
+            view: memoryview,
+                The received bytes.
+        """
+        num_bytes = int(num_bytes)
+        buf = self._buffers.get(slot)
+        if buf is None or len(buf) < num_bytes:
+            buf = memoryview(bytearray(num_bytes))
+            self._buffers[slot] = buf
+        view = buf[:num_bytes]
+        recv_exact(sock, view)
+        return view
+
+    async def aread(self, sock, num_bytes, slot="data"):
+        """Coroutine version of read() for a non-blocking socket, see
+        hub.AcquisitionHub."""
+        num_bytes = int(num_bytes)
+        buf = self._buffers.get(slot)
+        if buf is None or len(buf) < num_bytes:
+            buf = memoryview(bytearray(num_bytes))
+            self._buffers[slot] = buf
+        view = buf[:num_bytes]
+        loop = asyncio.get_running_loop()
+        n = 0
+        while n < num_bytes:
+            k = await loop.sock_recv_into(sock, view[n:])
+            if k == 0:
+                raise ConnectionError("connection closed by the amplifier")
+            n += k
+        return view
+
+
 class BaseAmplifier:
     """Base Ampifier class.
     -author: Lichao Xu
@@ -200,7 +420,10 @@ class BaseAmplifier:
     def __init__(self):
         self._markers = {}
         self._workers = {}
+        self._preprocessors = {}
         self._exit = threading.Event()
+        # recv, unpack, preprocess, detect and put times, see latency.LatencyMonitor
+        self.latency = LatencyMonitor(AMPLIFIER_STAGES)
 
     @abstractmethod
     def recv(self):
@@ -212,6 +435,8 @@ class BaseAmplifier:
         for work_name in self._workers:
             logger_amp.info("clear marker buffer")
             self._markers[work_name].clear()
+            if work_name in self._preprocessors:
+                self._preprocessors[work_name].reset()
         logger_amp.info("start the loop")
         self._t_loop = threading.Thread(target=self._inner_loop,
                                         name="main_loop")
@@ -223,9 +448,12 @@ class BaseAmplifier:
         logger_amp.info("enter the inner loop")
         while not self._exit.is_set():
             try:
+                t0 = time.perf_counter()
                 samples = self.recv()
-                if samples:
-                    self._detect_event(samples)
+                t_block = time.perf_counter()
+                self.latency.record("recv", t_block - t0)
+                if samples is not None and len(samples):
+                    self._detect_event(samples, t_block)
             except Exception:
                 pass
         logger_amp.info("exit the inner loop")
@@ -236,22 +464,40 @@ class BaseAmplifier:
         self._exit.set()
         logger_amp.info("waiting the child thread exit")
         self._t_loop.join()
+        logger_amp.info("latency of the amplifier loop (ms):\n{}".format(
+            self.latency.summary()))
         self.clear()
 
-    def _detect_event(self, samples):
-        """detect event label"""
+    def _detect_event(self, samples, timestamp=None):
+        """detect event label on a whole block of samples
+
+        timestamp is the time.perf_counter() value at which the block was
+        received, passed on to the workers for the trigger to feedback latency.
+        """
+        samples = np.asarray(samples, dtype=np.float32)
+        # a preprocessor shared by several workers runs once per block
+        processed = {}
         for work_name in self._workers:
-            logger_amp.info("process worker-{}".format(work_name))
+            logger_amp.debug("process worker-{}".format(work_name))
             marker = self._markers[work_name]
             worker = self._workers[work_name]
-            for sample in samples:
-                marker.append(sample)
-                if marker(sample[-1]) and worker.is_alive():
-                    worker.put(marker.get_epoch())
+            block = samples
+            preprocessor = self._preprocessors.get(work_name)
+            if preprocessor is not None:
+                if id(preprocessor) not in processed:
+                    with self.latency.timer("preprocess"):
+                        processed[id(preprocessor)] = preprocessor.process(samples)
+                block = processed[id(preprocessor)]
+            with self.latency.timer("detect"):
+                epochs = marker.process(block)
+            if epochs and worker.is_alive():
+                with self.latency.timer("put"):
+                    for epoch in epochs:
+                        worker.put(epoch, timestamp)
 
     def up_worker(self, name):
         logger_amp.info("up worker-{}".format(name))
-        self._workers['feedback_worker'].start()
+        self._workers[name].start()
 
     def down_worker(self, name):
         logger_amp.info("down worker-{}".format(name))
@@ -260,15 +506,24 @@ class BaseAmplifier:
 
     def register_worker(self, name: str,
                         worker: ProcessWorker,
-                        marker: Marker):
+                        marker: Marker,
+                        preprocessor=None):
+        """Feed the stream through a Marker into a ProcessWorker.
+
+        preprocessor, e.g. a preprocessing.StreamingPreprocessor, filters
+        every block before the Marker, so the epochs arrive already filtered.
+        """
         logger_amp.info("register worker-{}".format(name))
         self._workers[name] = worker
         self._markers[name] = marker
+        if preprocessor is not None:
+            self._preprocessors[name] = preprocessor
 
     def unregister_worker(self, name: str):
         logger_amp.info("unregister worker-{}".format(name))
         del self._markers[name]
         del self._workers[name]
+        self._preprocessors.pop(name, None)
 
     def clear(self):
         logger_amp.info("clear all workers")
@@ -313,6 +568,7 @@ class NeuroScan(BaseAmplifier):
         self.srate = srate
         self.num_chans = num_chans
         self.neuro_link = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._reader = SocketReader()
         # the size of a package in neuroscan data is
         # srate/25*(num_chans+1)*4 bytes
         self.pkg_size = srate / 25 * (num_chans + 1) * 4
@@ -326,39 +582,40 @@ class NeuroScan(BaseAmplifier):
         return (ch_id[0].decode("utf-8"), w_code[0], w_request[0], pkg_size[0])
 
     def _unpack_data(self, num_chans, b_data):
-        fmt = ">" + str((num_chans + 1) * 4) + "B"
+        # little-endian int32 samples, the trigger in the last channel
         samples = (
-            np.array(list(struct.iter_unpack(fmt, b_data)), dtype=np.uint8)
-            .view(np.int32)
+            np.frombuffer(b_data, dtype="<i4")
+            .reshape(-1, num_chans + 1)
             .astype(np.float64)
         )
-        samples[:, -1] = samples[:, -1] - 65280
-        samples[:, :-1] = samples[:, :-1] * 0.0298 * 1e-6
-        return samples.tolist()
-
-    def _recv(self, num_bytes):
-        fragments = []
-        b_count = 0
-        while b_count < num_bytes:
-            try:
-                chunk = self.neuro_link.recv(num_bytes - b_count)
-            except socket.timeout as e:
-                raise e
-            b_count += len(chunk)
-            fragments.append(chunk)
+        samples[:, -1] -= 65280
+        data = samples[:, :-1]
+        data *= 0.0298
+        data *= 1e-6
+        return samples
 
-        b_data = b"".join(fragments)
-        return b_data
+    def _recv(self, num_bytes, slot="data"):
+        # a reusable buffer, valid until the next read of the same slot
+        return self._reader.read(self.neuro_link, num_bytes, slot)
 
     def recv(self):
-        b_header = self._recv(12)
+        b_header = self._recv(12, "header")
         header = self._unpack_header(b_header)
         samples = None
         if header[-1] != 0:
             b_data = self._recv(header[-1])
-            samples = self._unpack_data(self.num_chans, b_data)
+            with self.latency.timer("unpack"):
+                samples = self._unpack_data(self.num_chans, b_data)
         return samples
 
+    async def arecv(self):
+        """recv() for the asyncio acquisition hub."""
+        header = self._unpack_header(await self._reader.aread(self.neuro_link, 12, "header"))
+        if header[-1] != 0:
+            b_data = await self._reader.aread(self.neuro_link, header[-1])
+            return self._unpack_data(self.num_chans, b_data)
+        return None
+
     def send(self, message):
         self.neuro_link.sendall(message)
 
@@ -445,13 +702,14 @@ class Curry8(BaseAmplifier):
         self.srate = srate
         self.num_chans = num_chans
         self.neuro_link = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._reader = SocketReader()
         # the size of a package in neuroscan data is
         # srate/25*(num_chans+1)*4 bytes
         self.pkg_size = srate / 25 * (num_chans + 1) * 4
         self.timeout = 2 * 25 / self.srate
 
     def _unpack_header(self, b_header):
-        ch_id = b_header[:4].decode()
+        ch_id = bytes(b_header[:4]).decode()
         w_code = struct.unpack(">H", b_header[4:6])
         w_request = struct.unpack(">H", b_header[6:8])
         startSample = struct.unpack(">I", b_header[8:12])
@@ -465,32 +723,33 @@ class Curry8(BaseAmplifier):
         samples[:, -1] = samples[:, -1] - 65280
         return samples
 
-    def _recv(self, num_bytes):
-        fragments = b""
-        b_count = 0
-        while b_count < num_bytes:
-            try:
-                chunk = self.neuro_link.recv(num_bytes - b_count)
-            except socket.timeout as e:
-                raise e
-            b_count += len(chunk)
-            fragments += chunk
-
-        b_data = fragments
-        return b_data
+    def _recv(self, num_bytes, slot="data"):
+        # a reusable buffer, valid until the next read of the same slot
+        return self._reader.read(self.neuro_link, num_bytes, slot)
 
     def recv(self):
-        b_header = self._recv(20)
+        b_header = self._recv(20, "header")
         header = self._unpack_header(b_header)
         if header[-1] != 0:
             b_data = self._recv(header[-1])
             if header[0] == "DATA":
                 if header[1] == self.dataType(
                         "Data_Eeg") and header[2] == self.blockType("DataTypeFloat32bit"):
-                    samples = self._unpack_data(self.num_chans, b_data)
-                    return samples.tolist()
+                    with self.latency.timer("unpack"):
+                        samples = self._unpack_data(self.num_chans, b_data)
+                    return samples
         return []
 
+    async def arecv(self):
+        """recv() for the asyncio acquisition hub."""
+        header = self._unpack_header(await self._reader.aread(self.neuro_link, 20, "header"))
+        if header[-1] != 0:
+            b_data = await self._reader.aread(self.neuro_link, header[-1])
+            if header[0] == "DATA" and header[1] == self.dataType("Data_Eeg") \
+                    and header[2] == self.blockType("DataTypeFloat32bit"):
+                return self._unpack_data(self.num_chans, b_data)
+        return None
+
     def send(self, message):
         self.neuro_link.sendall(message)
 
@@ -606,7 +865,7 @@ class Curry8(BaseAmplifier):
             status = 0
             infoList = None
             return status, infoList, header
-        infoListRaw = self._recv(header[-1])
+        infoListRaw = bytes(self._recv(header[-1]))
 
         offset_channelId = 0
         offset_chanLabel = offset_channelId + 4
@@ -777,6 +1036,7 @@ class Neuracle(BaseAmplifier):
         self.srate = srate
         self.num_chans = num_chans
         self.tcp_link = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._reader = SocketReader()
         self._update_time = 0.04
         self.pkg_size = int(
             self._update_time *
@@ -793,25 +1053,31 @@ class Neuracle(BaseAmplifier):
         data = None
         # rs, _, _ = select.select([self.tcp_link], [], [], 9)
         try:
-            raw_data = self.tcp_link.recv(self.pkg_size)
+            # whole packets only, so that samples never split across reads
+            raw_data = self._reader.read(self.tcp_link, self.pkg_size)
         except Exception:
             self.tcp_link.close()
             print("Can not receive data from socket")
         else:
-            data, evt = self._unpack_data(raw_data)
-            data = data.reshape(len(data) // self.num_chans, self.num_chans)
-        return data.tolist()
+            with self.latency.timer("unpack"):
+                data, evt = self._unpack_data(raw_data)
+                data = data.reshape(len(data) // self.num_chans, self.num_chans)
+        return data
+
+    async def arecv(self):
+        """recv() for the asyncio acquisition hub."""
+        raw_data = await self._reader.aread(self.tcp_link, self.pkg_size)
+        data, evt = self._unpack_data(raw_data)
+        return data.reshape(-1, self.num_chans)
 
     def _unpack_data(self, raw):
         len_raw = len(raw)
-        event, hex_data = [], []
+        event: List[Any] = []
         # unpack hex_data in row
-        hex_data = raw[:len_raw - np.mod(len_raw, 4 * self.num_chans)]
-        n_item = int(len(hex_data) / 4 / self.num_chans)
-        format_str = '<' + (str(self.num_chans) + 'f') * n_item
-        unpack_data = struct.unpack(format_str, hex_data)
+        n_item = (len_raw // (4 * self.num_chans)) * self.num_chans
+        unpack_data = np.frombuffer(raw, dtype="<f4", count=n_item)
 
-        return np.asarray(unpack_data), event
+        return unpack_data.astype(np.float64), event
 
     def connect_tcp(self):
         self.tcp_link.connect(self.device_address)
@@ -845,30 +1111,68 @@ class LSLInlet:
 
 
 class DataInlet(LSLInlet):
+    """Data stream inlet pulling into preallocated NumPy buffers.
+
+    Parameters
+    ----------
+        info: pylsl.StreamInfo,
+            Stream to open.
+        max_samples: int,
+            Samples pulled at most per call.
+        delay: float,
+            Samples are released by get_data() only once they are this many
+            seconds old (LSL clock), so that markers which arrive later
+            than the data can still be aligned. 0 releases them at once.
+    """
     dtypes = [[], np.float32, np.float64, None,
               np.int32, np.int16, np.int8, np.int64]
 
-    def __init__(self, info: pylsl.StreamInfo) -> None:
+    def __init__(self, info: pylsl.StreamInfo, max_samples: int = 1024,
+                 delay: float = 0.08) -> None:
         super().__init__(info)
-        # Define two queue for storage the data retrieved from device
-        # and their timestamp range.
-        self.data_queue: queue.Queue[Any] = queue.Queue(3)
-
-    def stream_action(self):
-        samples, ts = self.inlet.pull_chunk(
-            timeout=0.0, max_samples=40)
-        if ts:
-            samples = np.asarray(samples)
-            ts = np.asarray(ts)
-            pack_data = np.hstack((samples, ts.reshape((-1, 1))))
-            self.data_queue.put(pack_data)
+        self.max_samples = max_samples
+        self.delay = delay
+        dtype = self.dtypes[info.channel_format()]
+        self._chunk = np.empty((max_samples, self.channel_count), dtype=dtype)
+        # pulled samples not yet released, timestamps in the last column
+        self._pending = np.empty((4 * max_samples, self.channel_count + 1))
+        self._n_pending = 0
+
+    def stream_action(self, timeout=0.0):
+        """Pull the available samples, return how many."""
+        _, ts = self.inlet.pull_chunk(
+            timeout=timeout, max_samples=self.max_samples, dest_obj=self._chunk)
+        n = len(ts)
+        if n:
+            end = self._n_pending + n
+            if end > len(self._pending):
+                grown = np.empty((2 * end, self.channel_count + 1))
+                grown[:self._n_pending] = self._pending[:self._n_pending]
+                self._pending = grown
+            self._pending[self._n_pending:end, :-1] = self._chunk[:n]
+            self._pending[self._n_pending:end, -1] = ts
+            self._n_pending = end
+        return n
 
     def get_data(self):
-        if self.data_queue.full():
-            data = self.data_queue.get()
-            return data
+        """Samples older than delay, with their timestamps in the last column.
+
+        Returns
+        ----------
+            data: ndarray, shape(n_samples, n_channels+1),
+                Empty if no sample is ready.
+        """
+        pending = self._pending[:self._n_pending]
+        if self.delay > 0:
+            n = int(np.searchsorted(pending[:, -1], pylsl.local_clock() - self.delay, side="right"))
         else:
-            return np.asarray([0])
+            n = self._n_pending
+        data = pending[:n].copy()
+        rest = self._n_pending - n
+        if n and rest:
+            self._pending[:rest] = self._pending[n:self._n_pending]
+        self._n_pending = rest
+        return data
 
 
 class MarkerInlet(LSLInlet):
@@ -891,8 +1195,24 @@ class MarkerInlet(LSLInlet):
         else:
             return []
 
+    def pull_markers(self):
+        """All available markers.
 
-class LSLapps():
+        Returns
+        ----------
+            labels: ndarray, shape(n_markers,)
+            timestamps: ndarray, shape(n_markers,)
+        """
+        values, ts = self.inlet.pull_chunk(timeout=0.0)
+        try:
+            labels = np.array([int(value[0]) for value in values], dtype=np.float64)
+        except Exception:
+            raise ValueError(
+                "The marker values: {} can not be typed into int".format(values))
+        return labels, np.asarray(ts, dtype=np.float64)
+
+
+class LSLapps(BaseAmplifier):
     """An amplifier implementation for Lab streaming layer (LSL) apps.
     LSL ref as: https://github.com/sccn/labstreaminglayer
     The LSL provides many builded apps for communiacting with varities
@@ -906,23 +1226,38 @@ class LSLapps():
     synamp II will append a extra event channel to the raw data channel.
     Because we do not have chance to test each device that LSL supported, so
     please modify this class before using with your own condition.
+
+    Parameters
+    ----------
+        delay: float,
+            How long data is held back for markers to arrive, in seconds,
+            see DataInlet. Larger values tolerate later markers, smaller
+            values lower the latency.
+        max_samples: int,
+            Samples pulled at most per call.
+        poll_interval: float,
+            Sleep when no data is ready, instead of spinning.
     """
 
-    def __init__(self, ):
+    def __init__(self, delay: float = 0.08, max_samples: int = 1024,
+                 poll_interval: float = 1e-3):
         super().__init__()
-        self.marker_inlet = None
-        self.data_inlet = None
+        self.delay = delay
+        self.max_samples = max_samples
+        self.poll_interval = poll_interval
+        self.marker_inlet: Optional[MarkerInlet] = None
+        self.data_inlet: Optional[DataInlet] = None
         self.device_data = None
-        self.marker_data = None
-        self.marker_cache = list()
+        # labels and LSL timestamps of markers not yet merged into data
+        self.marker_labels = np.empty(0)
+        self.marker_times = np.empty(0)
         self.marker_count = 0
         self.streams_count = 0
-        self.pending_stream = []
-        self.data_response = np.zeros(1)
+        self.pending_stream: List[Any] = []
         self.bg_stream_checker = pylsl.ContinuousResolver()
         time.sleep(1.5)
         self.stream_checker_threading = threading.Thread(
-            target=self.stream_checker, name="stream_checker")
+            target=self.stream_checker, name="stream_checker", daemon=True)
         self.stream_checker_threading.start()
 
     def stream_checker(self):
@@ -940,51 +1275,46 @@ class LSLapps():
                     elif info.nominal_srate() != pylsl.IRREGULAR_RATE \
                             and info.channel_format() != pylsl.cf_string:
                         print('Adding data inlet: ' + info.name())
-                        self.data_inlet = DataInlet(info)
+                        self.data_inlet = DataInlet(info, self.max_samples, self.delay)
                     else:
                         print('Don\'t know what to do \
                                 with stream ' + info.name())
             time.sleep(0.5)
 
+    def merge_markers(self, device_data):
+        """Replace the timestamp column of a block by the trigger column.
+
+        Each cached marker goes to the first sample not earlier than it, or
+        the first sample of the block if it arrived late; markers later than
+        the block stay cached for the next one.
+        """
+        timestamps = device_data[:, -1]
+        label_line = np.zeros(len(device_data))
+        if len(self.marker_times):
+            positions = np.searchsorted(timestamps, self.marker_times)
+            inside = positions < len(device_data)
+            label_line[positions[inside]] = self.marker_labels[inside]
+            self.marker_labels = self.marker_labels[~inside]
+            self.marker_times = self.marker_times[~inside]
+        device_data[:, -1] = label_line
+        return device_data
+
     def recv(self):
         if self.marker_inlet is not None:
-            self.marker_data = self.marker_inlet.stream_action()
-        # Check if there are markers retriving from the stream.
-        if self.marker_data:
-            self.marker_cache.append(self.marker_data)
-            # print("Catch a trigger, content is: {}".format(self.marker_data))
+            labels, ts = self.marker_inlet.pull_markers()
+            # Check if there are markers retriving from the stream.
+            if len(ts):
+                self.marker_labels = np.concatenate((self.marker_labels, labels))
+                self.marker_times = np.concatenate((self.marker_times, ts))
+        device_data = None
         if self.data_inlet is not None:
-            self.data_inlet.stream_action()
-            self.data_response = self.data_inlet.get_data()
-        # Check if there are devices data from the stream. Because we kept
-        # a buffer, so the data will be delay about 80points. In case we
-        # miss the labels
-        if self.data_response.any():
-            device_data = self.data_response
-            epoch_length = device_data.shape[0]
-            # Create a zero vector as label line
-            label_line = np.zeros(epoch_length)
-            # Find the label position
-            for label in self.marker_cache:
-                position = device_data[:, -1].searchsorted(label[-1])
-                # The smaller index in the marker cache means a earlier label
-                if position >= epoch_length:
-                    # IF larger than the epoch max index, we say the timestamp
-                    # is out of the range of current device epoch.
-                    break
-                else:
-                    label_line[position] = int(label[0])
-                    # print("The trigger position has been \
-                    #       assigned to {}".format(position))
-                    # print("LSL clock delta: \
-                    #         {}".format(label[-1]-device_data[position, -1]))
-                    # POP out the current index
-                    self.marker_cache.remove(label)
-            # Replaced the last column of device_data as the trigger column
-            device_data[:, -1] = label_line
-            return device_data.tolist()
-        else:
-            return []
+            with self.latency.timer("unpack"):
+                self.data_inlet.stream_action()
+                device_data = self.data_inlet.get_data()
+        if device_data is None or not len(device_data):
+            time.sleep(self.poll_interval)
+            return None
+        return self.merge_markers(device_data)
 
     def start_trans(self):
         time.sleep(1e-2)
@@ -1060,6 +1390,7 @@ class HTOnlineSystem(BaseAmplifier):
         self.srate = srate
         self.packet_samples = packet_samples
         self.tcp_link = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._reader = SocketReader()
         self.num_chans = num_chans
         self.packet_points = (num_chans + 1) * packet_samples
         self.pkg_size = self.packet_points * 4
@@ -1117,17 +1448,16 @@ class HTOnlineSystem(BaseAmplifier):
 
         Returns
         ----------
-        samples :  list
+        samples :  ndarray, shape(packet_samples, num_chans+1)
             Unpacked data.
 
         """
 
-        fmt = "<" + str(self.packet_points) + "f"
-        samples = np.array(struct.unpack(fmt, b_data))  # 解开包
-        samples = samples.reshape(-1, self.num_chans + 1)
-        return samples.tolist()
+        samples = np.frombuffer(b_data, dtype="<f4", count=int(self.packet_points))  # 解开包
+        samples = samples.reshape(-1, self.num_chans + 1).astype(np.float64)
+        return samples
 
-    def _recv(self, num_bytes):
+    def _recv(self, num_bytes, slot="data"):
         """
         Receive the specified bytes of data.
 
@@ -1136,31 +1466,23 @@ class HTOnlineSystem(BaseAmplifier):
         Created on: 2023-12-4
 
         update log:
+            Read into a reusable buffer with recv_into.
 
         Parameters
         ----------
         num_bytes: int
             Number of bytes to accept.
+        slot: str
+            Reusable buffer to read into, see SocketReader.
 
         Returns
         ----------
-        b_data:  bytes
-            Received data of specified byte size.
+        b_data:  memoryview
+            Received data of specified byte size, valid until the next read of the same slot.
 
         """
 
-        fragments = []
-        b_count = 0
-        while b_count < num_bytes:
-            try:
-                chunk = self.tcp_link.recv(num_bytes - b_count)
-            except socket.timeout as e:
-                raise e
-            b_count += len(chunk)
-            fragments.append(chunk)
-
-        b_data = b"".join(fragments)
-        return b_data
+        return self._reader.read(self.tcp_link, num_bytes, slot)
 
     def recv(self):
         """
@@ -1171,32 +1493,57 @@ class HTOnlineSystem(BaseAmplifier):
         Created on: 2023-12-4
 
         update log:
+            Skip the frames that are not data packets with their tail, as arecv.
 
         Parameters
         ----------
 
         Returns
         ----------
-        samples:  bytes
-            An unpacked data packet.
+        samples:  ndarray, shape(packet_samples, num_chans+1) or None
+            An unpacked data packet, None for other frames.
 
         """
 
         samples = None
         try:
-            b_header = self._recv(8)
+            b_header = self._recv(8, "header")
             header = self._unpack_header(b_header)
-            if header[-1] == self.pkg_size:
-                raw_data = self._recv(self.pkg_size)
-                self._recv(1)
+            if header[-1] != self.pkg_size:
+                # attribute replies are not data, skip them with their tail
+                self._recv(header[-1] + 1, "tail")
+                return None
+            raw_data = self._recv(self.pkg_size)
+            self._recv(1, "tail")
 
         except Exception:
             self.tcp_link.close()
             print("Can not receive data from socket")
         else:
-            samples = self._unpack_data(raw_data)
+            with self.latency.timer("unpack"):
+                samples = self._unpack_data(raw_data)
         return samples
 
+    async def arecv(self):
+        """
+        recv() for the asyncio acquisition hub.
+
+        Returns
+        ----------
+        samples:  ndarray, shape(packet_samples, num_chans+1) or None
+            An unpacked data packet, None for other frames.
+
+        """
+
+        header = self._unpack_header(await self._reader.aread(self.tcp_link, 8, "header"))
+        if header[-1] != self.pkg_size:
+            # attribute replies are not data, skip them with their tail
+            await self._reader.aread(self.tcp_link, header[-1] + 1, "tail")
+            return None
+        raw_data = await self._reader.aread(self.tcp_link, self.pkg_size)
+        await self._reader.aread(self.tcp_link, 1, "tail")
+        return self._unpack_data(raw_data)
+
     def send(self, message):
         """
         Send command.
@@ -1323,7 +1670,7 @@ class HTOnlineSystem(BaseAmplifier):
         if header[-1] == attr_nums:
             b_data = self._recv(attr_nums)
             samples = struct.unpack("<" + str(attr_nums) + "B", b_data)
-            self._recv(1)  # 帧尾
+            self._recv(1, "tail")  # 帧尾
         chs_list = []
         ch = ""
         for sample in samples:
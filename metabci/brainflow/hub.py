@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+# License: MIT License
+"""
+Asyncio acquisition hub.
+
+One event loop drives several amplifiers at once, e.g. two NeuroScan streams
+for hyperscanning plus an LSL marker stream, instead of one blocking thread
+per device. Every block is stamped on the common hub clock
+(time.perf_counter) and handed to the registered consumers; registered
+workers are fed through the usual Marker/ProcessWorker pipeline.
+
+"""
+import asyncio
+import functools
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pylsl
+
+from .amplifiers import Marker
+from .latency import LatencyMonitor, AMPLIFIER_STAGES
+from .logger import get_logger
+from .workers import ProcessWorker
+
+logger_hub = get_logger("hub")
+
+# consumer(device name, samples (n_samples, n_channels+1), hub timestamps (n_samples,))
+Consumer = Callable[[str, np.ndarray, np.ndarray], None]
+
+
+class _Device:
+    def __init__(self, name, amplifier, srate):
+        self.name = name
+        self.amplifier = amplifier
+        self.srate = srate
+        # (hub time, label) of markers not yet written into a block
+        self.pending_markers: List[Tuple[float, float]] = []
+
+
+class AcquisitionHub:
+    """Drive several amplifiers from one asyncio event loop.
+
+    Devices are connected and configured with their own methods as usual
+    (connect_tcp, start_acq, the start_trans command, ...); the hub only
+    takes over the data stream. Any amplifier with an ``arecv()`` coroutine
+    can be added, i.e. NeuroScan, Curry8, Neuracle and HTOnlineSystem. Their
+    sockets are switched to non-blocking mode while the hub runs.
+
+    Parameters
+    ----------
+        clock: callable,
+            Common clock of all streams, by default time.perf_counter.
+
+    Tip
+    ----
+    ..  code-block:: python
+        :linenos:
+        :caption: two amplifiers and an LSL marker stream
+
+        hub = AcquisitionHub()
+        hub.add_device('ns1', ns1)
+        hub.add_device('ns2', ns2)
+        hub.add_marker_stream(marker_inlet)
+        hub.register_worker('ssvep', worker, marker, device='ns1')
+        hub.up_worker('ssvep')
+        hub.start()
+        ...
+        hub.stop()
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter):
+        self.clock = clock
+        self._devices: Dict[str, _Device] = {}
+        self._marker_streams: List[Tuple[Any, Optional[List[str]]]] = []
+        self._consumers: Dict[str, List[Consumer]] = {}
+        self._workers: Dict[str, ProcessWorker] = {}
+        self._markers: Dict[str, Marker] = {}
+        self._worker_devices: Dict[str, str] = {}
+        self._preprocessors: Dict[str, Any] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stop_event: Optional[asyncio.Event] = None
+        self._t_loop: Optional[threading.Thread] = None
+        self._error: Optional[BaseException] = None
+        self.latency = LatencyMonitor(AMPLIFIER_STAGES)
+
+    def add_device(self, name: str, amplifier, srate: Optional[float] = None):
+        """Add an amplifier whose stream the hub should read.
+
+        Parameters
+        ----------
+            name: str,
+                Device name used by consumers and workers.
+            amplifier: BaseAmplifier,
+                Connected amplifier with an arecv() coroutine.
+            srate: float,
+                Sampling rate, by default amplifier.srate; used to date the
+                samples of a block back from its arrival time.
+        """
+        if not hasattr(amplifier, "arecv"):
+            raise TypeError("{} has no arecv() coroutine".format(type(amplifier).__name__))
+        self._devices[name] = _Device(name, amplifier, srate or amplifier.srate)
+        self._consumers.setdefault(name, [])
+
+    def add_marker_stream(self, inlet, devices: Optional[List[str]] = None):
+        """Merge an LSL marker stream into the trigger column of devices.
+
+        Parameters
+        ----------
+            inlet: pylsl.StreamInlet,
+                Inlet of an irregular-rate marker stream with numeric labels.
+            devices: list of str,
+                Devices to mark, by default all of them.
+        """
+        self._marker_streams.append((inlet, devices))
+
+    def add_consumer(self, device: str, consumer: Consumer):
+        """Call consumer(device, samples, timestamps) for every block of a device."""
+        self._consumers.setdefault(device, []).append(consumer)
+
+    def register_worker(self, name: str, worker: ProcessWorker, marker: Marker, device: str,
+                        preprocessor=None):
+        """Feed a device through a Marker into a ProcessWorker.
+
+        preprocessor filters every block of the device before the Marker,
+        see BaseAmplifier.register_worker.
+        """
+        logger_hub.info("register worker-{} on {}".format(name, device))
+        self._workers[name] = worker
+        self._markers[name] = marker
+        self._worker_devices[name] = device
+        if preprocessor is not None:
+            self._preprocessors[name] = preprocessor
+
+    def unregister_worker(self, name: str):
+        logger_hub.info("unregister worker-{}".format(name))
+        del self._workers[name]
+        del self._markers[name]
+        del self._worker_devices[name]
+        self._preprocessors.pop(name, None)
+
+    def up_worker(self, name: str):
+        logger_hub.info("up worker-{}".format(name))
+        self._workers[name].start()
+
+    def down_worker(self, name: str):
+        logger_hub.info("down worker-{}".format(name))
+        self._workers[name].stop()
+        self._workers[name].clear_queue()
+
+    def _dispatch(self, device: _Device, samples: np.ndarray, t_block: float):
+        samples = np.asarray(samples, dtype=np.float32)
+        n = len(samples)
+        timestamps = t_block - (n - 1 - np.arange(n)) / device.srate
+        if device.pending_markers:
+            # markers not later than the last sample go to their nearest sample,
+            # markers that arrived too late for their block to its first sample
+            due = [m for m in device.pending_markers if m[0] <= timestamps[-1]]
+            device.pending_markers = [m for m in device.pending_markers if m[0] > timestamps[-1]]
+            for t, label in due:
+                samples[int(np.searchsorted(timestamps, t)), -1] = label
+        for consumer in self._consumers[device.name]:
+            consumer(device.name, samples, timestamps)
+        processed: Dict[int, np.ndarray] = {}
+        for name, worker_device in self._worker_devices.items():
+            if worker_device != device.name:
+                continue
+            block = samples
+            preprocessor = self._preprocessors.get(name)
+            if preprocessor is not None:
+                if id(preprocessor) not in processed:
+                    with self.latency.timer("preprocess"):
+                        processed[id(preprocessor)] = preprocessor.process(samples)
+                block = processed[id(preprocessor)]
+            with self.latency.timer("detect"):
+                epochs = self._markers[name].process(block)
+            worker = self._workers[name]
+            if epochs and worker.is_alive():
+                with self.latency.timer("put"):
+                    for epoch in epochs:
+                        worker.put(epoch, t_block)
+
+    async def _read_device(self, device: _Device):
+        amplifier = device.amplifier
+        while True:
+            t0 = self.clock()
+            try:
+                samples = await amplifier.arecv()
+            except ConnectionError:
+                logger_hub.info("{} disconnected".format(device.name))
+                return
+            t_block = self.clock()
+            self.latency.record("recv", t_block - t0)
+            if samples is not None and len(samples):
+                self._dispatch(device, samples, t_block)
+
+    async def _read_markers(self, inlet, devices, poll_timeout=0.05):
+        loop = asyncio.get_running_loop()
+        # LSL clock to hub clock, plus the offset of the remote marker clock
+        correction = await loop.run_in_executor(None, inlet.time_correction)
+        offset = self.clock() - pylsl.local_clock() + correction
+        targets = devices if devices is not None else list(self._devices)
+        while True:
+            # blocks in the executor up to poll_timeout instead of busy-waiting
+            labels, stamps = await loop.run_in_executor(None, inlet.pull_chunk, poll_timeout)
+            for label, ts in zip(labels, stamps):
+                value = float(label[0])
+                for name in targets:
+                    self._devices[name].pending_markers.append((ts + offset, value))
+
+    @staticmethod
+    def _task_done(source: str, task: asyncio.Future):
+        # log a failed stream as soon as it stops, not only when the hub does
+        if not task.cancelled() and task.exception() is not None:
+            logger_hub.error("{} failed".format(source), exc_info=task.exception())
+
+    async def _main(self):
+        self._stop_event = asyncio.Event()
+        sources = [(device.name, self._read_device(device)) for device in self._devices.values()]
+        sources += [("marker stream {}".format(i), self._read_markers(inlet, devices))
+                    for i, (inlet, devices) in enumerate(self._marker_streams)]
+        tasks = []
+        for source, coro in sources:
+            task = asyncio.ensure_future(coro)
+            task.add_done_callback(functools.partial(self._task_done, source))
+            tasks.append(task)
+        await self._stop_event.wait()
+        for task in tasks:
+            task.cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        # cancelled tasks return CancelledError, which is not an Exception
+        return [result for result in results if isinstance(result, Exception)]
+
+    def run(self):
+        """Run the hub in the calling thread until stop() is called.
+
+        Raises the first exception of a device or marker stream, if any;
+        every failure is logged when it happens.
+        """
+        for device in self._devices.values():
+            device.amplifier.set_timeout(0)
+        self._loop = asyncio.new_event_loop()
+        try:
+            errors = self._loop.run_until_complete(self._main())
+        finally:
+            self._loop.close()
+            self._loop = None
+            for device in self._devices.values():
+                device.amplifier.set_timeout(getattr(device.amplifier, "timeout", None))
+        if errors:
+            raise errors[0]
+
+    def _run_thread(self):
+        try:
+            self.run()
+        except BaseException as e:
+            self._error = e
+
+    def start(self):
+        """Run the hub in a background thread."""
+        logger_hub.info("start the hub")
+        self._error = None
+        self._t_loop = threading.Thread(target=self._run_thread, name="hub_loop")
+        self._t_loop.start()
+
+    def stop(self):
+        """Stop the hub and wait for its thread.
+
+        Re-raises the exception that ended a device or marker stream, see run().
+        """
+        logger_hub.info("stop the hub")
+        while self._t_loop is not None and self._t_loop.is_alive() and self._stop_event is None:
+            time.sleep(1e-3)
+        if self._loop is not None and self._stop_event is not None:
+            self._loop.call_soon_threadsafe(self._stop_event.set)
+        if self._t_loop is not None:
+            self._t_loop.join()
+            self._t_loop = None
+        self._stop_event = None
+        logger_hub.info("latency of the hub (ms):\n{}".format(self.latency.summary()))
+        error, self._error = self._error, None
+        if error is not None:
+            raise error
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+# License: MIT License
+"""
+Latency instrumentation of the online pipeline.
+
+Every stage keeps a histogram with logarithmic bins, so recording a duration
+is a couple of arithmetic operations and percentiles can be queried at any
+time without storing the individual samples.
+
+"""
+import math
+import multiprocessing
+import time
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+# stages timed in the amplifier thread
+AMPLIFIER_STAGES = ("recv", "unpack", "preprocess", "detect", "put")
+# stages timed in the worker process; predict and feedback are recorded by consume()
+WORKER_STAGES = ("queue", "consume", "predict", "feedback", "trigger_to_feedback")
+
+
+class _StageTimer:
+    __slots__ = ("monitor", "stage", "t0")
+
+    def __init__(self, monitor, stage):
+        self.monitor = monitor
+        self.stage = stage
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.monitor.record(self.stage, time.perf_counter() - self.t0)
+        return False
+
+
+class LatencyMonitor:
+    """Per-stage latency histograms.
+    Parameters
+    ----------
+        stages: sequence of str,
+            Names of the timed stages.
+        shared: bool,
+            Keep the histograms in shared memory, so that a monitor created
+            before a ProcessWorker starts can be written by the worker and
+            read by the main process. By default False.
+        min_latency: float,
+            Lower edge of the first bin in seconds, by default 1 us.
+        max_latency: float,
+            Upper edge of the last bin in seconds, by default 100 s.
+        bins_per_decade: int,
+            Histogram resolution, by default 20 (about 12% per bin).
+    """
+
+    def __init__(
+        self,
+        stages: Sequence[str],
+        shared: bool = False,
+        min_latency: float = 1e-6,
+        max_latency: float = 1e2,
+        bins_per_decade: int = 20,
+    ):
+        self.stages = tuple(stages)
+        self._index = {stage: i for i, stage in enumerate(self.stages)}
+        self._log_min = math.log10(min_latency)
+        self._scale = bins_per_decade
+        self.n_bins = int(round((math.log10(max_latency) - self._log_min) * bins_per_decade))
+        # bin 0 underflow, bin n_bins+1 overflow
+        self.edges = 10 ** (self._log_min + np.arange(self.n_bins + 1) / bins_per_decade)
+        n_stages = len(self.stages)
+        self._raw: Optional[Tuple[Any, Any]] = None
+        if shared:
+            self._raw = (
+                multiprocessing.RawArray("q", n_stages * (self.n_bins + 2)),
+                # total and maximum of each stage
+                multiprocessing.RawArray("d", n_stages * 2),
+            )
+        self._wrap()
+        self.enabled = True
+
+    def _wrap(self):
+        n_stages = len(self.stages)
+        if self._raw is None:
+            self._counts = np.zeros((n_stages, self.n_bins + 2), dtype=np.int64)
+            self._totals = np.zeros((n_stages, 2), dtype=np.float64)
+        else:
+            self._counts = np.frombuffer(self._raw[0], dtype=np.int64).reshape(n_stages, -1)
+            self._totals = np.frombuffer(self._raw[1], dtype=np.float64).reshape(n_stages, 2)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self._raw is not None:
+            # the shared arrays are passed on, not the copied numpy views
+            del state["_counts"], state["_totals"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self._raw is not None:
+            self._wrap()
+
+    def record(self, stage: str, seconds: float):
+        """Add one duration to the histogram of a stage."""
+        if not self.enabled:
+            return
+        i = self._index[stage]
+        if seconds <= 0:
+            b = 0
+        else:
+            b = int((math.log10(seconds) - self._log_min) * self._scale) + 1
+            b = min(max(b, 0), self.n_bins + 1)
+        self._counts[i, b] += 1
+        totals = self._totals[i]
+        totals[0] += seconds
+        if seconds > totals[1]:
+            totals[1] = seconds
+
+    def since(self, stage: str, t0: float):
+        """Record the time elapsed since the time.perf_counter() value t0."""
+        self.record(stage, time.perf_counter() - t0)
+
+    def timer(self, stage: str):
+        """Context manager timing its body as one sample of a stage."""
+        return _StageTimer(self, stage)
+
+    def reset(self):
+        """Drop all recorded samples."""
+        self._counts[...] = 0
+        self._totals[...] = 0
+
+    def percentile(self, stage: str, q: float) -> float:
+        """Approximate q-th percentile of a stage in seconds.
+
+        The upper edge of the bin holding the percentile is returned, capped
+        by the largest recorded value, so the estimate errs on the slow side.
+        """
+        i = self._index[stage]
+        counts = self._counts[i]
+        n = counts.sum()
+        if n == 0:
+            return float("nan")
+        b = int(np.searchsorted(np.cumsum(counts), q / 100 * n))
+        upper = self.edges[min(b, self.n_bins)]
+        return float(min(upper, self._totals[i, 1]))
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Count, mean, p50, p95, p99 and maximum of every recorded stage, in seconds."""
+        results = {}
+        for i, stage in enumerate(self.stages):
+            n = int(self._counts[i].sum())
+            if n == 0:
+                continue
+            results[stage] = {
+                "count": n,
+                "mean": float(self._totals[i, 0] / n),
+                "p50": self.percentile(stage, 50),
+                "p95": self.percentile(stage, 95),
+                "p99": self.percentile(stage, 99),
+                "max": float(self._totals[i, 1]),
+            }
+        return results
+
+    def summary(self) -> str:
+        """Table of stats() in milliseconds."""
+        lines = ["{:<20}{:>8}{:>10}{:>10}{:>10}{:>10}{:>10}".format(
+            "stage", "count", "mean", "p50", "p95", "p99", "max")]
+        for stage, s in self.stats().items():
+            lines.append("{:<20}{:>8}{:>10.3f}{:>10.3f}{:>10.3f}{:>10.3f}{:>10.3f}".format(
+                stage, s["count"], *(1e3 * s[k] for k in ("mean", "p50", "p95", "p99", "max"))))
+        return "\n".join(lines)
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+# License: MIT License
+"""
+Persistent store of fitted online models.
+
+ProcessWorker.pre() typically reads the training recordings, epochs them and
+fits a brainda estimator every time a worker starts. ModelCache keys the
+fitted artifact (estimators, filter banks, references, channel indices, ...)
+by the training files, the paradigm parameters, the estimator
+hyperparameters and the code, so an unchanged setup is loaded from disk
+instead of being fitted again.
+
+"""
+import functools
+import hashlib
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Sequence, Union
+
+import joblib
+import numpy as np
+
+from .logger import get_logger
+
+logger_cache = get_logger("model_cache")
+
+# bump to invalidate every artifact written by an older layout, e.g. when
+# the attributes of a pickled estimator change
+CACHE_VERSION = 2
+
+
+def default_cache_dir() -> str:
+    """MNE_DATA/metabci-models, next to the datasets brainda downloads."""
+    root = os.environ.get("MNE_DATA", os.path.join(os.path.expanduser("~"), "mne_data"))
+    return os.path.join(root, "metabci-models")
+
+
+@functools.lru_cache(maxsize=None)
+def package_signature() -> str:
+    """Hash of the metabci sources, computed once per process.
+
+    Part of every key: artifacts usually hold brainda estimators pickled
+    with the fitted attributes of the code that wrote them, whether or not
+    the estimator appears among the parameters.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    h = hashlib.sha256()
+    for folder, dirs, files in os.walk(root):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith(".py"):
+                filename = os.path.join(folder, name)
+                h.update(os.path.relpath(filename, root).encode("utf-8"))
+                with open(filename, "rb") as f:
+                    h.update(f.read())
+    return h.hexdigest()
+
+
+def _code_signature(cls) -> str:
+    """Hash of the source files defining a class and its bases.
+
+    A cached estimator is only loaded by the code that pickled it, since a
+    change of its fitted attributes would break the loaded object.
+    """
+    h = hashlib.sha256()
+    for klass in cls.__mro__:
+        filename = getattr(sys.modules.get(klass.__module__), "__file__", None)
+        if filename is None or not os.path.isfile(filename):
+            h.update(klass.__module__.encode("utf-8"))
+            continue
+        with open(filename, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def _canonical(obj):
+    """JSON-friendly form of a parameter value with a stable representation."""
+    if hasattr(obj, "get_params") and hasattr(obj, "fit"):
+        # an (unfitted) estimator is identified by its class and hyperparameters
+        return {
+            "__estimator__": "{}.{}".format(type(obj).__module__, type(obj).__qualname__),
+            "code": _code_signature(type(obj)),
+            "params": _canonical(obj.get_params(deep=False)),
+        }
+    if isinstance(obj, np.ndarray):
+        return {
+            "__ndarray__": hashlib.sha256(np.ascontiguousarray(obj).tobytes()).hexdigest(),
+            "dtype": str(obj.dtype),
+            "shape": list(obj.shape),
+        }
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, dict):
+        return {str(k): _canonical(v) for k, v in sorted(obj.items(), key=lambda kv: str(kv[0]))}
+    if isinstance(obj, (list, tuple)):
+        return [_canonical(v) for v in obj]
+    if isinstance(obj, (str, int, float, bool)) or obj is None:
+        return obj
+    if callable(obj):
+        return "{}.{}".format(getattr(obj, "__module__", ""), getattr(obj, "__qualname__", repr(obj)))
+    return repr(obj)
+
+
+def _file_signature(filename: Union[str, Path]):
+    stat = os.stat(filename)
+    return [os.path.abspath(filename), stat.st_size, stat.st_mtime_ns]
+
+
+class ModelCache:
+    """Disk cache of fitted model artifacts.
+    Parameters
+    ----------
+        cache_dir: str,
+            Folder of the artifacts, by default MNE_DATA/metabci-models.
+        compress: int,
+            joblib compression level, by default 0 which loads fastest.
+
+    Tip
+    ----
+    ..  code-block:: python
+        :linenos:
+        :caption: caching the model fitted in ProcessWorker.pre()
+
+        def pre(self):
+            cache = ModelCache()
+            artifact = cache.get_or_fit(
+                self.run_files,
+                dict(chs=self.pick_chs, interval=self.stim_interval,
+                     labels=self.stim_labels, srate=self.srate),
+                self.fit)
+            self.estimator = artifact['estimator']
+            self.ch_ind = artifact['ch_ind']
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, compress: int = 0):
+        self.cache_dir = cache_dir if cache_dir is not None else default_cache_dir()
+        self.compress = compress
+
+    def key(self, files: Sequence[Union[str, Path]], params: Optional[Dict[str, Any]] = None) -> str:
+        """Hash of the training files and the parameters.
+
+        Files are identified by absolute path, size and modification time,
+        so they are not read. Estimators among the parameters are identified
+        by class, get_params() and the source of the modules defining them,
+        arrays by their content. Any change of the metabci sources also
+        changes every key, see package_signature().
+
+        Parameters
+        ----------
+            files: sequence of str,
+                Training recordings.
+            params: dict,
+                Paradigm parameters and estimator hyperparameters.
+
+        Returns
+        ----------
+            key: str,
+                Hex digest naming the artifact.
+        """
+        description = {
+            "version": CACHE_VERSION,
+            "code": package_signature(),
+            "files": [_file_signature(f) for f in files],
+            "params": _canonical(params or {}),
+        }
+        blob = json.dumps(description, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ".joblib")
+
+    def load(self, key: str) -> Optional[Any]:
+        """Cached artifact of a key, None if there is none or it is unreadable."""
+        filename = self.path(key)
+        if not os.path.isfile(filename):
+            return None
+        try:
+            return joblib.load(filename)
+        except Exception as e:
+            logger_cache.warning("ignore unreadable model cache {}: {}".format(filename, e))
+            return None
+
+    def save(self, key: str, artifact: Any) -> str:
+        """Write an artifact atomically, readers never see a partial file."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                joblib.dump(artifact, f, compress=self.compress)
+            os.replace(tmp, self.path(key))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return self.path(key)
+
+    def get_or_fit(
+        self,
+        files: Sequence[Union[str, Path]],
+        params: Optional[Dict[str, Any]],
+        fit: Callable[[], Any],
+        force_update: bool = False,
+    ) -> Any:
+        """Cached artifact, fitted and stored with fit() on a miss.
+
+        Parameters
+        ----------
+            files: sequence of str,
+                Training recordings, see key().
+            params: dict,
+                Paradigm parameters and estimator hyperparameters, see key().
+            fit: callable,
+                Called without arguments to build the artifact, e.g. a dict
+                of the fitted estimator, filter bank and references.
+            force_update: bool,
+                Fit again even if a cached artifact exists, by default False.
+        """
+        key = self.key(files, params)
+        if not force_update:
+            artifact = self.load(key)
+            if artifact is not None:
+                logger_cache.info("load cached model {}".format(key[:12]))
+                return artifact
+        logger_cache.info("fit model {}".format(key[:12]))
+        artifact = fit()
+        self.save(key, artifact)
+        return artifact
+
+    def clear(self):
+        """Remove every cached artifact."""
+        if not os.path.isdir(self.cache_dir):
+            return
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".joblib"):
+                os.remove(os.path.join(self.cache_dir, name))
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+# License: MIT License
+"""
+Block-streaming online preprocessing.
+
+The stages keep their filter state between packets, so every sample is
+filtered exactly once as it arrives instead of filtering each epoch again
+with a zero-phase filter once the trigger countdown completes. Epochs cut
+by the Marker are then already filtered, decimated and split into
+sub-bands.
+
+All filters are causal: their group delay shifts the data with respect to
+the trigger column, which can be compensated by moving the Marker interval.
+
+"""
+from typing import List, Optional, Sequence
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import firwin, sosfilt, sosfilt_zi
+
+
+class CausalFilter:
+    """Second-order-sections IIR filter carrying its state across blocks.
+    Parameters
+    ----------
+        sos: ndarray, shape(n_sections, 6),
+            Filter coefficients, e.g. one band of generate_filterbank.
+        n_channels: int,
+            Number of filtered channels.
+    """
+
+    def __init__(self, sos: np.ndarray, n_channels: int):
+        self.sos = np.atleast_2d(np.asarray(sos, dtype=np.float64))
+        self.n_channels = n_channels
+        # step response state, scaled by the first sample to avoid the
+        # transient of the DC offset
+        self._zi_unit = sosfilt_zi(self.sos)[:, :, np.newaxis]
+        self.zi: Optional[np.ndarray] = None
+
+    def reset(self):
+        self.zi = None
+
+    def process(self, x: np.ndarray) -> np.ndarray:
+        """Filter a block of shape (n_samples, n_channels) along the samples."""
+        if len(x) == 0:
+            return np.asarray(x, dtype=np.float64)
+        if self.zi is None:
+            self.zi = self._zi_unit * np.asarray(x[0], dtype=np.float64)
+        y, self.zi = sosfilt(self.sos, x, axis=0, zi=self.zi)
+        return y
+
+
+class Decimator:
+    """Anti-aliased integer decimation carrying its state across blocks.
+
+    Polyphase evaluation: the FIR low-pass filter is only computed at the
+    kept samples, so the cost is 1/factor of filtering at the input rate.
+    Non-zero trigger values are moved to the next kept sample instead of
+    being dropped.
+
+    Parameters
+    ----------
+        factor: int,
+            Decimation factor.
+        n_channels: int,
+            Number of data channels.
+        n_taps: int,
+            FIR length, by default 20*factor+1 as in scipy.signal.decimate.
+    """
+
+    def __init__(self, factor: int, n_channels: int, n_taps: Optional[int] = None):
+        self.factor = int(factor)
+        self.n_channels = n_channels
+        if n_taps is None:
+            n_taps = 20 * self.factor + 1
+        self.h = firwin(n_taps, 1.0 / self.factor, window="hamming")
+        self._h_rev = self.h[::-1].copy()
+        self.reset()
+
+    def reset(self):
+        self._history: Optional[np.ndarray] = None
+        self._phase = 0
+        self._pending_trigger = 0.0
+
+    @property
+    def delay(self) -> float:
+        """Group delay in input samples."""
+        return (len(self.h) - 1) / 2
+
+    def process(self, x: np.ndarray, triggers: Optional[np.ndarray] = None):
+        """Decimate a block of shape (n_samples, n_channels).
+
+        Returns
+        ----------
+            y: ndarray, shape(n_kept, n_channels),
+                Decimated data.
+            y_triggers: ndarray, shape(n_kept,),
+                Trigger of every kept sample, only if triggers is given.
+        """
+        n = len(x)
+        if n == 0:
+            y = np.empty((0, self.n_channels))
+            return y if triggers is None else (y, np.empty(0))
+        n_hist = len(self.h) - 1
+        if self._history is None:
+            self._history = np.repeat(np.asarray(x[:1], dtype=np.float64), n_hist, axis=0)
+        buf = np.concatenate((self._history, x), axis=0)
+        kept = np.arange(self._phase, n, self.factor)
+        # window i covers buf[i:i+n_taps], i.e. the taps ending at block sample i
+        windows = sliding_window_view(buf, len(self.h), axis=0)
+        y = windows[kept] @ self._h_rev
+        self._history = buf[len(buf) - n_hist:]
+        self._phase = (self._phase - n) % self.factor
+        if triggers is None:
+            return y
+        y_triggers = np.zeros(len(kept))
+        events = np.flatnonzero(triggers)
+        if self._pending_trigger and len(kept):
+            y_triggers[0] = self._pending_trigger
+            self._pending_trigger = 0.0
+        if len(events):
+            target = np.searchsorted(kept, events)
+            inside = target < len(kept)
+            # the last trigger of a group wins
+            y_triggers[target[inside]] = triggers[events[inside]]
+            if not inside.all():
+                self._pending_trigger = float(triggers[events[~inside][-1]])
+        return y, y_triggers
+
+
+class StreamingPreprocessor:
+    """Per-packet preprocessing of an amplifier stream.
+
+    Filters with ``sos`` at the input rate, decimates, then splits into
+    the sub-bands of ``filterbank`` at the decimated rate. The output keeps
+    the trigger column last and stacks the sub-bands band after band, so a
+    Marker built with ``n_channels=preprocessor.n_outputs`` cuts epochs of
+    already processed data; split_bands() unfolds them.
+
+    Parameters
+    ----------
+        n_channels: int,
+            Number of data channels of the amplifier, without the trigger.
+        sos: ndarray, shape(n_sections, 6),
+            Filter applied at the input rate, e.g. a notch or a band-pass,
+            by default None.
+        decimate: int,
+            Decimation factor, by default 1.
+        filterbank: list of ndarray,
+            Sub-band filters designed for the decimated rate, e.g. the output
+            of generate_filterbank, by default None.
+        channels: list of int,
+            Indices of the data channels to keep, by default all of them.
+
+    Tip
+    ----
+    ..  code-block:: python
+        :linenos:
+        :caption: filtered, decimated and sub-band epochs
+
+        filterbank = generate_filterbank(wp, ws, srate=250)
+        pre = StreamingPreprocessor(n_channels=64, decimate=4,
+                                    filterbank=filterbank, channels=ch_ind)
+        marker = Marker(interval=[0.14, 0.68], srate=250, events=[1],
+                        n_channels=pre.n_outputs)
+        ns.register_worker('ssvep', worker, marker, preprocessor=pre)
+        # in worker.consume(data): pre.split_bands(data), shape(n_bands, n_channels, n_samples)
+    """
+
+    def __init__(
+        self,
+        n_channels: int,
+        sos: Optional[np.ndarray] = None,
+        decimate: int = 1,
+        filterbank: Optional[Sequence[np.ndarray]] = None,
+        channels: Optional[Sequence[int]] = None,
+    ):
+        self.channels = None if channels is None else np.asarray(channels, dtype=int)
+        self.n_channels = n_channels if channels is None else len(channels)
+        self.prefilter = None if sos is None else CausalFilter(sos, self.n_channels)
+        self.decimator = Decimator(decimate, self.n_channels) if decimate > 1 else None
+        self.bands: List[CausalFilter] = [
+            CausalFilter(band_sos, self.n_channels) for band_sos in (filterbank or [])]
+
+    @property
+    def n_bands(self) -> int:
+        return max(len(self.bands), 1)
+
+    @property
+    def n_outputs(self) -> int:
+        """Number of output data columns, without the trigger."""
+        return self.n_bands * self.n_channels
+
+    def reset(self):
+        """Forget the filter states, e.g. before a new recording."""
+        for stage in [self.prefilter, self.decimator] + self.bands:
+            if stage is not None:
+                stage.reset()
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """Preprocess one packet.
+
+        Parameters
+        ----------
+            samples: ndarray, shape(n_samples, n_channels+1),
+                Amplifier block, the last column is the trigger.
+
+        Returns
+        ----------
+            out: ndarray, shape(n_kept, n_outputs+1),
+                Processed block with the trigger column last.
+        """
+        samples = np.asarray(samples)
+        x = samples[:, :-1]
+        if self.channels is not None:
+            x = x[:, self.channels]
+        triggers = samples[:, -1]
+        if self.prefilter is not None:
+            x = self.prefilter.process(x)
+        if self.decimator is not None:
+            x, triggers = self.decimator.process(x, triggers)
+        out = np.empty((len(x), self.n_outputs + 1), dtype=np.float32)
+        if self.bands:
+            for i, band in enumerate(self.bands):
+                out[:, i * self.n_channels:(i + 1) * self.n_channels] = band.process(x)
+        else:
+            out[:, :-1] = x
+        out[:, -1] = triggers
+        return out
+
+    def split_bands(self, epoch: np.ndarray) -> np.ndarray:
+        """Unfold an epoch of processed samples.
+
+        Parameters
+        ----------
+            epoch: ndarray, shape(n_samples, n_outputs+1) or shape(n_samples, n_outputs),
+                Epoch cut by the Marker.
+
+        Returns
+        ----------
+            X: ndarray, shape(n_bands, n_channels, n_samples),
+                Sub-band data, the layout FilterBank works with.
+        """
+        data = np.asarray(epoch)[:, :self.n_outputs]
+        return data.reshape(len(data), self.n_bands, self.n_channels).transpose(1, 2, 0)
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+# License: MIT License
+"""
+Replay of recorded EEG as an online amplifier.
+
+ReplayAmplifier plays back a brainda dataset, an mne Raw or any file mne can
+read at real time or N times real time. Every packet is encoded with the byte
+framing of NeuroScan, Neuracle or HTOnlineSystem and decoded again by that
+amplifier's own parser, so the online pipeline can be benchmarked and
+stress-tested without hardware. serve() streams the same frames over TCP for
+the real amplifier classes to connect to.
+
+"""
+import socket
+import struct
+import threading
+import time
+from typing import Any, Optional, Tuple
+
+import mne
+import numpy as np
+
+from .amplifiers import BaseAmplifier, HTOnlineSystem, NeuroScan, Neuracle
+from .logger import get_logger
+
+logger_replay = get_logger("replay")
+
+NEUROSCAN_SCALE = 0.0298 * 1e-6
+NEUROSCAN_TRIGGER_OFFSET = 65280
+PROTOCOLS = ("neuroscan", "neuracle", "ht")
+
+
+def raw_to_samples(raw, channels=None):
+    """Samples and trigger column of an mne Raw.
+
+    Events are read from the stim channel if there is one, otherwise from
+    the annotations, as in the brainda paradigms.
+
+    Parameters
+    ----------
+        raw: mne.io.Raw,
+            Recording to replay.
+        channels: list of str,
+            Channels to keep in this order, by default all EEG channels.
+
+    Returns
+    ----------
+        samples: ndarray, shape(n_samples, n_channels+1),
+            Data in volts followed by the trigger column.
+        srate: float,
+            Sampling rate.
+    """
+    stim_channels = mne.utils._get_stim_channel(None, raw.info, raise_error=False)
+    if len(stim_channels) > 0:
+        events = mne.find_events(raw, shortest_event=0, initial_event=True, verbose=False)
+    else:
+        try:
+            events, _ = mne.events_from_annotations(raw, event_id=(lambda x: int(x)), verbose=False)
+        except ValueError:
+            events, _ = mne.events_from_annotations(raw, verbose=False)
+    if channels is None:
+        picks = mne.pick_types(raw.info, eeg=True)
+    else:
+        picks = mne.pick_channels(raw.ch_names, channels, ordered=True)
+    data = raw.get_data(picks=picks)
+    samples = np.zeros((data.shape[1], data.shape[0] + 1))
+    samples[:, :-1] = data.T
+    onsets = events[:, 0] - raw.first_samp
+    keep = (onsets >= 0) & (onsets < len(samples))
+    samples[onsets[keep], -1] = events[keep, 2]
+    return samples, raw.info["sfreq"]
+
+
+def encode_neuroscan(block):
+    """NeuroScan data frame: 12-byte big-endian header, little-endian int32 samples."""
+    payload = np.empty(block.shape, dtype="<i4")
+    payload[:, :-1] = np.round(block[:, :-1] / NEUROSCAN_SCALE)
+    payload[:, -1] = block[:, -1] + NEUROSCAN_TRIGGER_OFFSET
+    return b"DATA" + struct.pack(">HHI", 2, 1, payload.nbytes) + payload.tobytes()
+
+
+def encode_neuracle(block):
+    """Neuracle frame: headerless little-endian float32 samples."""
+    return block.astype("<f4").tobytes()
+
+
+def encode_ht(block):
+    """HTOnlineSystem data frame: 8-byte header, little-endian float32 samples, 1-byte tail."""
+    payload = block.astype("<f4").tobytes()
+    return struct.pack("<BBHI", 0xA5, 1, 0, len(payload)) + payload + b"\x5a"
+
+
+class ReplayAmplifier(BaseAmplifier):
+    """Replay recorded data with the framing of a real amplifier.
+    Parameters
+    ----------
+        samples: ndarray, shape(n_samples, n_channels+1),
+            Data followed by the trigger column, see raw_to_samples.
+        srate: float,
+            Sampling rate.
+        protocol: str,
+            Framing of the packets, 'neuroscan', 'neuracle' or 'ht'.
+        speed: float,
+            Playback speed, 1 is real time, 10 is ten times real time and
+            0 sends packets as fast as possible.
+        repeat: bool,
+            Start over at the end of the data instead of stopping.
+        packet_samples: int,
+            Samples per packet, by default 40 ms of data for NeuroScan and
+            Neuracle and 100 samples for HTOnlineSystem.
+    """
+
+    def __init__(
+        self,
+        samples: np.ndarray,
+        srate: float,
+        protocol: str = "neuroscan",
+        speed: float = 1.0,
+        repeat: bool = False,
+        packet_samples: Optional[int] = None,
+    ):
+        super().__init__()
+        if protocol not in PROTOCOLS:
+            raise ValueError("protocol should be one of {}".format(PROTOCOLS))
+        self.samples = np.asarray(samples, dtype=np.float64)
+        self.srate = srate
+        self.num_chans = self.samples.shape[1] - 1
+        self.protocol = protocol
+        self.speed = speed
+        self.repeat = repeat
+        if packet_samples is None:
+            packet_samples = 100 if protocol == "ht" else int(round(srate * 0.04))
+        self.packet_samples = packet_samples
+        # the real amplifier classes parse what we encode
+        self._decoder: Any
+        if protocol == "neuroscan":
+            self._decoder = NeuroScan(srate=srate, num_chans=self.num_chans)
+            self._decoder.neuro_link.close()
+        elif protocol == "neuracle":
+            self._decoder = Neuracle(srate=srate, num_chans=self.num_chans + 1)
+            self._decoder.tcp_link.close()
+        else:
+            self._decoder = HTOnlineSystem(srate=srate, packet_samples=packet_samples,
+                                           num_chans=self.num_chans)
+            self._decoder.tcp_link.close()
+        self._encode = {"neuroscan": encode_neuroscan, "neuracle": encode_neuracle, "ht": encode_ht}[protocol]
+        self._reset_clock()
+
+    @classmethod
+    def from_raw(cls, raw, channels=None, **kwargs):
+        """Replay an mne Raw, see raw_to_samples."""
+        samples, srate = raw_to_samples(raw, channels)
+        return cls(samples, srate, **kwargs)
+
+    @classmethod
+    def from_file(cls, filename, channels=None, **kwargs):
+        """Replay any recording mne.io.read_raw can read."""
+        raw = mne.io.read_raw(filename, preload=True, verbose=False)
+        return cls.from_raw(raw, channels, **kwargs)
+
+    @classmethod
+    def from_dataset(cls, dataset, subject, session=None, run=None, channels=None, **kwargs):
+        """Replay one run of a brainda dataset.
+
+        Parameters
+        ----------
+            dataset: brainda.datasets.base.BaseDataset,
+                Dataset instance.
+            subject: int or str,
+                Subject id.
+            session, run: str,
+                By default the first session and run.
+            channels: list of str,
+                By default the channels of the dataset.
+        """
+        sessions = dataset.get_data([subject])[subject]
+        runs = sessions[session if session is not None else next(iter(sessions))]
+        raw = runs[run if run is not None else next(iter(runs))]
+        if channels is None:
+            channels = [ch for ch in dataset.channels if ch in raw.ch_names]
+        return cls.from_raw(raw, channels, **kwargs)
+
+    def _reset_clock(self):
+        self._pos = 0
+        self._n_sent = 0
+        self._t_start: Optional[float] = None
+
+    def next_frame(self) -> Optional[bytes]:
+        """Encoded bytes of the next packet, None at the end of the data.
+
+        Blocks until the packet is due according to the playback speed.
+        """
+        if self._pos + self.packet_samples > len(self.samples):
+            if not self.repeat:
+                return None
+            self._pos = 0
+        block = self.samples[self._pos:self._pos + self.packet_samples]
+        self._pos += self.packet_samples
+        if self._t_start is None:
+            self._t_start = time.perf_counter()
+        self._n_sent += self.packet_samples
+        if self.speed > 0:
+            due = self._t_start + self._n_sent / (self.srate * self.speed)
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        return self._encode(block)
+
+    def recv(self):
+        """Next packet, decoded by the parser of the emulated amplifier."""
+        frame = self.next_frame()
+        if frame is None:
+            # end of the data, idle until the loop is stopped
+            self._exit.wait(self.packet_samples / self.srate)
+            return None
+        view = memoryview(frame)
+        with self.latency.timer("unpack"):
+            if self.protocol == "neuroscan":
+                return self._decoder._unpack_data(self.num_chans, view[12:])
+            if self.protocol == "neuracle":
+                data, _ = self._decoder._unpack_data(view)
+                return data.reshape(-1, self.num_chans + 1)
+            return self._decoder._unpack_data(view[8:-1])
+
+    def start(self):
+        self._reset_clock()
+        super().start()
+
+    def serve(self, address: Tuple[str, int] = ("127.0.0.1", 0)):
+        """Stream the frames to one TCP client in a background thread.
+
+        The emulated amplifier class can connect to the returned address
+        and read the stream with its own recv().
+
+        Returns
+        ----------
+            address: (str, int),
+                Address the server listens on.
+        """
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(address)
+        server.listen(1)
+        self._server_thread = threading.Thread(
+            target=self._serve, args=(server,), name="replay_server", daemon=True)
+        self._server_thread.start()
+        return server.getsockname()
+
+    def _serve(self, server):
+        conn, peer = server.accept()
+        server.close()
+        logger_replay.info("replaying {} to {}".format(self.protocol, peer))
+        self._reset_clock()
+        try:
+            while not self._exit.is_set():
+                frame = self.next_frame()
+                if frame is None:
+                    break
+                conn.sendall(frame)
+        except OSError:
+            pass
+        finally:
+            conn.close()
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+# License: MIT License
+"""
+Sliding-window decoding for asynchronous BCI.
+
+A decoder takes a decision every ``hop`` samples over the latest ``window``
+samples. Instead of handing every window to an estimator from scratch, it
+keeps the second-order statistics of each hop (sums and sums of products,
+optionally of spatially projected data) and the running window total, so a
+hop costs the new samples plus a small fixed-size update.
+
+Used with a continuous-mode Marker delivering one hop per epoch, e.g.
+``Marker(interval=[0, 0.1], srate=1000)`` for a 100 ms hop.
+
+"""
+from abc import abstractmethod
+from collections import deque
+from typing import Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class SlidingDecoder:
+    """Hop segmentation and running window statistics.
+
+    Subclasses define the statistics of one hop with _hop_stats() and the
+    decision on the window total with _decide(). The window total is kept
+    by adding the new hop and subtracting the one leaving the window, and is
+    summed again exactly once per window to avoid rounding drift.
+
+    Parameters
+    ----------
+        window: int,
+            Window length in samples.
+        hop: int,
+            Samples between two decisions, window must be a multiple of it.
+    """
+
+    def __init__(self, window: int, hop: int):
+        if hop <= 0 or window % hop:
+            raise ValueError("window should be a positive multiple of hop")
+        self.window = window
+        self.hop = hop
+        self.n_hops = window // hop
+        self.reset()
+
+    def reset(self):
+        """Forget the window, e.g. after a pause of the stream."""
+        self._hop_buffer: Optional[np.ndarray] = None
+        self._n_buffered = 0
+        # absolute index of the first sample of the current hop
+        self._t = 0
+        self._hops: deque = deque()
+        self._total: Optional[Tuple[np.ndarray, ...]] = None
+        self._n_updates = 0
+
+    @abstractmethod
+    def _hop_stats(self, x: np.ndarray, t0: int) -> Tuple[np.ndarray, ...]:
+        """Additive statistics of one hop x, shape(hop, n_channels), starting at sample t0."""
+        pass
+
+    @abstractmethod
+    def _decide(self, total: Tuple[np.ndarray, ...]) -> Any:
+        """Decision from the statistics summed over the window."""
+        pass
+
+    def _push_hop(self, x):
+        stats = self._hop_stats(x, self._t)
+        self._t += self.hop
+        self._hops.append(stats)
+        if self._total is None:
+            self._total = tuple(s.copy() for s in stats)
+        else:
+            for total, s in zip(self._total, stats):
+                total += s
+        if len(self._hops) > self.n_hops:
+            old = self._hops.popleft()
+            for total, s in zip(self._total, old):
+                total -= s
+        self._n_updates += 1
+        if self._n_updates % self.n_hops == 0:
+            self._total = tuple(np.sum(s, axis=0) for s in zip(*self._hops))
+
+    @property
+    def ready(self) -> bool:
+        """Whether a full window has been seen."""
+        return len(self._hops) == self.n_hops
+
+    def update(self, samples: np.ndarray) -> List[Any]:
+        """Add a block of any length and decide on every completed hop.
+
+        Parameters
+        ----------
+            samples: ndarray, shape(n_samples, n_channels),
+                New data without the trigger column.
+
+        Returns
+        ----------
+            decisions: list,
+                One decision per hop completed by the block once the first
+                window is full.
+        """
+        samples = np.asarray(samples, dtype=np.float64)
+        if self._hop_buffer is None:
+            self._hop_buffer = np.empty((self.hop, samples.shape[1]))
+        decisions = []
+        pos, n = 0, len(samples)
+        while pos < n:
+            if self._n_buffered == 0 and n - pos >= self.hop:
+                # whole hops are taken straight from the block
+                x = samples[pos:pos + self.hop]
+                pos += self.hop
+            else:
+                k = min(self.hop - self._n_buffered, n - pos)
+                self._hop_buffer[self._n_buffered:self._n_buffered + k] = samples[pos:pos + k]
+                self._n_buffered += k
+                pos += k
+                if self._n_buffered < self.hop:
+                    break
+                x = self._hop_buffer
+                self._n_buffered = 0
+            self._push_hop(x)
+            if self.ready and self._total is not None:
+                decisions.append(self._decide(self._total))
+        return decisions
+
+
+def _centered_covariance(s, ss, n):
+    """Covariance from the sum s and the sum of outer products ss of n samples."""
+    mean = s / n
+    return ss / n - mean[..., :, np.newaxis] * mean[..., np.newaxis, :]
+
+
+class SlidingCovariance(SlidingDecoder):
+    """Running spatial covariance, e.g. for motor imagery.
+
+    The hop is projected once with the spatial filters, so the window
+    covariance is accumulated in the reduced space.
+
+    Parameters
+    ----------
+        window: int,
+            Window length in samples.
+        hop: int,
+            Samples between two decisions.
+        filters: ndarray, shape(n_channels, n_components),
+            Fixed spatial filters, e.g. CSP filters, by default None.
+        estimator: object,
+            Fitted classifier of covariance matrices, shape(1, n, n); if None
+            the covariance itself is the decision.
+    """
+
+    def __init__(self, window: int, hop: int, filters: Optional[np.ndarray] = None, estimator=None):
+        self.filters = filters
+        self.estimator = estimator
+        super().__init__(window, hop)
+
+    def _hop_stats(self, x, t0):
+        if self.filters is not None:
+            x = x @ self.filters
+        return x.sum(axis=0), x.T @ x
+
+    def _decide(self, total):
+        cov = _centered_covariance(total[0], total[1], self.window)
+        if self.estimator is None:
+            return cov
+        return self.estimator.predict(cov[np.newaxis])[0]
+
+
+class SlidingCCA(SlidingDecoder):
+    """Asynchronous SSVEP detection with standard CCA.
+
+    The sine-cosine references are evaluated on the absolute sample index,
+    which spans the same subspace as references starting at the window
+    onset, so the cross-products of every hop stay valid while the window
+    slides and the correlations are those of CCA on the window.
+
+    Parameters
+    ----------
+        freqs: sequence of float,
+            Stimulus frequencies.
+        srate: float,
+            Sampling rate.
+        window: int,
+            Window length in samples.
+        hop: int,
+            Samples between two decisions.
+        n_harmonics: int,
+            Number of harmonics of the references, by default 5.
+        threshold: float,
+            Below this canonical correlation the decision is -1 (idle),
+            by default None, always the best frequency.
+    """
+
+    def __init__(
+        self,
+        freqs: Sequence[float],
+        srate: float,
+        window: int,
+        hop: int,
+        n_harmonics: int = 5,
+        threshold: Optional[float] = None,
+    ):
+        self.freqs = np.asarray(freqs, dtype=np.float64)
+        self.srate = srate
+        self.n_harmonics = n_harmonics
+        self.threshold = threshold
+        # angular step of every (frequency, harmonic) per sample
+        self._omega = (2 * np.pi / srate * self.freqs[:, np.newaxis]
+                       * np.arange(1, n_harmonics + 1)).reshape(-1)
+        self.scores: Optional[np.ndarray] = None
+        super().__init__(window, hop)
+
+    def _references(self, t0):
+        """References of one hop, shape(hop, n_freqs, 2*n_harmonics)."""
+        phase = np.outer(np.arange(t0, t0 + self.hop), self._omega)
+        Y = np.empty((self.hop, len(self.freqs), 2 * self.n_harmonics))
+        Y[:, :, 0::2] = np.sin(phase).reshape(self.hop, len(self.freqs), -1)
+        Y[:, :, 1::2] = np.cos(phase).reshape(self.hop, len(self.freqs), -1)
+        return Y
+
+    def _hop_stats(self, x, t0):
+        Y = self._references(t0)
+        n_freqs, n_refs = Y.shape[1:]
+        sxy = (x.T @ Y.reshape(self.hop, -1)).reshape(-1, n_freqs, n_refs).transpose(1, 0, 2)
+        return (
+            x.sum(axis=0),
+            x.T @ x,
+            Y.sum(axis=0),
+            np.einsum("tfk,tfl->fkl", Y, Y),
+            sxy,
+        )
+
+    def _decide(self, total):
+        sx, sxx, sy, syy, sxy = total
+        n = self.window
+        cxx = _centered_covariance(sx, sxx, n)
+        cyy = _centered_covariance(sy, syy, n)
+        cxy = sxy / n - sx[np.newaxis, :, np.newaxis] * sy[:, np.newaxis, :] / n**2
+        # whitened cross-covariance, its largest singular value is the correlation
+        lx = np.linalg.cholesky(cxx + 1e-12 * np.trace(cxx) * np.eye(len(cxx)))
+        ly = np.linalg.cholesky(cyy + 1e-12 * np.eye(cyy.shape[-1]))
+        a = np.linalg.solve(lx, cxy)
+        b = np.linalg.solve(ly, a.transpose(0, 2, 1))
+        self.scores = np.linalg.svd(b, compute_uv=False)[:, 0]
+        label = int(np.argmax(self.scores))
+        if self.threshold is not None and self.scores[label] < self.threshold:
+            return -1
+        return label
@@ -10,16 +10,94 @@ Start another process, define a framework for offline modeling and online proces
 
 In the actual usage process, you only need to customize the operations of the above functions.
 """
-from typing import Optional, Any
+from typing import Optional, Any, Dict, List, NamedTuple, Tuple
 from abc import abstractmethod
+from multiprocessing import shared_memory
 import os
 import multiprocessing
 import queue
+import threading
+import time
+
+import numpy as np
+
+from .latency import LatencyMonitor, WORKER_STAGES
 from .logger import get_logger
 
 logger = get_logger("worker")
 
 
+class EpochRef(NamedTuple):
+    """Descriptor of an epoch stored in a shared memory slot."""
+    name: str
+    offset: int
+    shape: Tuple[int, ...]
+    dtype: str
+    t_put: float = 0.0
+    t_trigger: float = 0.0
+    tag: int = -1
+
+
+class QueuedEpoch(NamedTuple):
+    """An epoch sent through the queue itself, with its timestamps."""
+    data: Any
+    t_put: float = 0.0
+    t_trigger: float = 0.0
+    tag: int = -1
+
+
+def _attach_shared_memory(name):
+    """Attach to an existing shared memory block without letting the
+    resource tracker of this process unlink it at exit."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # python < 3.13 registers the attached block as well. Workers share
+        # the resource tracker of the main process (started in
+        # ProcessWorker.__init__, inherited through fork, passed on by spawn)
+        # and its registry is a set, so this registration is a no-op.
+        # Unregistering it here would drop the creator's entry.
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedEpochRing:
+    """Fixed-size epoch slots in one shared memory block.
+
+    Slots are handed out round-robin; since the worker consumes epochs in
+    order, the next slot is always the oldest one and is free once the
+    semaphore of the worker has been acquired.
+
+    Parameters
+    ----------
+    n_slots: int
+        Number of epoch slots.
+    slot_bytes: int
+        Size of each slot in bytes.
+    """
+
+    def __init__(self, n_slots: int, slot_bytes: int):
+        self.n_slots = n_slots
+        self.slot_bytes = slot_bytes
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, n_slots * slot_bytes))
+        self._next = 0
+
+    def write(self, data: np.ndarray, t_put: float = 0.0, t_trigger: float = 0.0, tag: int = -1) -> EpochRef:
+        """Copy an epoch into the next slot and return its descriptor."""
+        offset = self._next * self.slot_bytes
+        self._next = (self._next + 1) % self.n_slots
+        view = np.ndarray(data.shape, dtype=data.dtype, buffer=self.shm.buf, offset=offset)
+        view[...] = data
+        del view
+        return EpochRef(self.shm.name, offset, data.shape, data.dtype.str, t_put, t_trigger, tag)
+
+    def close(self):
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
 class ProcessWorker(multiprocessing.Process):
     """Online processing.
 
@@ -36,6 +114,12 @@ class ProcessWorker(multiprocessing.Process):
         Timer setting.
     name: str
         Custom name for the online processing process.
+    shared_memory: bool
+        Pass epochs through shared memory slots instead of pickling them
+        through the queue, by default True.
+    n_slots: int
+        Number of shared epoch slots, i.e. epochs that may wait for
+        `consume()` at the same time before `put()` falls back to the queue.
 
     Attributes
     ----------
@@ -44,6 +128,14 @@ class ProcessWorker(multiprocessing.Process):
         Multiprocess event handling.
     _in_queue: queue
         Data sharing between the online processing process and the main process.
+        With shared memory it only carries small EpochRef descriptors.
+    _free_slots: Semaphore
+        Number of shared epoch slots not yet consumed.
+    latency: LatencyMonitor
+        Histograms of the queue wait, consume() duration and trigger to
+        feedback latency, shared with the main process. consume() may time
+        its own stages with ``self.latency.timer("predict")`` and
+        ``self.latency.timer("feedback")``.
 
     Tip
     ----
@@ -85,15 +177,29 @@ class ProcessWorker(multiprocessing.Process):
 
     """
 
-    def __init__(self, timeout: float = 1e-3, name: Optional[str] = None):
+    def __init__(self, timeout: float = 1e-3, name: Optional[str] = None,
+                 shared_memory: bool = True, n_slots: int = 8):
         multiprocessing.Process.__init__(self)
         self.daemon = False
         self._exit = multiprocessing.Event()
         self._in_queue: multiprocessing.Queue[Any] = multiprocessing.Queue()
         self.timeout = timeout
         self.worker_name = name
-
-    def put(self, data):
+        self.shared_memory = shared_memory
+        self.n_slots = n_slots
+        if shared_memory and os.name == "posix":
+            # rings are created after the worker has started, make sure the
+            # worker inherits the resource tracker instead of starting its own
+            from multiprocessing import resource_tracker
+            resource_tracker.ensure_running()
+        self._free_slots = multiprocessing.Semaphore(n_slots)
+        # main process: rings written by put(); worker process: attached blocks
+        self._rings: List[SharedEpochRing] = []
+        self._attached: Dict[str, Any] = {}
+        self.latency = LatencyMonitor(WORKER_STAGES, shared=True)
+        self.current_tag = -1
+
+    def put(self, data, timestamp: Optional[float] = None, tag: int = -1):
         """Put the data in the queue
 
         author: Lichao Xu
@@ -107,15 +213,50 @@ class ProcessWorker(multiprocessing.Process):
         ----------
         data: ndarray, shape(n_samples, n_channels+1)
             Single trial of online data.
+        timestamp: float, optional
+            time.perf_counter() value of the block that completed the epoch,
+            used for the trigger to feedback latency.
+        tag: int, optional
+            Epoch id, available as `current_tag` while `consume()` runs.
 
         """
 
-        logger.info(
+        logger.debug(
             "put samples in worker-{}".format(
                 self.worker_name if self.worker_name else os.getpid()
             )
         )
-        self._in_queue.put(data)
+        t_trigger = 0.0 if timestamp is None else timestamp
+        if self.shared_memory:
+            data = np.ascontiguousarray(data)
+            if data.dtype != object and self._free_slots.acquire(block=False):
+                ring = self._ring_for(data.nbytes)
+                self._in_queue.put(ring.write(data, time.perf_counter(), t_trigger, tag))
+                return
+        self._in_queue.put(QueuedEpoch(data, time.perf_counter(), t_trigger, tag))
+
+    def _ring_for(self, nbytes):
+        """Current shared ring, replaced by a larger one if the epoch does not fit.
+        Older rings stay alive until stop() since descriptors may still point to them."""
+        if not self._rings or self._rings[-1].slot_bytes < nbytes:
+            self._rings.append(SharedEpochRing(self.n_slots, nbytes))
+        return self._rings[-1]
+
+    def _resolve(self, ref: EpochRef):
+        """Array view of a shared epoch, in the worker process."""
+        if ref.name not in self._attached:
+            self._attached[ref.name] = _attach_shared_memory(ref.name)
+        shm = self._attached[ref.name]
+        return np.ndarray(ref.shape, dtype=np.dtype(ref.dtype), buffer=shm.buf, offset=ref.offset)
+
+    def _detach(self):
+        for shm in self._attached.values():
+            try:
+                shm.close()
+            except BufferError:
+                # a view escaped consume(), leave the mapping to the process exit
+                pass
+        self._attached.clear()
 
     def run(self):
         """
@@ -156,12 +297,32 @@ class ProcessWorker(multiprocessing.Process):
         while not self._exit.is_set():
             try:
                 data = self._in_queue.get(timeout=self.timeout)
-                logger.info(
+                logger.debug(
                     "consume samples in worker-{}".format(
                         self.worker_name if self.worker_name else os.getpid()
                     )
                 )
-                self.consume(data)
+                t_get = time.perf_counter()
+                self.latency.record("queue", t_get - data.t_put)
+                self.current_tag = data.tag
+                if isinstance(data, EpochRef):
+                    try:
+                        view = self._resolve(data)
+                    except FileNotFoundError:
+                        # the main process already stopped and released the slots
+                        self._free_slots.release()
+                        continue
+                    try:
+                        self.consume(view)
+                    finally:
+                        del view
+                        self._free_slots.release()
+                else:
+                    self.consume(data.data)
+                t_done = time.perf_counter()
+                self.latency.record("consume", t_done - t_get)
+                if data.t_trigger:
+                    self.latency.record("trigger_to_feedback", t_done - data.t_trigger)
             except queue.Empty:
                 # if queue is empty, loop to wait for next data until exiting
                 pass
@@ -172,6 +333,7 @@ class ProcessWorker(multiprocessing.Process):
         )
         self.post()
         self.clear_queue()
+        self._detach()
         logger.info(
             "worker{} exit".format(
                 self.worker_name if self.worker_name else os.getpid()
@@ -206,7 +368,9 @@ class ProcessWorker(multiprocessing.Process):
         Parameters
         ----------
         data: ndarray, shape(n_samples, n_channels+1)
-            Single trial of online data.
+            Single trial of online data. With shared memory this is a view
+            of a slot that is reused after `consume()` returns, copy it if
+            it has to be kept.
 
         """
         pass
@@ -232,6 +396,15 @@ class ProcessWorker(multiprocessing.Process):
             )
         )
         self._exit.set()
+        logger.info(
+            "latency of worker-{} (ms):\n{}".format(
+                self.worker_name if self.worker_name else os.getpid(),
+                self.latency.summary()
+            )
+        )
+        for ring in self._rings:
+            ring.close()
+        self._rings = []
 
     def settimeout(self, timeout=0.01):
         """Set the timer.
@@ -264,7 +437,9 @@ class ProcessWorker(multiprocessing.Process):
         )
         while True:
             try:
-                self._in_queue.get(timeout=self.timeout)
+                data = self._in_queue.get(timeout=self.timeout)
+                if isinstance(data, EpochRef):
+                    self._free_slots.release()
             except queue.Empty:
                 break
         logger.info(
@@ -272,3 +447,204 @@ class ProcessWorker(multiprocessing.Process):
                 self.worker_name if self.worker_name else os.getpid()
             )
         )
+
+
+class ModelWorker(ProcessWorker):
+    """A model process of a WorkerPool.
+
+    Instead of `consume()`, subclasses implement `predict()`, whose return
+    value is sent back to the pool. `pre()` and `post()` are used as in
+    ProcessWorker.
+
+    Parameters
+    ----------
+    timeout: float
+        Timer setting.
+    name: str
+        Name of the model, used as its key in the gathered results.
+    """
+
+    def __init__(self, timeout: float = 1e-3, name: Optional[str] = None, **kwargs):
+        super().__init__(timeout=timeout, name=name, **kwargs)
+        # set by WorkerPool before the process starts
+        self._results: Optional[multiprocessing.Queue] = None
+
+    def consume(self, data):
+        result = self.predict(data)
+        if self._results is not None:
+            self._results.put((self.worker_name, self.current_tag, result))
+
+    @abstractmethod
+    def predict(self, data):
+        """Custom function returning the decoding result of one epoch.
+
+        Parameters
+        ----------
+        data: ndarray, shape(n_samples, n_channels+1)
+            Single trial of online data.
+
+        """
+        pass
+
+    def pre(self):
+        pass
+
+    def post(self):
+        pass
+
+
+def _label(result):
+    result = np.asarray(result)
+    return result.item() if result.size == 1 else tuple(result.ravel().tolist())
+
+
+def combine_first(results: Dict[str, Any], weights: Dict[str, float]):
+    """Result of the model that answered first."""
+    return next(iter(results.values()))
+
+
+def combine_vote(results: Dict[str, Any], weights: Dict[str, float]):
+    """Weighted majority vote over the predicted labels, ties go to the earliest answer."""
+    scores: Dict[Any, float] = {}
+    for name, result in results.items():
+        label = _label(result)
+        scores[label] = scores.get(label, 0.0) + weights.get(name, 1.0)
+    return max(scores, key=lambda label: scores[label])
+
+
+def combine_mean(results: Dict[str, Any], weights: Dict[str, float]):
+    """Weighted mean of score or probability vectors."""
+    w = np.array([weights.get(name, 1.0) for name in results])
+    values = np.array([np.asarray(result, dtype=np.float64) for result in results.values()])
+    return np.tensordot(w / w.sum(), values, axes=1)
+
+
+COMBINERS = {"first": combine_first, "vote": combine_vote, "mean": combine_mean}
+
+
+class WorkerPool:
+    """Fan each epoch out to several model processes and combine their results.
+
+    The pool is registered on an amplifier like a single ProcessWorker. Every
+    epoch is put to all model workers; a gathering thread collects their
+    results until all models answered or the deadline passed, combines the
+    results that arrived and passes the decision to `feedback`.
+
+    Parameters
+    ----------
+    workers: list of ModelWorker
+        Model processes, with distinct names.
+    combine: str or callable
+        'first' (first-ready), 'vote' (weighted majority vote), 'mean'
+        (weighted mean of score vectors) or a callable
+        combine(results, weights) -> decision, where results maps the model
+        names to their results in arrival order.
+    weights: dict, optional
+        Weight of each model name, by default 1.
+    deadline: float
+        Seconds after put() after which the epoch is decided with the
+        results available, by default 0.5.
+    feedback: callable, optional
+        feedback(decision, results), called in the gathering thread, e.g.
+        to push the decision to an LSL outlet.
+
+    Attributes
+    ----------
+    decisions: queue.Queue
+        (tag, decision, results) of every decided epoch, for polling
+        instead of a feedback callback.
+    """
+
+    def __init__(
+        self,
+        workers: List[ModelWorker],
+        combine: Any = "vote",
+        weights: Optional[Dict[str, float]] = None,
+        deadline: float = 0.5,
+        feedback: Optional[Any] = None,
+        name: Optional[str] = None,
+    ):
+        names = [worker.worker_name for worker in workers]
+        if None in names or len(set(names)) != len(names):
+            raise ValueError("model workers need distinct names")
+        self.workers = workers
+        self.combine = COMBINERS[combine] if isinstance(combine, str) else combine
+        self.weights = weights or {}
+        self.deadline = deadline
+        self.feedback = feedback
+        self.worker_name = name
+        self.decisions: queue.Queue = queue.Queue()
+        self._results: multiprocessing.Queue = multiprocessing.Queue()
+        for worker in workers:
+            worker._results = self._results
+        self._pending: Dict[int, Tuple[float, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self._next_tag = 0
+        self._exit = threading.Event()
+        self._t_gather: Optional[threading.Thread] = None
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+        self._exit.clear()
+        self._t_gather = threading.Thread(target=self._gather, name="pool_gather", daemon=True)
+        self._t_gather.start()
+
+    def is_alive(self):
+        return any(worker.is_alive() for worker in self.workers)
+
+    def put(self, data, timestamp: Optional[float] = None):
+        """Send one epoch to every model worker."""
+        with self._lock:
+            tag = self._next_tag
+            self._next_tag += 1
+            self._pending[tag] = (time.perf_counter() + self.deadline, {})
+        for worker in self.workers:
+            if worker.is_alive():
+                worker.put(data, timestamp, tag)
+
+    def _decide(self, tag, results):
+        decision = self.combine(results, self.weights) if results else None
+        self.decisions.put((tag, decision, results))
+        if self.feedback is not None:
+            self.feedback(decision, results)
+
+    def _gather(self):
+        n_models = len(self.workers)
+        while not self._exit.is_set():
+            with self._lock:
+                deadlines = [t for t, _ in self._pending.values()]
+            wait = min(deadlines) - time.perf_counter() if deadlines else 0.01
+            try:
+                name, tag, result = self._results.get(timeout=min(max(wait, 0.0), 0.01) or 1e-4)
+            except queue.Empty:
+                name = None
+            # finished epochs are taken under the lock, but decided outside of
+            # it: a slow feedback must not block put() in the amplifier thread
+            finished = []
+            with self._lock:
+                if name is not None and tag in self._pending:
+                    results = self._pending[tag][1]
+                    results[name] = result
+                    if len(results) == n_models or self.combine is combine_first:
+                        finished.append((tag, self._pending.pop(tag)[1]))
+                now = time.perf_counter()
+                for tag in [t for t, (due, _) in self._pending.items() if due <= now]:
+                    logger.info("epoch {} decided at the deadline".format(tag))
+                    finished.append((tag, self._pending.pop(tag)[1]))
+            for tag, results in finished:
+                self._decide(tag, results)
+
+    def stop(self):
+        for worker in self.workers:
+            worker.stop()
+        self._exit.set()
+        if self._t_gather is not None:
+            self._t_gather.join()
+            self._t_gather = None
+
+    def clear_queue(self):
+        for worker in self.workers:
+            worker.clear_queue()
+        with self._lock:
+            self._pending.clear()
@@ -1,4 +1,4 @@
-from metabci.brainflow.abci_capture import start_data_collection  # 导入数据采集函数
+from metabci.brainflow.abci_capture import start_data_collection, AcquisitionSession  # 导入数据采集函数
 import os
 import serial
 from datetime import datetime
@@ -31,10 +31,12 @@ def create_data_filename():
 
 
 class CustomMIExperiment:
-    def __init__(self, win, ser, filename):
+    def __init__(self, win, ser, filename, session=None):
         self.win = win
         self.ser = ser
         self.filename = filename
+        # 持续采集会话, 为None时每个视频单独启动采集线程
+        self.session = session
         self.movies = []
         self.current_movie_index = 0
 
@@ -81,14 +83,18 @@ class CustomMIExperiment:
             clock = core.Clock()
             try:
                 current_movie.play()
-                # 启动数据采集线程 (5.5秒)
                 event_label = f"Stimulus_{self.current_movie_index + 1}"
-                data_thread = threading.Thread(
-                    target=start_data_collection,
-                    args=(self.ser, self.filename, 5.5, event_label)
-                )
-                data_thread.daemon = True
-                data_thread.start()
+                if self.session is not None:
+                    # 在第一帧刷新时打标记
+                    self.win.callOnFlip(self.session.mark, event_label)
+                else:
+                    # 启动数据采集线程 (5.5秒)
+                    data_thread = threading.Thread(
+                        target=start_data_collection,
+                        args=(self.ser, self.filename, 5.5, event_label)
+                    )
+                    data_thread.daemon = True
+                    data_thread.start()
 
                 # 播放视频5.5秒
                 while clock.getTime() < 5.5:
@@ -128,14 +134,18 @@ def show_start_message(win):
     win.flip()
     core.wait(5.0)
 
-def show_fixation_cross(win, ser, filename, duration=30):
-    # 启动数据采集线程 (30秒)
-    data_thread = threading.Thread(
-        target=start_data_collection,
-        args=(ser, filename, duration, "Fixation Cross")
-    )
-    data_thread.daemon = True
-    data_thread.start()
+def show_fixation_cross(win, ser, filename, duration=30, session=None):
+    if session is not None:
+        # 在十字第一帧刷新时打标记
+        win.callOnFlip(session.mark, "Fixation Cross")
+    else:
+        # 启动数据采集线程 (30秒)
+        data_thread = threading.Thread(
+            target=start_data_collection,
+            args=(ser, filename, duration, "Fixation Cross")
+        )
+        data_thread.daemon = True
+        data_thread.start()
 
     # 显示十字
     fixation = visual.TextStim(win, text="+", height=800, color='white')
@@ -175,48 +185,55 @@ def run_mi_paradigm(win, ser, filename):
     show_start_collection_button(win)
     show_start_message(win)
 
-    # 修改后的十字采集部分
-    if ser and ser.is_open:
-        show_fixation_cross(win, ser, filename, 1)  # 30秒十字采集
-    else:
-        # 没有串口时显示30秒十字但不采集数据
-        fixation = visual.TextStim(win, text="+", height=800, color='white')
-        clock = core.Clock()
-        while clock.getTime() < 30:
-            fixation.draw()
-            win.flip()
-            if event.getKeys(keyList=['q', 'escape']):
-                core.quit()
-
-    # 修改后的视频播放部分
-    for _ in range(len(experiment.movies)):
+    try:
+        # 修改后的十字采集部分
         if ser and ser.is_open:
-            experiment.play_next_video()  # 正常播放并采集数据
+            # 整个实验只启动一次采集, 从十字开始连续记录
+            experiment.session = AcquisitionSession(ser, filename)
+            experiment.session.start()
+            show_fixation_cross(win, ser, filename, 1, session=experiment.session)  # 30秒十字采集
         else:
-            # 没有串口时只播放视频不采集数据
-            if experiment.current_movie_index < len(experiment.movies):
-                current_movie = experiment.movies[experiment.current_movie_index]
-                clock = core.Clock()
-                try:
-                    current_movie.play()
-                    while clock.getTime() < 5.5:
-                        if current_movie.status == visual.FINISHED:
-                            current_movie.seek(0)
-                            current_movie.play()
-                        current_movie.draw()
-                        win.flip()
-                        if event.getKeys(keyList=['q', 'escape']):
-                            core.quit()
-                except Exception as e:
-                    print(f"视频播放错误: {e}")
-                finally:
+            # 没有串口时显示30秒十字但不采集数据
+            fixation = visual.TextStim(win, text="+", height=800, color='white')
+            clock = core.Clock()
+            while clock.getTime() < 30:
+                fixation.draw()
+                win.flip()
+                if event.getKeys(keyList=['q', 'escape']):
+                    core.quit()
+
+        # 修改后的视频播放部分
+        for _ in range(len(experiment.movies)):
+            if ser and ser.is_open:
+                experiment.play_next_video()  # 正常播放并采集数据
+            else:
+                # 没有串口时只播放视频不采集数据
+                if experiment.current_movie_index < len(experiment.movies):
+                    current_movie = experiment.movies[experiment.current_movie_index]
+                    clock = core.Clock()
                     try:
-                        current_movie.stop()
-                        current_movie._unload()
-                    except:
-                        pass
-                    experiment.current_movie_index += 1
-
+                        current_movie.play()
+                        while clock.getTime() < 5.5:
+                            if current_movie.status == visual.FINISHED:
+                                current_movie.seek(0)
+                                current_movie.play()
+                            current_movie.draw()
+                            win.flip()
+                            if event.getKeys(keyList=['q', 'escape']):
+                                core.quit()
+                    except Exception as e:
+                        print(f"视频播放错误: {e}")
+                    finally:
+                        try:
+                            current_movie.stop()
+                            current_movie._unload()
+                        except:
+                            pass
+                        experiment.current_movie_index += 1
+    finally:
+        # 按q/Esc退出(core.quit)或出错时也要停止采集并关闭数据文件
+        if experiment.session is not None:
+            experiment.session.stop()
     experiment.cleanup()
     show_end_screen(win)
 
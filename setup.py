@@ -15,6 +15,10 @@ setuptools.setup(
     long_description_content_type="text/markdown",
     url="",
     packages=setuptools.find_packages(),
+    package_data={
+        # default model, scaler and feature ranking of the PLI scorer
+        'metabci.brainda.algorithms.abci_Algorithm': ['*.joblib', '*.csv'],
+    },
     install_requires=[
         'setuptools',
         'wheel',
@@ -48,6 +52,11 @@ setuptools.setup(
         sys_platform == \'darwin\' and python_version <= \'3.8\'',
         'psychopy'
         ],
+    entry_points={
+        'console_scripts': [
+            'metabci-pli-score=metabci.brainda.algorithms.abci_Algorithm.scoring:main',
+        ],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
@@ -0,0 +1,278 @@
+import socket
+import struct
+from collections import deque
+from unittest import mock
+
+import numpy as np
+import pylsl
+
+from .base_tmpl import BaseTmpl
+from metabci.brainflow.amplifiers import DataInlet, HTOnlineSystem, LSLapps, Marker, RingBuffer
+
+
+class TestRingBuffer(BaseTmpl):
+
+    def test_wraparound(self):
+        rng = np.random.default_rng(0)
+        for size in (1, 7, 64):
+            buffer = RingBuffer(size=size)
+            expected = deque(maxlen=size)
+            for _ in range(200):
+                # blocks shorter, as long as and longer than the buffer
+                block = rng.standard_normal((rng.integers(0, 2 * size + 2), 3)).astype(np.float32)
+                buffer.extend(block)
+                expected.extend(block)
+                data = buffer.get_all()
+                self.assertEqual(len(buffer), len(expected))
+                self.assertEqual(buffer.isfull(), len(expected) == size)
+                np.testing.assert_array_equal(data, np.reshape(expected, (-1, 3)))
+
+    def test_views(self):
+        buffer = RingBuffer(size=5, n_channels=2)
+        self.assertEqual(buffer.get_all().shape, (0, 3))
+        for i in range(8):
+            buffer.append([i, -i, 0])
+        data = buffer.get_all()
+        # the latest samples are contiguous in the mirrored storage
+        self.assertTrue(np.shares_memory(data, buffer._buffer))
+        self.assertTrue(data.flags.c_contiguous)
+        np.testing.assert_array_equal(data[:, 0], [3, 4, 5, 6, 7])
+        kept = data.copy()
+        buffer.append([8, -8, 0])
+        np.testing.assert_array_equal(kept[:, 0], [3, 4, 5, 6, 7])
+        np.testing.assert_array_equal(buffer.get_all()[:, 0], [4, 5, 6, 7, 8])
+
+    def test_lazy_allocation(self):
+        buffer = RingBuffer(size=4, dtype=np.float64)
+        self.assertEqual(buffer.get_all().shape, (0, 0))
+        buffer.append([1.5, 2.5])
+        self.assertEqual(buffer.get_all().dtype, np.float64)
+        np.testing.assert_array_equal(buffer.get_all(), [[1.5, 2.5]])
+        buffer.clear()
+        self.assertEqual(len(buffer), 0)
+        self.assertFalse(buffer.isfull())
+        buffer.extend(np.ones((6, 2)))
+        self.assertTrue(buffer.isfull())
+        np.testing.assert_array_equal(buffer.get_all(), np.ones((4, 2)))
+
+
+def per_sample_epochs(marker, samples):
+    # the amplifier loop before Marker.process: append and call per sample
+    epochs = []
+    for sample in samples:
+        marker.append(sample)
+        if marker(sample[-1]):
+            epochs.append(marker.get_epoch().copy())
+    return epochs
+
+
+class TestMarkerProcess(BaseTmpl):
+
+    def make_samples(self, rng, n_samples=3000):
+        samples = rng.standard_normal((n_samples, 4)).astype(np.float32)
+        triggers = np.zeros(n_samples)
+        onsets = np.sort(rng.choice(n_samples, 40, replace=False))
+        for onset in onsets:
+            # events of other labels, close events and multi-sample pulses
+            triggers[onset:onset + rng.integers(1, 4)] = rng.choice([1, 2, 3])
+        samples[:, -1] = triggers
+        return samples
+
+    def assertSameEpochs(self, kwargs, seed=0):
+        rng = np.random.default_rng(seed)
+        samples = self.make_samples(rng)
+        marker, reference = Marker(**kwargs), Marker(**kwargs)
+        expected = per_sample_epochs(reference, samples)
+        cuts = np.sort(rng.integers(0, len(samples), 60))
+        epochs = []
+        for start, stop in zip(np.r_[0, cuts], np.r_[cuts, len(samples)]):
+            epochs += marker.process(samples[start:stop])
+        self.assertEqual(len(epochs), len(expected), kwargs)
+        for epoch, expected_epoch in zip(epochs, expected):
+            np.testing.assert_array_equal(epoch, expected_epoch)
+        self.assertEqual(marker.countdowns, reference.countdowns)
+        self.assertEqual(marker.is_rising, reference.is_rising)
+        np.testing.assert_array_equal(marker.get_all(), reference.get_all())
+        return epochs
+
+    def test_events(self):
+        for interval in ([0, 0.2], [0.05, 0.3], [-0.1, 0.2]):
+            epochs = self.assertSameEpochs(dict(interval=interval, srate=250, events=[1, 2]))
+            self.assertTrue(epochs)
+
+    def test_patch_size(self):
+        for patch_size in (5, 10, 25):
+            epochs = self.assertSameEpochs(
+                dict(interval=[0, 0.4], srate=250, events=[1, 3], patch_size=patch_size), seed=patch_size)
+            self.assertTrue(epochs)
+
+    def test_continuous(self):
+        epochs = self.assertSameEpochs(dict(interval=[0, 0.2], srate=250))
+        self.assertTrue(epochs)
+        epochs = self.assertSameEpochs(dict(interval=[0, 0.2], srate=250, patch_size=10))
+        self.assertTrue(epochs)
+
+    def test_single_samples(self):
+        rng = np.random.default_rng(1)
+        samples = self.make_samples(rng, 600)
+        kwargs = dict(interval=[0, 0.1], srate=250, events=[1, 2, 3], n_channels=3)
+        marker, reference = Marker(**kwargs), Marker(**kwargs)
+        expected = per_sample_epochs(reference, samples)
+        epochs = [epoch for sample in samples for epoch in marker.process(sample)]
+        self.assertEqual(marker.process(np.empty((0, 4))), [])
+        self.assertEqual(len(epochs), len(expected))
+        for epoch, expected_epoch in zip(epochs, expected):
+            np.testing.assert_array_equal(epoch, expected_epoch)
+
+
+class FakeInlet:
+    """pull_chunk of a pylsl.StreamInlet over prepared chunks."""
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+
+    def pull_chunk(self, timeout=0.0, max_samples=1024, dest_obj=None):
+        if not self.chunks:
+            return [], []
+        values, ts = self.chunks.pop(0)
+        if dest_obj is None:
+            return values, list(ts)
+        dest_obj[:len(ts)] = values
+        return dest_obj, list(ts)
+
+
+def make_info(n_channels):
+    info = mock.Mock()
+    info.name.return_value = "eeg"
+    info.channel_count.return_value = n_channels
+    info.channel_format.return_value = pylsl.cf_float32
+    return info
+
+
+def merge_reference(blocks, arrivals):
+    # per-marker loop of LSLapps.recv before merge_markers
+    cache, lines = [], []
+    for block, arrived in zip(blocks, arrivals):
+        cache += arrived
+        label_line = np.zeros(len(block))
+        for t, label in list(cache):
+            position = np.searchsorted(block[:, -1], t)
+            if position >= len(block):
+                break
+            label_line[position] = label
+            cache.remove((t, label))
+        lines.append(label_line)
+    return lines
+
+
+class TestLSL(BaseTmpl):
+
+    def make_app(self, **kwargs):
+        with mock.patch.object(pylsl, "ContinuousResolver"), \
+                mock.patch("metabci.brainflow.amplifiers.time.sleep"):
+            return LSLapps(**kwargs)
+
+    def make_stream(self, n_chunks=30, srate=100, seed=0):
+        rng = np.random.default_rng(seed)
+        chunks, t = [], 100.0
+        for _ in range(n_chunks):
+            n = int(rng.integers(1, 12))
+            ts = t + np.arange(n) / srate
+            t += n / srate
+            chunks.append((rng.standard_normal((n, 3)).astype(np.float32), ts))
+        return chunks
+
+    def test_data_inlet(self):
+        chunks = self.make_stream()
+        with mock.patch.object(pylsl, "StreamInlet", return_value=FakeInlet(chunks)):
+            inlet = DataInlet(make_info(3), max_samples=16, delay=0.05)
+        data = []
+        clock = iter(ts[-1] for _, ts in chunks)
+        for _ in chunks:
+            n = inlet.stream_action()
+            now = next(clock)
+            with mock.patch.object(pylsl, "local_clock", return_value=now):
+                block = inlet.get_data()
+            # only samples at least delay seconds old are released
+            self.assertTrue(np.all(block[:, -1] <= now - 0.05))
+            self.assertGreater(n, 0)
+            data.append(block)
+        inlet.delay = 0
+        data.append(inlet.get_data())
+        data = np.concatenate(data)
+        np.testing.assert_array_equal(data[:, :-1], np.concatenate([v for v, _ in chunks]))
+        np.testing.assert_array_equal(data[:, -1], np.concatenate([ts for _, ts in chunks]))
+        self.assertEqual(len(inlet.get_data()), 0)
+
+    def test_data_inlet_growth(self):
+        chunks = self.make_stream(n_chunks=40)
+        with mock.patch.object(pylsl, "StreamInlet", return_value=FakeInlet(chunks)):
+            inlet = DataInlet(make_info(3), max_samples=16, delay=0)
+        # more samples than the initial pending array before any release
+        while inlet.stream_action():
+            pass
+        data = inlet.get_data()
+        np.testing.assert_array_equal(data[:, :-1], np.concatenate([v for v, _ in chunks]))
+
+    def test_merge_markers(self):
+        rng = np.random.default_rng(1)
+        app = self.make_app()
+        blocks = [np.column_stack([v, ts]).astype(np.float64) for v, ts in self.make_stream(n_chunks=60)]
+        t_start, t_end = blocks[0][0, -1], blocks[-1][-1, -1]
+        times = np.sort(rng.uniform(t_start - 0.05, t_end + 0.05, 40))
+        labels = rng.integers(1, 10, len(times)).astype(float)
+        # markers reach the app up to 50 ms before or after their timestamp
+        arrival = times + rng.uniform(-0.05, 0.05, len(times))
+        arrivals, previous = [], -np.inf
+        for block in blocks:
+            arrived = (arrival > previous) & (arrival <= block[-1, -1])
+            arrivals.append(list(zip(times[arrived], labels[arrived])))
+            previous = block[-1, -1]
+        expected = merge_reference(blocks, arrivals)
+        for block, arrived, label_line in zip(blocks, arrivals, expected):
+            if arrived:
+                t, label = zip(*arrived)
+                app.marker_times = np.concatenate((app.marker_times, t))
+                app.marker_labels = np.concatenate((app.marker_labels, label))
+            merged = app.merge_markers(block.copy())
+            np.testing.assert_array_equal(merged[:, :-1], block[:, :-1])
+            np.testing.assert_array_equal(merged[:, -1], label_line)
+        # markers after the last block stay cached
+        self.assertEqual(len(app.marker_times), np.sum(times > t_end))
+
+    def test_recv(self):
+        app = self.make_app(delay=0, poll_interval=0)
+        chunks = self.make_stream(n_chunks=2)
+        with mock.patch.object(pylsl, "StreamInlet", return_value=FakeInlet(chunks)):
+            app.data_inlet = DataInlet(make_info(3), delay=0)
+        app.marker_inlet = mock.Mock()
+        t = chunks[0][1]
+        app.marker_inlet.pull_markers.return_value = (np.array([4.0, 5.0]), np.array([t[0] - 1, t[-1]]))
+        data = app.recv()
+        # a late marker goes to the first sample
+        np.testing.assert_array_equal(data[:, -1], np.r_[4, np.zeros(len(t) - 2), 5])
+        np.testing.assert_array_equal(data[:, :-1], chunks[0][0])
+        app.marker_inlet.pull_markers.return_value = (np.empty(0), np.empty(0))
+        self.assertEqual(len(app.recv()), len(chunks[1][1]))
+        self.assertIsNone(app.recv())
+
+
+def ht_frame(attribute_id, payload):
+    return struct.pack("<BBHI", 90, attribute_id, 1, len(payload)) + payload + bytes([165])
+
+
+class TestHTOnlineSystem(BaseTmpl):
+
+    def test_recv_skips_replies(self):
+        amplifier = HTOnlineSystem(packet_samples=4, num_chans=2)
+        amplifier.tcp_link.close()
+        amplifier.tcp_link, peer = socket.socketpair()
+        self.addCleanup(amplifier.tcp_link.close)
+        self.addCleanup(peer.close)
+        samples = np.arange(12, dtype="<f4").reshape(4, 3)
+        # a sampling rate reply between two data packets
+        peer.sendall(ht_frame(1, samples.tobytes()) + ht_frame(1, struct.pack("<I", 1000))
+                     + ht_frame(1, (samples + 1).tobytes()))
+        np.testing.assert_array_equal(amplifier.recv(), samples)
+        self.assertIsNone(amplifier.recv())
+        np.testing.assert_array_equal(amplifier.recv(), samples + 1)
@@ -0,0 +1,160 @@
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from .base_tmpl import BaseTmpl
+from metabci.brainflow.abci_capture import (
+    CSV_HEADER, FOOTER_BYTE, HEADER_BYTE, BinaryCaptureWriter, PacketDecoder, decode_packets,
+    export_csv, find_packets, format_timestamp, parse_eeg_packet, read_binary_capture)
+
+
+def make_packet(sample_num, rng):
+    return bytes([HEADER_BYTE, sample_num]) + rng.integers(0, 256, 24, dtype=np.uint8).tobytes() \
+        + bytes(6) + bytes([FOOTER_BYTE])
+
+
+def scan_packets(data):
+    # byte-by-byte scan of the serial stream as before the vectorized decoder
+    buffer, parsed = bytearray(data), []
+    while len(buffer) >= 33:
+        header_pos = -1
+        for i in range(len(buffer) - 32):
+            if buffer[i] == HEADER_BYTE and buffer[i + 32] == FOOTER_BYTE:
+                header_pos = i
+                break
+        if header_pos == -1:
+            break
+        parsed.append(parse_eeg_packet(buffer[header_pos:header_pos + 33]))
+        buffer = buffer[header_pos + 33:]
+    return parsed
+
+
+class TestBinaryCapture(BaseTmpl):
+
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmpdir.name, 'capture.bin')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        super().tearDown()
+
+    def test_roundtrip(self):
+        rng = np.random.default_rng(0)
+        eeg = rng.standard_normal((600, 8))
+        sample_nums = np.arange(600) % 256
+        t0 = time.time()
+        with BinaryCaptureWriter(self.filename, chunk_size=100) as writer:
+            writer.write_block(sample_nums[:250], eeg[:250], t0, event_label='left')
+            writer.write_block(sample_nums[250:], eeg[250:], t0 + 1, events=[(10, 'right')])
+            writer.write(3, eeg[0], t0 + 2, event_label='rest')
+        records, events = read_binary_capture(self.filename)
+        self.assertEqual(len(records), 601)
+        np.testing.assert_array_equal(records['sample_num'][:600], sample_nums)
+        np.testing.assert_allclose(records['eeg'][:600], eeg, rtol=1e-6)
+        self.assertEqual(events, [(0, 'left'), (260, 'right'), (600, 'rest')])
+
+        lines = open(export_csv(self.filename), encoding='utf-8').readlines()
+        self.assertEqual(lines[0], CSV_HEADER)
+        self.assertEqual(len(lines), 602)
+        row = lines[261].rstrip('\n').split(',')
+        self.assertEqual(int(row[0]), sample_nums[260])
+        np.testing.assert_allclose(np.array(row[1:9], dtype=float), eeg[260], atol=1e-6)
+        self.assertEqual(row[9], format_timestamp(t0 + 1))
+        self.assertEqual(row[10], 'right')
+        self.assertEqual(lines[2].rstrip('\n').split(',')[10], '')
+        del records
+
+    def test_append(self):
+        eeg = np.ones((10, 8))
+        for _ in range(2):
+            with BinaryCaptureWriter(self.filename) as writer:
+                writer.write_block(np.arange(10), eeg, time.time(), event_label='start')
+        records, events = read_binary_capture(self.filename)
+        self.assertEqual(len(records), 20)
+        self.assertEqual(events, [(0, 'start'), (10, 'start')])
+        del records
+
+    def test_write_error(self):
+        writer = BinaryCaptureWriter(self.filename, chunk_size=10, max_pending=1)
+        # every write of the background thread fails from now on
+        writer._f.close()
+        eeg = np.zeros((10, 8))
+        with self.assertRaises(ValueError):
+            for _ in range(100):
+                writer.write_block(np.arange(10), eeg, time.time())
+                time.sleep(0.01)
+        with self.assertRaises(ValueError):
+            writer.close()
+        self.assertFalse(writer._writer.is_alive())
+
+
+class TestPacketDecoder(BaseTmpl):
+
+    def assertDecoded(self, data):
+        expected = scan_packets(data)
+        buf = np.frombuffer(data, dtype=np.uint8)
+        starts = find_packets(buf)
+        self.assertEqual(len(starts), len(expected))
+        if not len(starts):
+            return
+        sample_nums, eeg = decode_packets(buf, starts)
+        np.testing.assert_array_equal(sample_nums, [p['sample_num'] for p in expected])
+        np.testing.assert_allclose(eeg, [p['eeg_data'] for p in expected], rtol=1e-12)
+
+    def test_overlapping_headers(self):
+        rng = np.random.default_rng(0)
+        # a header in the payload whose footer lies in the next packet
+        first = bytearray(make_packet(0, rng))
+        first[20] = HEADER_BYTE
+        second = bytearray(make_packet(1, rng))
+        second[19] = FOOTER_BYTE
+        self.assertDecoded(bytes(first + second))
+        # payloads made of header and footer bytes only
+        data = bytearray()
+        for i in range(20):
+            packet = bytearray(make_packet(i, rng))
+            packet[2:32] = rng.choice([HEADER_BYTE, FOOTER_BYTE], 30).astype(np.uint8).tobytes()
+            data += packet
+        self.assertDecoded(bytes(data))
+
+    def test_corrupted_headers(self):
+        rng = np.random.default_rng(1)
+        for _ in range(20):
+            data = bytearray()
+            for i in range(30):
+                packet = bytearray(make_packet(i, rng))
+                damage = rng.integers(4)
+                if damage == 1:
+                    packet[0] = rng.integers(256)
+                elif damage == 2:
+                    packet[32] = rng.integers(256)
+                elif damage == 3:
+                    packet = packet[rng.integers(1, 33):]
+                data += packet + rng.choice([HEADER_BYTE, FOOTER_BYTE, 0], rng.integers(3)).astype(np.uint8).tobytes()
+            self.assertDecoded(bytes(data))
+
+    def test_feed_chunks(self):
+        rng = np.random.default_rng(2)
+        data = b"".join(make_packet(i % 256, rng) for i in range(300))
+        decoder = PacketDecoder()
+        cuts = np.sort(rng.integers(0, len(data), 40))
+        chunks = [decoder.feed(data[a:b]) for a, b in zip(np.r_[0, cuts], np.r_[cuts, len(data)])]
+        sample_nums = np.concatenate([c[0] for c in chunks])
+        eeg = np.concatenate([c[1] for c in chunks])
+        expected = scan_packets(data)
+        np.testing.assert_array_equal(sample_nums, [p['sample_num'] for p in expected])
+        np.testing.assert_allclose(eeg, [p['eeg_data'] for p in expected], rtol=1e-12)
+        self.assertEqual(decoder.lost_packets, 0)
+
+    def test_lost_and_duplicate(self):
+        rng = np.random.default_rng(3)
+        decoder = PacketDecoder()
+        decoder.feed(b"".join(make_packet(i, rng) for i in (250, 251, 251, 253)))
+        self.assertEqual((decoder.lost_packets, decoder.duplicate_packets), (1, 1))
+        # wraparound of the sample number, duplicate across two reads
+        decoder.feed(b"".join(make_packet(i, rng) for i in (253, 255, 0, 1)))
+        self.assertEqual((decoder.lost_packets, decoder.duplicate_packets), (2, 2))
@@ -0,0 +1,100 @@
+import os
+import tempfile
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from .base_tmpl import BaseTmpl
+from .test_scoring import write_capture_csv
+from metabci.brainda.algorithms.abci_Algorithm import capture_io
+from metabci.brainda.algorithms.abci_Algorithm.capture_io import (
+    load_capture, read_capture_csv, save_capture, sidecar_path)
+
+
+def read_capture_python(filename):
+    # line-splitting reader with the python engine, as before read_capture_csv
+    df = pd.read_table(filename, encoding="GB2312", header=None, engine="python")
+    data = df[0].str.split(',', expand=True).iloc[3:, :].reset_index(drop=True)
+    eeg = data.iloc[:, 1:9].T.to_numpy(dtype=np.float64)
+    markers = data.iloc[:, 10]
+    stimulus_indices = markers.index[markers.str.contains('Stimulus', na=False)].to_numpy()
+    return eeg, stimulus_indices
+
+
+class TestCaptureIO(BaseTmpl):
+
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        rng = np.random.default_rng(0)
+        self.eeg = (100 * rng.standard_normal((8, 500))).astype(np.float32)
+        self.stimulus_indices = np.array([0, 120, 121, 499])
+        self.filename = os.path.join(self.tmpdir.name, "capture.csv")
+        write_capture_csv(self.filename, self.eeg, self.stimulus_indices)
+
+    def test_same_as_python_reader(self):
+        eeg, stimulus_indices = read_capture_csv(self.filename)
+        expected_eeg, expected_indices = read_capture_python(self.filename)
+        self.assertEqual(eeg.dtype, np.float32)
+        self.assertTrue(eeg.flags.c_contiguous)
+        np.testing.assert_allclose(eeg, expected_eeg, rtol=1e-6)
+        np.testing.assert_array_equal(stimulus_indices, expected_indices)
+        np.testing.assert_array_equal(stimulus_indices, self.stimulus_indices)
+
+    def test_skiprows(self):
+        eeg, stimulus_indices = read_capture_csv(self.filename, skiprows=1, dtype=np.float64)
+        self.assertEqual(eeg.dtype, np.float64)
+        # the two leading samples are kept and shift the marker indices
+        self.assertEqual(eeg.shape, (8, 502))
+        np.testing.assert_array_equal(eeg[:, :2], 0)
+        np.testing.assert_allclose(eeg[:, 2:], self.eeg, atol=1e-6)
+        np.testing.assert_array_equal(stimulus_indices, self.stimulus_indices + 2)
+
+    def test_sidecar(self):
+        with mock.patch.object(capture_io, "read_capture_csv", wraps=read_capture_csv) as reader:
+            eeg, stimulus_indices = load_capture(self.filename)
+            self.assertTrue(os.path.exists(sidecar_path(self.filename)))
+            cached_eeg, cached_indices = load_capture(self.filename)
+            self.assertEqual(reader.call_count, 1)
+        np.testing.assert_array_equal(cached_eeg, eeg)
+        np.testing.assert_array_equal(cached_indices, stimulus_indices)
+        # the sidecar can also be loaded on its own
+        np.testing.assert_array_equal(load_capture(sidecar_path(self.filename))[0], eeg)
+
+    def test_sidecar_invalidation(self):
+        load_capture(self.filename)
+        with mock.patch.object(capture_io, "read_capture_csv", wraps=read_capture_csv) as reader:
+            # more samples: the size changes
+            with open(self.filename, "a", encoding="GB2312") as f:
+                f.write("0,1,2,3,4,5,6,7,8,0.0,Stimulus_5\n")
+            eeg, stimulus_indices = load_capture(self.filename)
+            self.assertEqual(reader.call_count, 1)
+            self.assertEqual(eeg.shape[1], 501)
+            self.assertEqual(stimulus_indices[-1], 500)
+            # same size, newer modification time
+            stat = os.stat(self.filename)
+            os.utime(self.filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+            load_capture(self.filename)
+            self.assertEqual(reader.call_count, 2)
+            load_capture(self.filename)
+            self.assertEqual(reader.call_count, 2)
+            # a broken sidecar is parsed again and rewritten
+            with open(sidecar_path(self.filename), "wb") as f:
+                f.write(b"broken")
+            load_capture(self.filename)
+            self.assertEqual(reader.call_count, 3)
+            load_capture(self.filename)
+            self.assertEqual(reader.call_count, 3)
+            # no cache: always parsed, sidecar untouched
+            load_capture(self.filename, cache=False)
+            self.assertEqual(reader.call_count, 4)
+
+    def test_save_capture(self):
+        filename = os.path.join(self.tmpdir.name, "saved.npz")
+        save_capture(filename, self.eeg, self.stimulus_indices)
+        eeg, stimulus_indices = load_capture(filename)
+        np.testing.assert_array_equal(eeg, self.eeg)
+        self.assertEqual(stimulus_indices.dtype, np.int64)
+        np.testing.assert_array_equal(stimulus_indices, self.stimulus_indices)
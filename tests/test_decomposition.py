@@ -0,0 +1,210 @@
+import pickle
+
+import numpy as np
+from scipy.linalg import eigh, qr
+from scipy.stats import pearsonr
+
+from .base_tmpl import BaseTmpl
+from .test_filterbank import make_ssvep
+from metabci.brainda.algorithms.decomposition import (
+    DSP, ECCA, ItCCA, MsCCA, MsetCCA, MsetCCAR, SCCA, TDCA, TRCA, TRCAR, TtCCA)
+from metabci.brainda.algorithms.decomposition.cca import _scca_kernel
+from metabci.brainda.algorithms.decomposition.dsp import xiang_dsp_feature
+from metabci.brainda.algorithms.decomposition.tdca import proj_ref, tdca_feature
+
+
+def corr(a, b):
+    return pearsonr(np.reshape(a, -1), np.reshape(b, -1))[0]
+
+
+def center(X):
+    return X - np.mean(X, axis=-1, keepdims=True)
+
+
+def cca_corr(X, Y, n_components):
+    U, V = _scca_kernel(X, Y)
+    return corr(U[:, :n_components].T @ X, V[:, :n_components].T @ Y)
+
+
+def filter_corr(X, Xk, U, n_components):
+    return corr(U[:, :n_components].T @ X, U[:, :n_components].T @ Xk)
+
+
+def stacked_trca(X, Yf=None):
+    # TRCA as a GED over the stacked trials, before the class statistics
+    M, C, N = X.shape
+    P = np.vstack([np.identity(N) for _ in range(M)])
+    if Yf is not None:
+        Q, _ = qr(Yf.T, mode="economic")
+        P = P @ Q
+    Z = np.hstack(X).T
+    A = P.T @ Z
+    D, U = eigh(A.T @ A, Z.T @ Z)
+    return U[:, np.argsort(D)[::-1]]
+
+
+class TestCCAFeatures(BaseTmpl):
+
+    def setUp(self):
+        super().setUp()
+        self.X, self.y, self.Yf = make_ssvep()
+        self.Xc = center(self.X)
+
+    def assertFeatures(self, estimator, reference, **kwargs):
+        features = estimator.fit(self.X, self.y, **kwargs).transform(self.X)
+        expected = np.array([[reference(estimator, X, k) for k in range(features.shape[1])] for X in self.Xc])
+        np.testing.assert_allclose(features, expected, rtol=1e-6, atol=1e-9)
+
+    def test_scca(self):
+        for n_components in (1, 2):
+            self.assertFeatures(
+                SCCA(n_components=n_components),
+                lambda est, X, k: cca_corr(X, est.Yf_[k], n_components),
+                Yf=self.Yf)
+
+    def test_itcca(self):
+        for n_components in (1, 2):
+            self.assertFeatures(
+                ItCCA(n_components=n_components, method="itcca1"),
+                lambda est, X, k: cca_corr(X, est.templates_[k], n_components))
+            self.assertFeatures(
+                ItCCA(n_components=n_components, method="itcca2"),
+                lambda est, X, k: filter_corr(X, est.templates_[k], est.Us_[k], n_components),
+                Yf=self.Yf)
+
+    def test_mscca(self):
+        for n_components in (1, 2):
+            self.assertFeatures(
+                MsCCA(n_components=n_components),
+                lambda est, X, k: filter_corr(X, est.templates_[k], est.U_, n_components),
+                Yf=self.Yf)
+
+    def test_ecca(self):
+        def reference(est, X, k):
+            Xk, Y = est.templates_[k], est.Yf_[k]
+            U1, V1 = _scca_kernel(X, Y)
+            U2, _ = _scca_kernel(X, Xk)
+            rho = np.array([
+                corr(U1[:, :n_components].T @ X, V1[:, :n_components].T @ Y),
+                filter_corr(X, Xk, U1, n_components),
+                filter_corr(X, Xk, U2, n_components),
+                filter_corr(X, Xk, est.Us_[k], n_components),
+            ])
+            return np.sum(np.sign(rho) * rho**2)
+
+        for n_components in (1, 2):
+            self.assertFeatures(ECCA(n_components=n_components), reference, Yf=self.Yf)
+
+    def test_ttcca(self):
+        def reference(est, X, k):
+            Xk, Y = est.templates_[k], est.Yf_[k]
+            U1, V1 = _scca_kernel(X, Y)
+            rho = np.array([
+                corr(U1[:, :n_components].T @ X, V1[:, :n_components].T @ Y),
+                filter_corr(X, Xk, U1, n_components),
+                filter_corr(X, Xk, est.Us_[k], n_components),
+            ])
+            return np.sum(np.sign(rho) * rho**2)
+
+        for n_components in (1, 2):
+            self.assertFeatures(TtCCA(n_components=n_components), reference, Yf=self.Yf)
+
+    def test_msetcca(self):
+        for n_components in (1, 2):
+            self.assertFeatures(
+                MsetCCA(n_components=n_components, method="msetcca1"),
+                lambda est, X, k: cca_corr(X, est.Ts_[k], n_components))
+            self.assertFeatures(
+                MsetCCAR(n_components=n_components),
+                lambda est, X, k: cca_corr(X, est.Ts_[k], n_components),
+                Yf=self.Yf)
+
+    def test_trca(self):
+        for n_components in (1, 2):
+            for ensemble in (True, False):
+                estimator = TRCA(n_components=n_components, ensemble=ensemble).fit(self.X, self.y)
+                Us = [stacked_trca(self.Xc[self.y == label]) for label in estimator.classes_]
+                templates = [np.mean(self.Xc[self.y == label], axis=0) for label in estimator.classes_]
+                np.testing.assert_allclose(estimator.templates_, templates, atol=1e-12)
+                if ensemble:
+                    U = np.concatenate([U[:, :n_components] for U in Us], axis=-1)
+                    expected = [[filter_corr(X, Xk, U, U.shape[1]) for Xk in templates] for X in self.Xc]
+                else:
+                    expected = [[filter_corr(X, Xk, U, n_components) for Xk, U in zip(templates, Us)]
+                                for X in self.Xc]
+                np.testing.assert_allclose(estimator.transform(self.X), expected, rtol=1e-6, atol=1e-9)
+
+    def test_trcar(self):
+        Yf = center(self.Yf)
+        for n_components in (1, 2):
+            for ensemble in (True, False):
+                estimator = TRCAR(n_components=n_components, ensemble=ensemble).fit(self.X, self.y, Yf=self.Yf)
+                Us = [stacked_trca(self.Xc[self.y == label], Yf[i]) for i, label in enumerate(estimator.classes_)]
+                templates = estimator.templates_
+                if ensemble:
+                    U = np.concatenate([U[:, :n_components] for U in Us], axis=-1)
+                    expected = [[filter_corr(X, Xk, U, U.shape[1]) for Xk in templates] for X in self.Xc]
+                else:
+                    expected = [[filter_corr(X, Xk, U, n_components) for Xk, U in zip(templates, Us)]
+                                for X in self.Xc]
+                np.testing.assert_allclose(estimator.transform(self.X), expected, rtol=1e-6, atol=1e-9)
+
+
+class TestDSPFeatures(BaseTmpl):
+
+    def setUp(self):
+        super().setUp()
+        self.X, self.y, self.Yf = make_ssvep()
+
+    def test_dsp(self):
+        for n_components in (1, 2):
+            estimator = DSP(n_components=n_components).fit(self.X.copy(), self.y)
+            features = xiang_dsp_feature(estimator.W_, estimator.M_, center(self.X), n_components=n_components)
+            templates = center(estimator.templates_[:, :n_components])
+            expected = [[corr(center(a), b) for b in templates] for a in features]
+            np.testing.assert_allclose(estimator.transform(self.X.copy()), expected, rtol=1e-6, atol=1e-9)
+
+    def test_tdca(self):
+        padding_len, n_samples = 2, 200
+        X = self.X[..., :n_samples + padding_len]
+        Yf = self.Yf[..., :n_samples]
+        for n_components in (1, 2):
+            estimator = TDCA(padding_len, n_components=n_components).fit(X.copy(), self.y, Yf)
+            expected = []
+            for trial in center(X):
+                # test trials are lagged with zeros past n_samples
+                aug = np.zeros(((padding_len + 1) * len(trial), n_samples))
+                for i in range(padding_len + 1):
+                    aug[i * len(trial):(i + 1) * len(trial), :n_samples - i] = trial[:, i:n_samples]
+                rhos = []
+                for Xk, Y in zip(estimator.templates_, Yf):
+                    P = proj_ref(Y)
+                    a = xiang_dsp_feature(
+                        estimator.W_, estimator.M_, np.concatenate([aug, aug @ P], axis=-1),
+                        n_components=n_components)
+                    rhos.append(corr(a, Xk[:n_components]))
+                expected.append(rhos)
+            np.testing.assert_allclose(estimator.transform(X.copy()), expected, rtol=1e-6, atol=1e-9)
+
+    def test_tdca_compat(self):
+        padding_len, n_samples = 2, 200
+        X = self.X[..., :n_samples + padding_len]
+        Yf = self.Yf[..., :n_samples]
+        estimator = TDCA(padding_len, n_components=2).fit(X.copy(), self.y, Yf)
+        for P, Y in zip(estimator.Ps_, Yf):
+            np.testing.assert_allclose(P, proj_ref(Y), atol=1e-12)
+        features = estimator.transform(X.copy())
+        # one trial at a time, as in earlier versions
+        rhos = tdca_feature(
+            center(X[0]), estimator.templates_, estimator.W_, estimator.M_, estimator.Ps_, padding_len,
+            n_components=2)
+        self.assertEqual(rhos.shape, (len(Yf),))
+        np.testing.assert_allclose(rhos, features[0])
+        # a model pickled with the projectors instead of the bases
+        state = estimator.__getstate__()
+        state["Ps_"] = [proj_ref(Y) for Y in Yf]
+        del state["Qs_"]
+        old = TDCA.__new__(TDCA)
+        old.__setstate__(state)
+        restored = pickle.loads(pickle.dumps(old))
+        np.testing.assert_allclose(restored.transform(X.copy()), features)
@@ -0,0 +1,142 @@
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import numpy as np
+from scipy.signal import sosfiltfilt
+from sklearn.base import clone
+from sklearn.model_selection import StratifiedKFold
+
+from .base_tmpl import BaseTmpl
+from metabci.brainda.algorithms.decomposition import (
+    FBDSP, FBECCA, FBItCCA, FBMsCCA, FBMsetCCA, FBMsetCCAR, FBSCCA, FBSSCOR, FBTDCA, FBTRCA, FBTRCAR, FBTtCCA)
+from metabci.brainda.algorithms.decomposition.base import (
+    FilterBankCache, generate_cca_references, generate_filterbank)
+
+
+def make_ssvep(n_classes=3, n_trials=4, n_channels=4, n_samples=250, srate=250, seed=0):
+    rng = np.random.default_rng(seed)
+    Yf = generate_cca_references(8 + 2 * np.arange(n_classes), srate, n_samples / srate, n_harmonics=2)
+    y = np.repeat(np.arange(n_classes), n_trials)
+    X = rng.standard_normal((len(y), n_channels, n_samples))
+    X += 0.5 * Yf[y, :1] * rng.standard_normal((len(y), n_channels, 1))
+    return X, y, Yf
+
+
+class TestFilterBankBackend(BaseTmpl):
+
+    def test_backend_param(self):
+        filterbank = generate_filterbank([[6, 90], [14, 90]], [[4, 100], [12, 100]], 250)
+        for cls in (FBSCCA, FBItCCA, FBMsCCA, FBECCA, FBTtCCA, FBMsetCCA, FBMsetCCAR,
+                    FBTRCA, FBTRCAR, FBDSP, FBSSCOR):
+            estimator = clone(cls(filterbank=filterbank).set_params(backend="loky"))
+            self.assertEqual(estimator.backend, "loky", cls.__name__)
+        estimator = clone(FBTDCA(filterbank, 2).set_params(backend="loky"))
+        self.assertEqual(estimator.backend, "loky")
+
+    def test_process_backend(self):
+        X, y, Yf = make_ssvep()
+        filterbank = generate_filterbank([[6, 90], [14, 90]], [[4, 100], [12, 100]], 250)
+        weights = np.array([1.0, 0.5])
+        features = [
+            FBTRCA(filterbank, filterweights=weights, n_jobs=2, backend=backend).fit(X, y).transform(X)
+            for backend in (None, "loky")
+        ]
+        np.testing.assert_allclose(features[0], features[1])
+
+
+class TestFilterBankCache(BaseTmpl):
+
+    def setUp(self):
+        super().setUp()
+        self.filterbank = generate_filterbank([[6, 90], [14, 90], [22, 90]], [[4, 100], [12, 100], [20, 100]], 250)
+        self.X, self.y, self.Yf = make_ssvep()
+
+    def cross_validate(self, n_jobs=None):
+        features = []
+        for train_ind, test_ind in StratifiedKFold(3).split(self.X, self.y):
+            estimator = FBTRCA(self.filterbank, n_jobs=n_jobs).fit(self.X[train_ind], self.y[train_ind])
+            features.append(estimator.transform(self.X[test_ind]))
+        return features
+
+    def test_same_as_sosfiltfilt(self):
+        sos = self.filterbank[1]
+        expected = sosfiltfilt(sos, self.X, axis=-1)
+        with FilterBankCache() as cache:
+            np.testing.assert_array_equal(cache.filter(sos, self.X), expected)
+            # hits, in any order and in any array
+            ind = np.array([5, 0, 11, 5])
+            np.testing.assert_array_equal(cache.filter(sos, self.X[ind]), expected[ind])
+            np.testing.assert_array_equal(cache.filter(sos, self.X.astype(np.float32)),
+                                          sosfiltfilt(sos, self.X.astype(np.float32), axis=-1))
+            self.assertEqual(cache.hits, len(ind))
+            self.assertEqual(cache.misses, 2 * len(self.X))
+
+    def test_hits_across_folds(self):
+        expected = self.cross_validate()
+        with mock.patch.object(FilterBankCache, "fingerprint_trials", autospec=True,
+                               side_effect=FilterBankCache.fingerprint_trials) as fingerprint_trials:
+            with FilterBankCache() as cache:
+                features = self.cross_validate()
+                # every trial is filtered once per sub-band, on its first use
+                self.assertEqual(cache.misses, len(self.X) * len(self.filterbank))
+                self.assertEqual(cache.hits, 2 * len(self.X) * len(self.filterbank))
+        # once per fit and transform, not per sub-band
+        self.assertEqual(fingerprint_trials.call_count, 6)
+        for a, b in zip(expected, features):
+            np.testing.assert_array_equal(a, b)
+
+    def test_eviction(self):
+        sos = self.filterbank[0]
+        X1, X2 = self.X[:6], self.X[6:]
+        with FilterBankCache(max_bytes=X1.nbytes) as cache:
+            cache.filter(sos, X1)
+            cache.filter(sos, X2)
+            self.assertLessEqual(cache.nbytes, X1.nbytes)
+            # X1 was dropped
+            np.testing.assert_array_equal(cache.filter(sos, X1), sosfiltfilt(sos, X1, axis=-1))
+            self.assertEqual(cache.hits, 0)
+
+        with tempfile.TemporaryDirectory() as folder:
+            with FilterBankCache(max_bytes=X1.nbytes, cache_dir=folder) as cache:
+                cache.filter(sos, X1)
+                cache.filter(sos, X2)
+                self.assertEqual(len(os.listdir(folder)), 1)
+                # X1 is read back from its memmap
+                np.testing.assert_array_equal(cache.filter(sos, X1), sosfiltfilt(sos, X1, axis=-1))
+                self.assertEqual(cache.hits, len(X1))
+            self.assertEqual(os.listdir(folder), [])
+
+    def test_concurrent(self):
+        expected = self.cross_validate()
+        with FilterBankCache(max_bytes=self.X.nbytes * 2) as cache:
+            for _ in range(2):
+                for a, b in zip(expected, self.cross_validate(n_jobs=3)):
+                    np.testing.assert_array_equal(a, b)
+            sos = self.filterbank[2]
+            subsets = [np.random.default_rng(seed).choice(len(self.X), 6) for seed in range(16)]
+            with ThreadPoolExecutor(4) as executor:
+                results = list(executor.map(lambda ind: cache.filter(sos, self.X[ind]), subsets))
+            filtered = sosfiltfilt(sos, self.X, axis=-1)
+            for ind, result in zip(subsets, results):
+                np.testing.assert_array_equal(result, filtered[ind])
+
+    def test_process_workers(self):
+        estimator = FBTRCA(self.filterbank, n_jobs=2, backend="loky")
+        with FilterBankCache() as cache:
+            with self.assertWarnsRegex(UserWarning, "not shared with the loky workers"):
+                estimator.fit(self.X, self.y)
+            # the trials were filtered in the workers
+            self.assertEqual(cache.misses, 0)
+
+    def test_default_backend(self):
+        def backend(estimator):
+            return type(estimator._parallel()._backend).__name__
+
+        estimators = [FBTRCA(self.filterbank, n_jobs=2), FBMsetCCA(self.filterbank, n_jobs=2),
+                      FBSSCOR(filterbank=self.filterbank, n_jobs=2)]
+        self.assertEqual([backend(est) for est in estimators], ["ThreadingBackend", "LokyBackend", "LokyBackend"])
+        # the cache is only reached from threads
+        with FilterBankCache():
+            self.assertEqual({backend(est) for est in estimators}, {"ThreadingBackend"})
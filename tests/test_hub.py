@@ -0,0 +1,62 @@
+import time
+
+import numpy as np
+
+from .base_tmpl import BaseTmpl
+from .test_replay import make_raw
+from metabci.brainflow.amplifiers import NeuroScan
+from metabci.brainflow.hub import AcquisitionHub
+from metabci.brainflow.replay import ReplayAmplifier
+
+
+class TestAcquisitionHub(BaseTmpl):
+
+    def setUp(self):
+        super().setUp()
+        self.replay = ReplayAmplifier.from_raw(make_raw(), speed=0)
+        self.amplifier = NeuroScan(device_address=self.replay.serve(), srate=1000, num_chans=3)
+        self.amplifier.command("connect")
+        self.hub = AcquisitionHub()
+        self.hub.add_device("ns", self.amplifier)
+
+    def tearDown(self):
+        self.amplifier.neuro_link.close()
+        super().tearDown()
+
+    def wait(self, done, timeout=10):
+        deadline = time.perf_counter() + timeout
+        while not done() and time.perf_counter() < deadline:
+            time.sleep(0.01)
+
+    def test_replay_stream(self):
+        blocks, stamps = [], []
+
+        def consumer(name, samples, timestamps):
+            blocks.append(samples.copy())
+            stamps.append(timestamps)
+
+        self.hub.add_consumer("ns", consumer)
+        self.hub.start()
+        n_samples = len(self.replay.samples)
+        self.wait(lambda: sum(map(len, blocks)) >= n_samples)
+        self.hub.stop()
+        out = np.concatenate(blocks)
+        np.testing.assert_allclose(out[:, :-1], self.replay.samples[:, :-1], atol=0.0298e-6)
+        np.testing.assert_array_equal(out[:, -1], self.replay.samples[:, -1])
+        # samples of a block are dated back from its arrival on the hub clock
+        for timestamps in stamps:
+            np.testing.assert_allclose(np.diff(timestamps), 1e-3)
+
+    def test_consumer_error(self):
+        def consumer(name, samples, timestamps):
+            raise RuntimeError("consumer failed")
+
+        self.hub.add_consumer("ns", consumer)
+        with self.assertLogs("hub", level="ERROR") as logs:
+            self.hub.start()
+            self.wait(lambda: logs.records)
+        self.assertIn("ns failed", logs.output[0])
+        with self.assertRaisesRegex(RuntimeError, "consumer failed"):
+            self.hub.stop()
+        # the error is reported once
+        self.hub.stop()
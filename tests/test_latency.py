@@ -0,0 +1,29 @@
+import numpy as np
+
+from .base_tmpl import BaseTmpl
+from metabci.brainflow.latency import LatencyMonitor
+
+
+class TestLatencyMonitor(BaseTmpl):
+
+    def test_percentiles(self):
+        monitor = LatencyMonitor(["stage"])
+        values = np.random.default_rng(0).uniform(1e-3, 1e-2, 1000)
+        for v in values:
+            monitor.record("stage", v)
+        stats = monitor.stats()["stage"]
+        self.assertEqual(stats["count"], 1000)
+        self.assertAlmostEqual(stats["mean"], values.mean())
+        for q in (50, 95, 99):
+            # one bin is about 12% wide and the estimate is its upper edge
+            expected = np.percentile(values, q)
+            self.assertGreaterEqual(stats["p{}".format(q)], expected)
+            self.assertLess(stats["p{}".format(q)], expected * 1.13)
+
+    def test_shared(self):
+        monitor = LatencyMonitor(["a", "b"], shared=True)
+        with monitor.timer("b"):
+            pass
+        self.assertEqual(list(monitor.stats()), ["b"])
+        monitor.reset()
+        self.assertEqual(monitor.stats(), {})
@@ -0,0 +1,69 @@
+import os
+import sys
+import tempfile
+from unittest import mock
+
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+
+from .base_tmpl import BaseTmpl
+from metabci.brainflow.model_cache import ModelCache
+
+
+class TestModelCache(BaseTmpl):
+
+    def test_get_or_fit(self):
+        with tempfile.TemporaryDirectory() as folder:
+            run_file = os.path.join(folder, "1.cnt")
+            with open(run_file, "wb") as f:
+                f.write(b"\0" * 16)
+            cache = ModelCache(os.path.join(folder, "cache"))
+            n_fits = []
+
+            def fit():
+                n_fits.append(1)
+                return {"estimator": LogisticRegression(C=2.0), "ch_ind": np.arange(3)}
+
+            params = {"srate": 1000, "estimator": LogisticRegression(C=2.0)}
+            first = cache.get_or_fit([run_file], params, fit)
+            second = cache.get_or_fit([run_file], params, fit)
+            self.assertEqual(len(n_fits), 1)
+            self.assertEqual(second["estimator"].C, 2.0)
+            np.testing.assert_array_equal(first["ch_ind"], second["ch_ind"])
+
+            # other hyperparameters or a modified file need a new fit
+            cache.get_or_fit([run_file], {"srate": 1000, "estimator": LogisticRegression(C=1.0)}, fit)
+            self.assertEqual(len(n_fits), 2)
+            with open(run_file, "ab") as f:
+                f.write(b"\0")
+            cache.get_or_fit([run_file], params, fit)
+            self.assertEqual(len(n_fits), 3)
+
+    def test_code_changes_key(self):
+        with tempfile.TemporaryDirectory() as folder:
+            run_file = os.path.join(folder, "1.cnt")
+            with open(run_file, "wb") as f:
+                f.write(b"\0" * 16)
+            cache = ModelCache(os.path.join(folder, "cache"))
+            params = {"estimator": LogisticRegression()}
+            key = cache.key([run_file], params)
+            self.assertEqual(key, cache.key([run_file], params))
+            # e.g. fitted attributes renamed in brainda
+            with mock.patch("metabci.brainflow.model_cache.package_signature", return_value="0"):
+                self.assertNotEqual(key, cache.key([run_file], params))
+
+            # estimators defined outside metabci are identified by their module source
+            module_file = os.path.join(folder, "my_estimator.py")
+            with open(module_file, "w") as f:
+                f.write("from sklearn.linear_model import LogisticRegression\n"
+                        "class MyEstimator(LogisticRegression):\n    pass\n")
+            sys.path.insert(0, folder)
+            try:
+                from my_estimator import MyEstimator
+                key = cache.key([run_file], {"estimator": MyEstimator()})
+                with open(module_file, "a") as f:
+                    f.write("# fitted attributes changed\n")
+                self.assertNotEqual(key, cache.key([run_file], {"estimator": MyEstimator()}))
+            finally:
+                sys.path.remove(folder)
+                sys.modules.pop("my_estimator", None)
@@ -0,0 +1,34 @@
+import numpy as np
+from scipy.signal import butter, filtfilt, hilbert
+
+from .base_tmpl import BaseTmpl
+from metabci.brainda.algorithms.abci_Algorithm.pli import (
+    PLI_BANDS, phase_lag_index, pli_features)
+
+
+def loop_pli_features(seg, srate=125):
+    features = []
+    n_channels = seg.shape[0]
+    for low, high in PLI_BANDS:
+        b, a = butter(4, [low / (srate / 2), high / (srate / 2)], btype='band')
+        phase = np.angle(hilbert(filtfilt(b, a, seg)))
+        for i in range(n_channels):
+            for j in range(i + 1, n_channels):
+                diff = np.sin(phase[i] - phase[j])
+                features.append(np.abs(np.mean(np.sign(diff))))
+    return np.array(features)
+
+
+class TestPLI(BaseTmpl):
+
+    def test_pli_features(self):
+        X = np.random.default_rng(0).standard_normal((3, 8, 625))
+        expected = np.stack([loop_pli_features(x) for x in X])
+        np.testing.assert_allclose(pli_features(X, 125), expected)
+
+    def test_phase_lag_index_symmetric(self):
+        phases = np.random.default_rng(1).uniform(-np.pi, np.pi, (2, 4, 100))
+        pli = phase_lag_index(phases)
+        self.assertEqual(pli.shape, (2, 4, 4))
+        np.testing.assert_allclose(pli, np.swapaxes(pli, -1, -2))
+        np.testing.assert_allclose(np.diagonal(pli, axis1=-2, axis2=-1), 0)
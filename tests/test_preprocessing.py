@@ -0,0 +1,50 @@
+import numpy as np
+from scipy.signal import cheby1, sosfilt, sosfilt_zi, lfilter, lfilter_zi
+
+from .base_tmpl import BaseTmpl
+from metabci.brainflow.amplifiers import Marker
+from metabci.brainflow.preprocessing import StreamingPreprocessor
+
+
+def _blocks(samples, sizes):
+    pos, i = 0, 0
+    while pos < len(samples):
+        yield samples[pos:pos + sizes[i % len(sizes)]]
+        pos += sizes[i % len(sizes)]
+        i += 1
+
+
+class TestStreamingPreprocessor(BaseTmpl):
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.default_rng(0)
+        self.samples = np.zeros((4000, 4))
+        self.samples[:, :-1] = rng.standard_normal((4000, 3)) + 5
+        self.samples[[1001, 2003, 3002], -1] = [1, 2, 1]
+
+    def test_matches_offline_filtering(self):
+        filterbank = [cheby1(4, 0.5, band, btype="bandpass", output="sos", fs=250) for band in ([6, 40], [14, 40])]
+        pre = StreamingPreprocessor(n_channels=3, decimate=4, filterbank=filterbank)
+        out = np.concatenate([pre.process(b) for b in _blocks(self.samples, [40, 7, 123])])
+        self.assertEqual(out.shape, (1000, pre.n_outputs + 1))
+
+        # the same filters over the whole recording at once
+        x = self.samples[:, :-1]
+        h = pre.decimator.h
+        y = lfilter(h, 1, x, axis=0, zi=lfilter_zi(h, 1)[:, None] * x[0])[0][::4]
+        for i, sos in enumerate(filterbank):
+            expected = sosfilt(sos, y, axis=0, zi=sosfilt_zi(sos)[:, :, None] * y[0])[0]
+            np.testing.assert_allclose(out[:, 3 * i:3 * (i + 1)], expected, rtol=1e-4, atol=1e-4)
+        # triggers are kept on the next kept sample
+        np.testing.assert_array_equal(np.flatnonzero(out[:, -1]), [251, 501, 751])
+        np.testing.assert_array_equal(out[[251, 501, 751], -1], [1, 2, 1])
+
+    def test_marker_epochs(self):
+        pre = StreamingPreprocessor(n_channels=3, decimate=4, channels=[0, 2])
+        marker = Marker(interval=[0, 0.2], srate=250, events=[1], n_channels=pre.n_outputs)
+        epochs = []
+        for b in _blocks(self.samples, [40]):
+            epochs.extend(marker.process(pre.process(b)))
+        self.assertEqual(len(epochs), 2)
+        self.assertEqual(pre.split_bands(epochs[0]).shape, (1, 2, 50))
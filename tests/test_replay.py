@@ -0,0 +1,36 @@
+import numpy as np
+import mne
+
+from .base_tmpl import BaseTmpl
+from metabci.brainflow.amplifiers import Marker
+from metabci.brainflow.replay import ReplayAmplifier
+
+
+def make_raw(srate=1000, n_samples=4000):
+    info = mne.create_info(['C3', 'Cz', 'C4', 'STI'], srate, ['eeg'] * 3 + ['stim'])
+    data = np.random.default_rng(0).standard_normal((4, n_samples)) * 1e-5
+    data[3] = 0
+    data[3, 1000] = 2
+    data[3, 2500] = 7
+    return mne.io.RawArray(data, info, verbose=False)
+
+
+class TestReplayAmplifier(BaseTmpl):
+
+    def test_protocols_roundtrip(self):
+        for protocol in ('neuroscan', 'neuracle', 'ht'):
+            amp = ReplayAmplifier.from_raw(make_raw(), protocol=protocol, speed=0)
+            n_packets = len(amp.samples) // amp.packet_samples
+            out = np.concatenate([amp.recv() for _ in range(n_packets)])
+            expected = amp.samples[:len(out)]
+            np.testing.assert_allclose(out[:, :-1], expected[:, :-1], atol=0.0298e-6)
+            np.testing.assert_array_equal(out[:, -1], expected[:, -1])
+
+    def test_marker_epochs(self):
+        amp = ReplayAmplifier.from_raw(make_raw(), speed=0)
+        marker = Marker(interval=[0, 0.5], srate=1000, events=[2, 7])
+        epochs = []
+        for _ in range(len(amp.samples) // amp.packet_samples):
+            epochs.extend(marker.process(amp.recv()))
+        self.assertEqual(len(epochs), 2)
+        self.assertEqual(epochs[0].shape, (500, 4))
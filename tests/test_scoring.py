@@ -0,0 +1,73 @@
+import os
+import tempfile
+import warnings
+
+import numpy as np
+
+from .base_tmpl import BaseTmpl
+from metabci.brainda.algorithms.abci_Algorithm.capture_io import load_capture
+from metabci.brainda.algorithms.abci_Algorithm.scoring import (
+    MODEL_PATH, N_TOPICS, PLIScorer, RANKING_FILE, SCALER_PATH, SRATE, si_features)
+
+
+def make_recording(seed=0):
+    """30 s of rest followed by 40 stimuli 6 s apart, 8 channels at 250 Hz."""
+    rng = np.random.default_rng(seed)
+    n_samples = (30 + 6 * N_TOPICS + 4) * SRATE
+    t = np.arange(n_samples) / SRATE
+    eeg = 10 * rng.standard_normal((8, n_samples)) + 20 * np.sin(2 * np.pi * 10 * t + rng.uniform(0, 6, (8, 1)))
+    stimulus_indices = 30 * SRATE + 6 * SRATE * np.arange(N_TOPICS)
+    return eeg.astype(np.float32), stimulus_indices
+
+
+def write_capture_csv(filename, eeg, stimulus_indices):
+    markers = np.full(eeg.shape[1], "", dtype=object)
+    markers[stimulus_indices] = ["Stimulus_{}".format(i + 1) for i in range(len(stimulus_indices))]
+    with open(filename, "w", encoding="GB2312") as f:
+        f.write("样本索引,EEG通道0,EEG通道1,EEG通道2,EEG通道3,EEG通道4,EEG通道5,EEG通道6,EEG通道7,时间戳,事件标记\n")
+        # the reader drops the header and the first two samples
+        f.write("0,0,0,0,0,0,0,0,0,0,\n1,0,0,0,0,0,0,0,0,0,\n")
+        for i in range(eeg.shape[1]):
+            f.write("{},{},{:.3f},{}\n".format(
+                i % 256, ",".join("{:.6f}".format(v) for v in eeg[:, i]), i / SRATE, markers[i]))
+
+
+class TestPLIScorer(BaseTmpl):
+
+    def setUp(self):
+        super().setUp()
+        # the bundled model was pickled with an older scikit-learn
+        warnings.simplefilter("ignore", UserWarning)
+        self.addCleanup(warnings.resetwarnings)
+
+    def test_bundled_files(self):
+        for filename in (MODEL_PATH, SCALER_PATH, RANKING_FILE):
+            self.assertTrue(os.path.isfile(filename), filename)
+
+    def test_si_features(self):
+        eeg, stimulus_indices = make_recording()
+        feat = si_features(eeg, stimulus_indices)
+        n_pli = 5 * 8 * 7 // 2
+        self.assertEqual(feat.shape, ((2 * N_TOPICS - 1) * n_pli,))
+        self.assertTrue(np.all(np.isfinite(feat)))
+        title = feat[:N_TOPICS * n_pli].reshape(N_TOPICS, n_pli)
+        np.testing.assert_allclose(feat[N_TOPICS * n_pli:], np.diff(title, axis=0).ravel())
+        with self.assertRaises(ValueError):
+            si_features(eeg, stimulus_indices[:-1])
+
+    def test_score_file(self):
+        eeg, stimulus_indices = make_recording()
+        scorer = PLIScorer()
+        with tempfile.TemporaryDirectory() as folder:
+            filename = os.path.join(folder, "subject.csv")
+            write_capture_csv(filename, eeg, stimulus_indices)
+            parsed_eeg, parsed_indices = load_capture(filename, cache=False)
+            np.testing.assert_array_equal(parsed_indices, stimulus_indices)
+            expected = scorer.predict(si_features(parsed_eeg, parsed_indices))[0]
+
+            result = scorer.score_file(filename)
+            self.assertTrue(np.isfinite(result["score"]))
+            self.assertAlmostEqual(result["score"], expected, places=5)
+            # second run from the binary sidecar
+            self.assertTrue(os.path.exists(filename + ".npz"))
+            self.assertEqual(scorer.score_file(filename)["score"], result["score"])
@@ -0,0 +1,44 @@
+import numpy as np
+
+from .base_tmpl import BaseTmpl
+from metabci.brainflow.sliding import SlidingCCA, SlidingCovariance
+
+
+def _cca(X, Y):
+    qx, _ = np.linalg.qr(X - X.mean(axis=0))
+    qy, _ = np.linalg.qr(Y - Y.mean(axis=0))
+    return np.linalg.svd(qx.T @ qy, compute_uv=False)[0]
+
+
+class TestSlidingDecoders(BaseTmpl):
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.default_rng(0)
+        self.srate, self.window, self.hop = 250, 250, 25
+        t = np.arange(2000) / self.srate
+        self.X = rng.standard_normal((2000, 4))
+        self.X[1000:] += np.sin(2 * np.pi * 12 * t[1000:])[:, np.newaxis]
+
+    def test_cca_matches_window_cca(self):
+        freqs = [10, 12, 15]
+        decoder = SlidingCCA(freqs, self.srate, self.window, self.hop, n_harmonics=2)
+        labels = []
+        for start in range(0, len(self.X), 37):
+            labels.extend(decoder.update(self.X[start:start + 37]))
+        # one decision per hop once the window is full
+        self.assertEqual(len(labels), (len(self.X) - self.window) // self.hop + 1)
+        self.assertEqual(labels[-1], 1)
+
+        t = np.arange(self.window) / self.srate
+        end = len(self.X)
+        for i, f in enumerate(freqs):
+            Y = np.stack([fn(2 * np.pi * h * f * t) for h in (1, 2) for fn in (np.sin, np.cos)], axis=1)
+            self.assertAlmostEqual(decoder.scores[i], _cca(self.X[end - self.window:end], Y), places=8)
+
+    def test_covariance(self):
+        filters = np.random.default_rng(1).standard_normal((4, 2))
+        decoder = SlidingCovariance(self.window, self.hop, filters=filters)
+        covs = decoder.update(self.X)
+        expected = np.cov((self.X[-self.window:] @ filters).T, bias=True)
+        np.testing.assert_allclose(covs[-1], expected, atol=1e-10)
@@ -0,0 +1,160 @@
+import multiprocessing
+import queue
+import threading
+import time
+import unittest
+from multiprocessing import resource_tracker, shared_memory
+from unittest import mock
+
+import numpy as np
+
+from .base_tmpl import BaseTmpl
+from metabci.brainflow.workers import (
+    ModelWorker,
+    ProcessWorker,
+    WorkerPool,
+    _attach_shared_memory,
+    combine_first,
+    combine_mean,
+    combine_vote,
+)
+
+
+class SumWorker(ProcessWorker):
+    def __init__(self, results):
+        super().__init__(timeout=0.01, name="sum_worker")
+        self.daemon = True
+        self.results = results
+
+    def pre(self):
+        pass
+
+    def consume(self, data):
+        self.results.put(float(np.sum(data)))
+
+    def post(self):
+        pass
+
+
+class TestSharedMemoryTransport(BaseTmpl):
+
+    @unittest.skipUnless(multiprocessing.get_start_method() == "fork", "needs fork-started workers")
+    def test_fork_worker_keeps_block(self):
+        n_unregister = multiprocessing.Value("i", 0)
+        unregister = resource_tracker.unregister
+
+        def counting_unregister(name, rtype):
+            with n_unregister.get_lock():
+                n_unregister.value += 1
+            unregister(name, rtype)
+
+        # the forked worker inherits the patched tracker client
+        with mock.patch.object(resource_tracker, "unregister", counting_unregister):
+            results = multiprocessing.Queue()
+            worker = SumWorker(results)
+            worker.start()
+            try:
+                data = np.arange(40, dtype=np.float64).reshape(10, 4)
+                # epochs put before pre() returns are cleared, retry until one is consumed
+                for _ in range(100):
+                    worker.put(data)
+                    try:
+                        result = results.get(timeout=0.1)
+                        break
+                    except queue.Empty:
+                        pass
+                self.assertEqual(result, data.sum())
+                name = worker._rings[0].shm.name
+                worker._exit.set()
+                worker.join(timeout=10)
+                self.assertEqual(worker.exitcode, 0)
+            finally:
+                if worker.is_alive():
+                    worker.kill()
+            self.assertEqual(n_unregister.value, 0)
+
+            # the block outlives the worker and is released by the main process
+            shm = _attach_shared_memory(name)
+            shm.close()
+            worker.stop()
+            self.assertEqual(n_unregister.value, 1)
+            with self.assertRaises(FileNotFoundError):
+                shared_memory.SharedMemory(name=name)
+
+
+class EchoModel(ModelWorker):
+    def predict(self, data):
+        return data
+
+
+class TestWorkerPool(BaseTmpl):
+    """The gathering thread runs in the test process, model answers are
+    put on the results queue as the ModelWorker processes would."""
+
+    def make_pool(self, **kwargs):
+        pool = WorkerPool([EchoModel(name="a"), EchoModel(name="b"), EchoModel(name="c")], **kwargs)
+        pool._t_gather = threading.Thread(target=pool._gather, daemon=True)
+        pool._t_gather.start()
+        self.addCleanup(pool.stop)
+        return pool
+
+    def test_combiners(self):
+        self.assertEqual(combine_first({"b": 2, "a": 1}, {}), 2)
+        self.assertEqual(combine_vote({"a": 1, "b": 2, "c": 2}, {}), 2)
+        self.assertEqual(combine_vote({"a": 1, "b": 2, "c": 2}, {"a": 3.0}), 1)
+        # ties go to the earliest answer
+        self.assertEqual(combine_vote({"b": 2, "a": 1}, {}), 2)
+        self.assertEqual(combine_vote({"a": np.array([3]), "b": [3]}, {}), 3)
+        np.testing.assert_allclose(
+            combine_mean({"a": [1.0, 0.0], "b": [0.0, 1.0]}, {"a": 3.0}), [0.75, 0.25])
+
+    def test_all_answers(self):
+        pool = self.make_pool(combine="vote", deadline=5)
+        pool.put(np.zeros((10, 2)))
+        for name, label in (("a", 1), ("b", 2), ("c", 2)):
+            pool._results.put((name, 0, label))
+        tag, decision, results = pool.decisions.get(timeout=2)
+        self.assertEqual((tag, decision), (0, 2))
+        self.assertEqual(results, {"a": 1, "b": 2, "c": 2})
+
+    def test_deadline(self):
+        pool = self.make_pool(combine="mean", deadline=0.2)
+        t = time.perf_counter()
+        pool.put(np.zeros((10, 2)))
+        pool.put(np.zeros((10, 2)))
+        pool._results.put(("b", 0, [0.0, 1.0]))
+        tag, decision, results = pool.decisions.get(timeout=2)
+        self.assertGreaterEqual(time.perf_counter() - t, 0.2)
+        self.assertEqual(tag, 0)
+        np.testing.assert_allclose(decision, [0.0, 1.0])
+        self.assertEqual(list(results), ["b"])
+        # nobody answered in time
+        self.assertEqual(pool.decisions.get(timeout=2)[:2], (1, None))
+
+    def test_first(self):
+        pool = self.make_pool(combine="first", deadline=5)
+        pool.put(np.zeros((10, 2)))
+        pool._results.put(("c", 0, 7))
+        self.assertEqual(pool.decisions.get(timeout=2), (0, 7, {"c": 7}))
+        # late answers of a decided epoch are dropped
+        pool._results.put(("a", 0, 1))
+        with self.assertRaises(queue.Empty):
+            pool.decisions.get(timeout=0.2)
+
+    def test_slow_feedback(self):
+        entered, release = threading.Event(), threading.Event()
+
+        def feedback(decision, results):
+            entered.set()
+            release.wait(5)
+
+        pool = self.make_pool(combine="first", deadline=5, feedback=feedback)
+        self.addCleanup(release.set)
+        pool.put(np.zeros((10, 2)))
+        pool._results.put(("a", 0, 1))
+        self.assertTrue(entered.wait(2))
+        # the amplifier thread is not blocked by the feedback
+        t = time.perf_counter()
+        pool.put(np.zeros((10, 2)))
+        self.assertLess(time.perf_counter() - t, 0.5)
+        release.set()